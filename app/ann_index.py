@@ -0,0 +1,256 @@
+import time
+import numpy as np
+import joblib
+from scipy import sparse
+from similarity_index import SimilarityIndex, _l2_normalise, _nbytes
+
+#-----------------------------------------
+# Approximate Nearest-Neighbour Index
+#-----------------------------------------
+class LSHIndex:
+    """
+    Random-projection LSH over the L2-normalised feature vectors, for catalogues too large to score exhaustively.
+
+    Each of n_tables hash tables signs the vectors against n_bits random hyperplanes, so products with a
+    small angle between them (high cosine similarity) tend to share a bucket. A query collects the products
+    in its bucket of every table (and, with probe_radius=1, the buckets one bit away), then scores only those
+    candidates exactly. Products that are not candidates get a similarity of 0, like a top_k SimilarityIndex.
+
+    Queries can be restricted to allowed rows (the app's pre-filter). When fewer than min_candidates of the
+    LSH candidates are allowed, or the allowed set is no larger than the candidate set, the allowed rows are
+    scored exactly instead, so selective filters never lose their matches.
+
+    The backend saves compute, not memory: candidates are rescored exactly, so the full float32 vectors are
+    kept (memory-mapped by the app) and the hash tables come on top, n_tables x (8 + 4) bytes per product.
+    It is larger than an exact SimilarityIndex over the same vectors, use top_k when memory is the limit.
+    """
+
+    # similarity_row/similarity_rows/similarity_mean pass the allowed rows to approximate backends
+    approximate = True
+    mode = 'lsh'
+
+    def __init__(self, vectors, planes, sorted_codes, code_rows, product_ids=None, probe_radius=1, min_candidates=500):
+        self.vectors = vectors
+        self.planes = planes
+        self.sorted_codes = sorted_codes
+        self.code_rows = code_rows
+        self.product_ids = product_ids
+        self.probe_radius = probe_radius
+        self.min_candidates = min_candidates
+
+    @property
+    def n_products(self):
+        return self.vectors.shape[0]
+
+    @property
+    def n_tables(self):
+        return self.sorted_codes.shape[0]
+
+    @property
+    def n_bits(self):
+        return self.planes.shape[1] // self.n_tables
+
+    @property
+    def nbytes(self):
+        return _nbytes(self.vectors) + self.planes.nbytes + self.sorted_codes.nbytes + self.code_rows.nbytes
+
+    @classmethod
+    def from_features(cls, features, n_tables=8, n_bits=12, block_size=65536, random_state=0, **kwargs):
+        """
+        Hashes a feature matrix (e.g. the TF-IDF + scaled features of scripts/similarity_builder.py).
+
+        Parameters:
+        - features: Dense array, sparse matrix or DataFrame with one row per product
+        - n_tables: Number of hash tables, more tables raise recall and memory
+        - n_bits: Hyperplanes per table (at most 63), more bits give smaller buckets and fewer candidates
+        - block_size: Rows hashed at once, bounds peak memory to block_size x n_tables x n_bits floats
+        - random_state: Seed for the hyperplanes
+        - kwargs: probe_radius (0 or 1) / min_candidates, see the class docstring
+
+        Returns:
+        - LSHIndex
+        """
+        if not 0 < n_bits < 64:
+            raise ValueError(f'n_bits must be between 1 and 63, got {n_bits}')
+        vectors = _l2_normalise(features)
+        n_products, n_features = vectors.shape
+        rng = np.random.default_rng(random_state)
+        planes = rng.standard_normal((n_features, n_tables * n_bits)).astype(np.float32)
+
+        codes = np.empty((n_tables, n_products), dtype=np.uint64)
+        for start in range(0, n_products, block_size):
+            codes[:, start:start + block_size] = _hash(vectors[start:start + block_size], planes, n_tables, n_bits).T
+
+        # Buckets are runs of equal codes, found with binary search at query time
+        code_rows = np.argsort(codes, axis=1, kind='stable')
+        sorted_codes = np.take_along_axis(codes, code_rows, axis=1)
+        # Row ids fit in int32 below 2^31 products, which halves the table next to the uint64 codes
+        row_dtype = np.int32 if n_products < 2 ** 31 else np.int64
+        return cls(vectors, planes, sorted_codes, code_rows.astype(row_dtype), **kwargs)
+
+    def candidates(self, query):
+        """
+        Returns the rows sharing a bucket with a query vector (or one bit away when probe_radius is 1), sorted and unique.
+        """
+        codes = _hash(query.reshape(1, -1), self.planes, self.n_tables, self.n_bits)[0]
+        flips = np.zeros(1, dtype=np.uint64)
+        if self.probe_radius:
+            flips = np.append(flips, np.uint64(1) << np.arange(self.n_bits, dtype=np.uint64))
+
+        # Bucket ranges of every probe, then one gather over the flattened (table, position) row ids
+        starts, ends = [], []
+        for table, code in enumerate(codes):
+            probes = code ^ flips
+            offset = table * self.sorted_codes.shape[1]
+            starts.append(np.searchsorted(self.sorted_codes[table], probes, side='left') + offset)
+            ends.append(np.searchsorted(self.sorted_codes[table], probes, side='right') + offset)
+        starts, ends = np.concatenate(starts), np.concatenate(ends)
+        lengths = ends - starts
+        if lengths.sum() == 0:
+            return np.empty(0, dtype=np.int64)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self.code_rows.reshape(-1)[positions])
+
+    def query_row(self, query, allowed=None):
+        """
+        Returns the similarity of a query vector to every product as a dense 1-D float32 array.
+
+        Parameters:
+        - query: Feature vector in the index's space (e.g. a product's or the mean of several products' vectors)
+        - allowed: Optional array of rows the caller will use, other rows are left at 0
+
+        Returns:
+        - Array of length n_products, exact for the scored rows and 0 elsewhere
+        """
+        # Hashing only looks at signs, so an unnormalised (mean) query finds the same buckets
+        query = np.ravel(query.toarray() if sparse.issparse(query) else np.asarray(query)).astype(np.float32)
+        rows = self.candidates(query)
+
+        if allowed is not None:
+            allowed = np.asarray(allowed)
+            if len(allowed) <= max(len(rows), self.min_candidates):
+                rows = allowed
+            else:
+                rows = rows[np.isin(rows, allowed)]
+                if len(rows) < self.min_candidates:
+                    rows = allowed
+
+        row = np.zeros(self.n_products, dtype=np.float32)
+        if len(rows):
+            row[rows] = np.ravel(self.vectors[rows] @ query)
+        return row
+
+    def row(self, product_index, allowed=None):
+        return self.query_row(self._vector(product_index), allowed)
+
+    def rows(self, product_indices, allowed=None):
+        return np.vstack([self.row(i, allowed) for i in np.asarray(product_indices)]).astype(np.float32)
+
+    def mean_row(self, product_indices, allowed=None):
+        centroid = self.vectors[np.asarray(product_indices)].mean(axis=0)
+        return self.query_row(np.asarray(centroid), allowed)
+
+    def _vector(self, product_index):
+        vector = self.vectors[product_index]
+        return vector.toarray() if sparse.issparse(vector) else np.asarray(vector)
+
+    def save(self, path):
+        joblib.dump({
+            'vectors': self.vectors, 'planes': self.planes, 'sorted_codes': self.sorted_codes,
+            'code_rows': self.code_rows, 'product_ids': self.product_ids,
+            'probe_radius': self.probe_radius, 'min_candidates': self.min_candidates
+        }, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        stored = joblib.load(path, mmap_mode=mmap_mode)
+        return cls(stored['vectors'], stored['planes'], stored['sorted_codes'], stored['code_rows'],
+                   stored.get('product_ids'), stored['probe_radius'], stored['min_candidates'])
+
+
+#-----------------------------------------
+# Helper Functions
+#-----------------------------------------
+def _hash(vectors, planes, n_tables, n_bits):
+    # (rows, n_tables) codes, bit j of a table's code is the sign of the projection on its j-th plane
+    projections = vectors @ planes
+    projections = projections.toarray() if sparse.issparse(projections) else np.asarray(projections)
+    bits = (projections > 0).reshape(projections.shape[0], n_tables, n_bits).astype(np.uint64)
+    return (bits << np.arange(n_bits, dtype=np.uint64)).sum(axis=2, dtype=np.uint64)
+
+
+# Backends selectable by name, e.g. from scripts/03b-similarity-model.py
+ANN_BACKENDS = {'lsh': LSHIndex}
+
+
+def compare_with_exact(index, exact, k=10, n_queries=100, allowed_fraction=None, random_state=1):
+    """
+    Reports recall@k and per-query latency of an approximate index against exact cosine similarity.
+
+    Parameters:
+    - index: Approximate index to evaluate (e.g. LSHIndex)
+    - exact: Exact SimilarityIndex over the same products
+    - k: Number of neighbours compared per query
+    - n_queries: Number of random query products
+    - allowed_fraction: Optional share of products allowed per query (a random pre-filter mask), None allows all
+    - random_state: Seed used to pick the queries and masks
+
+    Returns:
+    - Dictionary with recall@k, mean latency of both (microseconds) and memory of both
+    """
+    rng = np.random.default_rng(random_state)
+    n_products = exact.n_products
+    queries = rng.integers(0, n_products, size=n_queries)
+
+    recalls, exact_time, index_time = [], 0.0, 0.0
+    for query in queries:
+        allowed = None
+        if allowed_fraction is not None:
+            allowed = np.flatnonzero(rng.random(n_products) < allowed_fraction)
+            allowed = allowed[allowed != query]
+            if len(allowed) == 0:
+                continue
+        rows = np.arange(n_products) if allowed is None else allowed
+        rows = rows[rows != query]
+        n_best = min(k, len(rows))
+
+        start = time.perf_counter()
+        exact_row = exact.row(query)
+        exact_best = rows[np.argpartition(-exact_row[rows], n_best - 1)[:n_best]]
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_row = index.row(query, allowed)
+        index_best = rows[np.argpartition(-index_row[rows], n_best - 1)[:n_best]]
+        index_time += time.perf_counter() - start
+
+        # Neighbours tied with the k-th exact score count as found
+        threshold = exact_row[exact_best].min()
+        recalls.append(np.sum(exact_row[index_best] >= threshold - 1e-6) / n_best)
+
+    return {
+        'mode': index.mode,
+        'n_products': n_products,
+        'k': k,
+        'allowed_fraction': allowed_fraction,
+        'recall_at_k': float(np.mean(recalls)),
+        'exact_query_us': exact_time / len(recalls) * 1e6,
+        'index_query_us': index_time / len(recalls) * 1e6,
+        'exact_bytes': exact.nbytes,
+        'index_bytes': index.nbytes
+    }
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    index_path = '../model/similarity_index.joblib'
+    n_tables = 8
+    n_bits = 12
+
+    # Hash the vectors of an exact index and report recall/latency with and without a pre-filter
+    exact = SimilarityIndex.load(index_path, mmap_mode='r')
+    if exact.mode != 'exact':
+        raise ValueError(f'{index_path} is a {exact.mode} index, recall needs the exact vectors')
+    index = LSHIndex.from_features(exact.vectors, n_tables=n_tables, n_bits=n_bits)
+    print(compare_with_exact(index, exact))
+    print(compare_with_exact(index, exact, allowed_fraction=0.05))
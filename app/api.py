@@ -0,0 +1,158 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import tornado.web
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.process
+from recommendation_engine import RecommendationEngine
+from artifacts import version_digest
+from feedback_log import shared_log
+import instrumentation
+
+#-----------------------------------------
+# HTTP/JSON Recommendation Service
+#-----------------------------------------
+# Serves the same filters and ranking as the Streamlit page without the UI:
+#   POST /recommend  {"features": ["Wireless"], "price_range": [0, 100], "rating": 4.0,
+#                     "battery_life": 10, "colours": ["black"], "alpha": 0.6, "anchor": "centroid"}
+#   POST /feedback   {"product_id": "B0...", "event": "like"}  (like, dislike or impression, queued for the
+#                    feedback log, recommendations returned by /recommend are logged as impressions)
+#   GET  /health     digest of the artifact version and catalogue size
+#   GET  /stats      result cache counters of the worker that answers
+#   GET  /metrics    span timings and memory of the worker that answers, Prometheus text
+#                    (empty unless started with SOUND_DECISIONS_METRICS=1)
+# Run from the app folder: python api.py (artifacts are preloaded once, then worker processes are forked)
+# Scoring and artifact reloads run on a thread pool, so a slow request doesn't stall the worker's IOLoop.
+
+class EngineHandler(tornado.web.RequestHandler):
+    def initialize(self, engine, executor):
+        self.engine = engine
+        self.executor = executor
+
+    def run_in_executor(self, fn, *args):
+        return tornado.ioloop.IOLoop.current().run_in_executor(self.executor, fn, *args)
+
+    def write_error_message(self, status, message):
+        self.set_status(status)
+        self.write({'error': message})
+
+
+class RecommendHandler(EngineHandler):
+    async def post(self):
+        try:
+            preferences = json.loads(self.request.body or b'{}')
+        except json.JSONDecodeError:
+            return self.write_error_message(400, 'Request body must be valid JSON')
+
+        try:
+            recommended_products = await self.run_in_executor(self.engine.recommend, preferences)
+        except ValueError as error:
+            return self.write_error_message(400, str(error))
+
+        # hybrid_recommender returns a message instead of a DataFrame when no products match
+        if isinstance(recommended_products, str):
+            return self.write({'products': [], 'message': recommended_products})
+
+        self.write({
+            'products': [
+                {'Product ID': product_id, 'Rating': float(rating), 'Product URL': f'https://www.amazon.co.uk/dp/{product_id}'}
+                for product_id, rating in zip(recommended_products['Product ID'], recommended_products['Rating'])
+            ],
+            'message': None
+        })
+
+
+class FeedbackHandler(EngineHandler):
+    def post(self):
+        try:
+            feedback = json.loads(self.request.body or b'{}')
+        except json.JSONDecodeError:
+            return self.write_error_message(400, 'Request body must be valid JSON')
+        if not isinstance(feedback, dict) or 'product_id' not in feedback or 'event' not in feedback:
+            return self.write_error_message(400, "Feedback must be a JSON object with 'product_id' and 'event'")
+
+        try:
+            queued = self.engine.record_feedback(feedback['product_id'], feedback['event'])
+        except ValueError as error:
+            return self.write_error_message(400, str(error))
+        # The queue only fills up when the disk can't keep up, the event is dropped rather than waiting
+        if not queued:
+            return self.write_error_message(503, 'Feedback log is busy, event dropped')
+        self.write({'queued': True})
+
+
+class HealthHandler(EngineHandler):
+    async def get(self):
+        await self.run_in_executor(self.engine.refresh)
+        self.write({'status': 'ok', 'n_products': len(self.engine.df), 'version': version_digest(self.engine.version)})
+
+
+class StatsHandler(EngineHandler):
+    def get(self):
+        self.write(self.engine.cache.stats())
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(instrumentation.prometheus_text())
+
+
+def make_app(engine, executor=None):
+    """
+    Creates the Tornado application serving an engine.
+
+    Parameters:
+    - engine: RecommendationEngine shared by all handlers of the process
+    - executor: Thread pool recommend and refresh run on, defaults to a new pool of 4 threads
+
+    Returns:
+    - tornado.web.Application
+    """
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='recommend')
+    handler_args = {'engine': engine, 'executor': executor}
+    return tornado.web.Application([
+        (r'/recommend', RecommendHandler, handler_args),
+        (r'/feedback', FeedbackHandler, handler_args),
+        (r'/health', HealthHandler, handler_args),
+        (r'/stats', StatsHandler, handler_args),
+        (r'/metrics', MetricsHandler)
+    ])
+
+
+def serve(port=8000, workers=1, catalogue_path='../data/final_data.csv', model_dir='../model',
+          feedback_dir='../data/feedback'):
+    """
+    Starts the service, blocking until the process is stopped.
+
+    Parameters:
+    - port: Port every worker accepts connections on (put a load balancer in front for several hosts)
+    - workers: Number of worker processes, 0 starts one per CPU
+    - catalogue_path: Catalogue CSV (a newer Parquet copy is preferred)
+    - model_dir: Folder holding the similarity model
+    - feedback_dir: Folder feedback events are logged to, each worker writes its own segments
+    """
+    # Loaded before forking so workers share the catalogue pages and memory-mapped similarity model
+    engine = RecommendationEngine(catalogue_path, model_dir, feedback_log=shared_log(feedback_dir))
+    sockets = tornado.netutil.bind_sockets(port)
+    if workers != 1:
+        tornado.process.fork_processes(workers)
+
+    async def main():
+        server = tornado.httpserver.HTTPServer(make_app(engine))
+        server.add_sockets(sockets)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    port = 8000
+    # One worker per CPU
+    workers = 0
+
+    serve(port, workers)
@@ -1,15 +1,17 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import joblib
-from hybrid_recommender import hybrid_recommender
+from catalogue_stats import load_stats
+from instrumentation import span, export
 
 #-----------------------------------------
 # Data Loading
 #-----------------------------------------
-df = pd.read_csv('../data/final_data.csv', index_col = 0)
-
-cosine_sim = joblib.load('../model/cosine_similarity_matrix.joblib')
+# Only the widget bounds are needed to draw the page, read from final_data.stats.json without pandas.
+# The catalogue and similarity model are loaded once the widgets are on screen (see below).
+# Spans are only recorded when SOUND_DECISIONS_METRICS=1 (see instrumentation.py)
+with span('app_stats'):
+    stats = load_stats('../data/final_data.csv')
+price_stats = stats['columns']['Price']
+battery_stats = stats['columns']['Battery Life']
 
 if 'product_feedback' not in st.session_state:
     st.session_state.product_feedback = []
@@ -44,7 +46,7 @@ st.markdown("---")
 
 # Slider features
 # Tuple for min/max price range
-price_range = st.slider("Select Price Range (£)", min_value=df['Price'].min(), max_value=df['Price'].max(), step = 10.0, value=(0.0, df['Price'].max().round()))
+price_range = st.slider("Select Price Range (£)", min_value=price_stats['min'], max_value=price_stats['max'], step = 10.0, value=(0.0, float(round(price_stats['max']))))
 min_price_selected, max_price_selected = price_range  
 
 st.markdown("---")
@@ -54,42 +56,17 @@ rating = st.slider("Select Minimum Rating", min_value=1.0, max_value=5.0, value=
 
 st.markdown("---")
 
-battery_life = st.slider("Select Minimum Battery Life (hours)", min_value=df['Battery Life'].min(), max_value=df['Battery Life'].max(), value=10)
+battery_life = st.slider("Select Minimum Battery Life (hours)", min_value=int(battery_stats['min']), max_value=int(battery_stats['max']), value=10)
 
 st.markdown("---")
 
 # Multiselect features
-colour_columns = [colour_col for colour_col in df.columns if colour_col.startswith('Colour')]
-colour_names = [colour.replace('Colour_','') for colour in colour_columns]
+colour_names = list(stats['colours'])
 # Removing Not Specified as its confusing to users
 colour_names.remove('Not Specified')
 colours = st.multiselect('Select Colour Preferences', options=colour_names)
 
 st.markdown("---")
-#-----------------------------------------
-# Filtering of Data
-#-----------------------------------------
-filtered_df = df.copy()
-
-for feature, selected in features.items():
-    if selected:
-        filtered_df = filtered_df.loc[filtered_df[feature]==1]
-
-# Filter by Price - need to take log of input price
-
-filtered_df = filtered_df.loc[(filtered_df['Price'] <= max_price_selected) & (filtered_df['Price'] >= min_price_selected)] 
-
-# Filter by Rating
-filtered_df = filtered_df.loc[filtered_df['Rating'] >= rating]
-
-# Filter by Battery Life
-filtered_df = filtered_df.loc[filtered_df['Battery Life'] >= battery_life]
-
-if colours:
-    # using np.any to find rows where any of the selected colours match the user input
-    colour_filters = np.any([filtered_df[f'Colour_{colour}'] == 1 for colour in colours],axis=0)
-    filtered_df = filtered_df[colour_filters] 
-
 #-----------------------------------------
 # Get Recommendations
 #-----------------------------------------
@@ -102,15 +79,57 @@ st.write("Alpha controls the recommendation balance:")
 st.write("1.0 - Recommendations based entirely on product features.")
 st.write("0.0 - Recommendations based entirely on average product rating.")
 
-if st.button("Get Recommendations"):
-    recommended_products = hybrid_recommender(df,filtered_df, cosine_sim, alpha)
-
+# Which matching products the feature similarity is measured against (see hybrid_recommender)
+anchor_options = {
+    'First matching product': 'first',
+    'All matching products': 'centroid',
+    'Top rated matching products': 'top_m'
+}
+anchor = st.selectbox("Compare Features Against", options=list(anchor_options))
+
+clicked = st.button("Get Recommendations")
+
+# Imported and loaded after the widgets are drawn, so a cold start shows the page before pandas, the catalogue
+# and the similarity model are loaded. Shared across sessions and reloaded only when the files change.
+with span('app_load'):
+    from recommendation_engine import shared_engine
+    engine = shared_engine('../data/final_data.csv', '../model')
+    engine.refresh()
+
+if clicked:
+    # Filtering and ranking (see recommendation_engine.py), identical preferences share one cached result
+    with span('app_recommend'):
+        # Kept in the session so the results stay on screen when a feedback button reruns the page
+        st.session_state.recommended_products = engine.recommend({
+            'features': features,
+            'price_range': (min_price_selected, max_price_selected),
+            'rating': rating,
+            'battery_life': battery_life,
+            'colours': colours,
+            'alpha': alpha,
+            'anchor': anchor_options[anchor]
+        })
+
+recommended_products = st.session_state.get('recommended_products')
+if recommended_products is not None:
     st.markdown("#### Recommended Headphones:")
 
     # Check if the output is a DataFrame or a string (no products available)
-    if isinstance(recommended_products, pd.DataFrame):
+    if not isinstance(recommended_products, str):
        # using to_html to make links clickable
         st.write(recommended_products.to_html(escape=False, index=False), unsafe_allow_html=True)
+
+        # Feedback is queued for the feedback log (feedback_log.py) and later used in the ranking
+        st.markdown("#### Rate These Recommendations:")
+        for product_id in recommended_products['Product ID']:
+            name_column, like_column, dislike_column = st.columns([4, 1, 1])
+            name_column.write(product_id)
+            for column, label, event in [(like_column, '👍', 'like'), (dislike_column, '👎', 'dislike')]:
+                if column.button(label, key=f'{event}_{product_id}'):
+                    engine.record_feedback(product_id, event)
+                    st.session_state.product_feedback.append((product_id, event))
     else:
         st.write(recommended_products)
 
+# Streamlit can't serve /metrics, write the Prometheus text to SOUND_DECISIONS_METRICS_FILE instead (if set)
+export()
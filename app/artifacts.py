@@ -0,0 +1,308 @@
+import os
+import hashlib
+from fnmatch import fnmatch
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from scipy import sparse
+from similarity_index import SimilarityIndex
+from catalogue_index import CatalogueIndex
+from ann_index import LSHIndex
+from cluster_index import ClusterIndex
+from topk_table import TopKTable
+from catalogue_stats import write_stats
+from stage_schema import restore_precision
+from instrumentation import span
+
+#-----------------------------------------
+# Process-wide Artifact Cache
+#-----------------------------------------
+# Streamlit re-runs app.py on every widget interaction but imported modules stay loaded,
+# so artifacts held here are shared by every session in the process.
+# Each entry is keyed by path and replaced when the file's signature changes.
+_cache = {}
+_lock = threading.Lock()
+
+
+def file_signature(path):
+    '''
+    Cheap change detector for an artifact file
+
+    Parameters
+    ---------
+    path: path to artifact
+
+    Returns
+    -------
+    Tuple of (modification time in ns, size in bytes)
+    '''
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _cached(path, loader, kind='raw'):
+    # kind lets structures derived from the same file (e.g. a filter index) share its signature
+    key = (path, kind)
+    signature = file_signature(path)
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    with span('load_artifact', artifact=os.path.basename(path), kind=kind if isinstance(kind, str) else kind[0]):
+        value = loader(path)
+    with _lock:
+        _cache[key] = (signature, value)
+    return value
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+#-----------------------------------------
+# Loaders
+#-----------------------------------------
+def fresh_copy(path, extension):
+    '''
+    Picks the columnar/memory-mappable copy of an artifact when one exists and is up to date
+
+    Parameters
+    ---------
+    path: path to artifact written by the pipeline (e.g. ../data/final_data.csv)
+    extension: extension of the faster copy, e.g. '.parquet' or '.npy'
+
+    Returns
+    -------
+    Path to the copy next to the artifact if it is at least as new, otherwise the original path
+    '''
+    copy_path = os.path.splitext(path)[0] + extension
+    if os.path.exists(copy_path):
+        if not os.path.exists(path) or os.path.getmtime(copy_path) >= os.path.getmtime(path):
+            return copy_path
+    return path
+
+
+def project_columns(names, columns):
+    '''
+    Resolves column patterns (e.g. 'Colour_*') against the columns of a catalogue
+
+    Returns
+    -------
+    Matching column names in catalogue order, or all names when columns is None
+    '''
+    if columns is None:
+        return list(names)
+    return [name for name in names if any(fnmatch(name, pattern) for pattern in columns)]
+
+
+def _read_catalogue(path, columns=None):
+    if path.endswith('.parquet'):
+        schema = pq.read_schema(path)
+        # Only the projected columns are read from disk, the index is always included
+        names = [name for name in schema.names if not name.startswith('__index_level_')]
+        table = pq.read_table(path, columns=project_columns(names, columns), use_pandas_metadata=True)
+        return restore_precision(table.to_pandas(), schema)
+    df = pd.read_csv(path, index_col=0)
+    return df[project_columns(df.columns, columns)]
+
+
+def load_catalogue(csv_path, columns=None):
+    '''
+    Loads the product catalogue once per process
+
+    Parameters
+    ---------
+    csv_path: path to catalogue CSV, a Parquet file with the same name is preferred
+    columns: optional column names or patterns (e.g. 'Colour_*') to load, Parquet only reads these from disk
+
+    Returns
+    -------
+    Shared DataFrame, callers must not modify it in place
+    '''
+    kind = 'raw' if columns is None else ('columns',) + tuple(columns)
+    return _cached(fresh_copy(csv_path, '.parquet'), lambda path: _read_catalogue(path, columns), kind=kind)
+
+
+def load_catalogue_index(csv_path, columns=None):
+    '''
+    Builds the bitmap filter index for the catalogue once per process
+
+    Parameters
+    ---------
+    csv_path: path to catalogue CSV, as passed to load_catalogue
+    columns: column projection, as passed to load_catalogue
+
+    Returns
+    -------
+    Shared CatalogueIndex, rebuilt when the catalogue file changes
+    '''
+    kind = 'index' if columns is None else ('index',) + tuple(columns)
+    return _cached(fresh_copy(csv_path, '.parquet'),
+                   lambda path: CatalogueIndex.from_catalogue(load_catalogue(csv_path, columns)), kind=kind)
+
+
+def _read_index(path):
+    return SimilarityIndex.load(path, mmap_mode='r')
+
+
+def _read_ann(path):
+    return LSHIndex.load(path, mmap_mode='r')
+
+
+def _read_published(pointer_path):
+    # CURRENT holds the name of the latest published version folder (see scripts/similarity_builder.py)
+    with open(pointer_path) as f:
+        version = f.read().strip()
+    return _read_index(os.path.join(os.path.dirname(pointer_path), version, 'similarity_index.joblib'))
+
+
+def _read_matrix(path):
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return joblib.load(path, mmap_mode='r')
+
+
+def load_similarities(model_dir):
+    '''
+    Loads the similarity model once per process, memory-mapping the arrays where possible
+
+    Parameters
+    ---------
+    model_dir: folder holding similarity/CURRENT, ann_index.joblib, similarity_index.joblib or cosine_similarity_matrix.joblib/.npy
+
+    Returns
+    -------
+    SimilarityIndex (or LSHIndex) when one has been built, otherwise the N x N similarity matrix.
+    A newly published version is picked up on the next call (CURRENT is swapped atomically).
+    '''
+    path, loader = _similarity_source(model_dir)
+    return _cached(path, loader)
+
+
+def _similarity_source(model_dir):
+    # Path of the similarity model the app uses and how to load it, in order of preference
+    pointer_path = os.path.join(model_dir, 'similarity', 'CURRENT')
+    if os.path.exists(pointer_path):
+        return pointer_path, _read_published
+
+    # Only built for catalogues too large for an exact index (scripts/03b-similarity-model.py, mode='lsh')
+    ann_path = os.path.join(model_dir, 'ann_index.joblib')
+    if os.path.exists(ann_path):
+        return ann_path, _read_ann
+
+    index_path = os.path.join(model_dir, 'similarity_index.joblib')
+    if os.path.exists(index_path):
+        return index_path, _read_index
+
+    matrix_path = fresh_copy(os.path.join(model_dir, 'cosine_similarity_matrix.joblib'), '.npy')
+    if os.path.exists(matrix_path):
+        return matrix_path, _read_matrix
+    raise FileNotFoundError(f'No similarity model found in {model_dir}')
+
+
+def load_clusters(model_dir):
+    '''
+    Loads the cluster index of the catalogue once per process (built by scripts/03c-cluster-index.py)
+
+    Returns
+    -------
+    Shared ClusterIndex, or None when none has been built
+    '''
+    path = os.path.join(model_dir, 'cluster_index.joblib')
+    if not os.path.exists(path):
+        return None
+    return _cached(path, ClusterIndex.load)
+
+
+def load_feedback(model_dir):
+    '''
+    Loads the per-product feedback aggregates once per process (compacted by feedback_log.py)
+
+    Returns
+    -------
+    Shared DataFrame indexed by Product ID, or None when there is no feedback yet
+    '''
+    path = os.path.join(model_dir, 'feedback_aggregates.parquet')
+    if not os.path.exists(path):
+        return None
+    return _cached(path, pd.read_parquet)
+
+
+def load_topk_table(model_dir):
+    '''
+    Loads the materialised top-k table once per process, memory-mapped (built by scripts/03d-topk-table.py)
+
+    Returns
+    -------
+    Shared TopKTable, or None when none has been built
+    '''
+    path = os.path.join(model_dir, 'topk_table.joblib')
+    if not os.path.exists(path):
+        return None
+    return _cached(path, TopKTable.load)
+
+
+def artifact_version(csv_path, model_dir):
+    '''
+    Identifies the catalogue and similarity model currently on disk, e.g. to key cached results
+
+    Parameters
+    ---------
+    csv_path: path to catalogue CSV, as passed to load_catalogue
+    model_dir: model folder, as passed to load_similarities
+
+    Returns
+    -------
+    Tuple of (path, signature) for the catalogue, similarity model, cluster index, feedback aggregates and top-k table
+    (signature None for optional ones not built), changes whenever any of them is rebuilt or republished
+    '''
+    catalogue_path = fresh_copy(csv_path, '.parquet')
+    similarity_path, _ = _similarity_source(model_dir)
+    optional_names = ['cluster_index.joblib', 'feedback_aggregates.parquet', 'topk_table.joblib']
+    optional_paths = [os.path.join(model_dir, name) for name in optional_names]
+    return ((catalogue_path, file_signature(catalogue_path)), (similarity_path, file_signature(similarity_path)),
+            *((path, file_signature(path) if os.path.exists(path) else None) for path in optional_paths))
+
+
+def source_signatures(version):
+    '''
+    Signatures of the catalogue and similarity model in an artifact_version, stored with derived artifacts
+    (e.g. TopKTable.sources) so they can tell whether they were built from the current ones
+    '''
+    return tuple(tuple(signature) for _, signature in version[:2])
+
+
+def version_digest(version):
+    '''
+    Short hex digest of an artifact_version, to report which artifacts are served without exposing paths
+    '''
+    return hashlib.sha256(repr(version).encode('utf-8')).hexdigest()[:12]
+
+
+def export_columnar(csv_path, matrix_path=None):
+    '''
+    Writes Parquet/.npy copies of the pipeline outputs so the app can skip CSV parsing and unpickling,
+    plus the widget bounds the app draws its page from (final_data.stats.json)
+
+    Parameters
+    ---------
+    csv_path: catalogue CSV to convert
+    matrix_path: optional joblib cosine matrix to convert to a memory-mappable .npy file. Sparse (csr)
+                 matrices are left as they are: joblib already memory-maps their arrays, and a dense copy
+                 would be N x N
+    '''
+    df = pd.read_csv(csv_path, index_col=0)
+    df.to_parquet(os.path.splitext(csv_path)[0] + '.parquet')
+    write_stats(df, csv_path)
+
+    if matrix_path is not None:
+        matrix = joblib.load(matrix_path, mmap_mode='r')
+        if not sparse.issparse(matrix):
+            np.save(os.path.splitext(matrix_path)[0] + '.npy', np.asarray(matrix))
+
+
+if __name__ == "__main__":
+    export_columnar('../data/final_data.csv', '../model/cosine_similarity_matrix.joblib')
@@ -0,0 +1,105 @@
+import numpy as np
+from pandas.api.types import is_numeric_dtype
+
+#-----------------------------------------
+# Catalogue Bitmap Index
+#-----------------------------------------
+class CatalogueIndex:
+    """
+    Precomputed filter index over the product catalogue.
+
+    Binary features (Is Prime, Wireless, ..., Colour_*) are stored as packed bitsets (1 bit per product)
+    and numeric columns (Price, Rating, Battery Life) as sorted values with their row order, so a set of
+    user preferences resolves to a matching-row bitmap with bitwise AND/OR and binary search.
+    """
+
+    def __init__(self, n_products, flags, sorted_values, sorted_rows):
+        self.n_products = n_products
+        self.flags = flags
+        self.sorted_values = sorted_values
+        self.sorted_rows = sorted_rows
+        self._all = np.packbits(np.ones(n_products, dtype=bool))
+
+    @classmethod
+    def from_catalogue(cls, df, range_columns=('Price', 'Rating', 'Battery Life')):
+        """
+        Builds the index from the catalogue DataFrame.
+
+        Parameters:
+        - df: Catalogue with one row per product (final_data)
+        - range_columns: Numeric columns filtered with min/max bounds
+
+        Returns:
+        - CatalogueIndex, row positions refer to df.iloc
+        """
+        flags = {}
+        for column in df.columns:
+            if column in range_columns or not is_numeric_dtype(df[column]):
+                continue
+            values = df[column].to_numpy()
+            if np.isin(values, (0, 1)).all():
+                flags[column] = np.packbits(values == 1)
+
+        sorted_values, sorted_rows = {}, {}
+        for column in range_columns:
+            if column not in df.columns:
+                continue
+            values = df[column].to_numpy(dtype=float)
+            # NaNs sort to the end, drop them so they never match a range
+            order = np.argsort(values, kind='stable')
+            order = order[~np.isnan(values[order])]
+            sorted_values[column] = values[order]
+            sorted_rows[column] = order
+
+        return cls(len(df), flags, sorted_values, sorted_rows)
+
+    def flag(self, column):
+        return self.flags[column]
+
+    def any_flag(self, columns):
+        bitmap = np.zeros_like(self._all)
+        for column in columns:
+            bitmap |= self.flags[column]
+        return bitmap
+
+    def range(self, column, low=None, high=None):
+        """
+        Returns a bitmap of rows with low <= column <= high, either bound can be None.
+        """
+        values = self.sorted_values[column]
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        end = len(values) if high is None else np.searchsorted(values, high, side='right')
+
+        matches = np.zeros(self.n_products, dtype=bool)
+        matches[self.sorted_rows[column][start:end]] = True
+        return np.packbits(matches)
+
+    def match(self, flags=(), ranges=None, any_flags=()):
+        """
+        Resolves a preference set to a bitmap of matching rows.
+
+        Parameters:
+        - flags: Binary columns that must all be 1 (e.g. selected checkboxes)
+        - ranges: Dictionary of column -> (low, high) bounds, None for an open bound
+        - any_flags: Binary columns where at least one must be 1 (e.g. selected colours), ignored if empty
+
+        Returns:
+        - Packed bitmap (uint8 array) of matching rows
+        """
+        bitmap = self._all.copy()
+        for column in flags:
+            bitmap &= self.flags[column]
+        for column, (low, high) in (ranges or {}).items():
+            bitmap &= self.range(column, low, high)
+        if any_flags:
+            bitmap &= self.any_flag(any_flags)
+        return bitmap
+
+    def rows(self, bitmap):
+        """
+        Converts a bitmap to the row positions it contains, in catalogue order.
+        """
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_products))
+
+    def count(self, bitmap):
+        return int(np.unpackbits(bitmap, count=self.n_products).sum())
@@ -0,0 +1,64 @@
+import os
+import json
+
+#-----------------------------------------
+# Catalogue Statistics
+#-----------------------------------------
+# Bounds the app's widgets need (price and battery sliders, colour options, rating range) are stored
+# next to the catalogue as <name>.stats.json, so the page can be drawn without importing pandas or
+# loading the catalogue. Only the standard library is imported here to keep the app's cold start short.
+
+STATS_COLUMNS = ['Price', 'Rating', 'Battery Life']
+
+
+def stats_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.stats.json'
+
+
+def compute_stats(df):
+    """
+    Computes the widget bounds of a catalogue.
+
+    Parameters:
+    - df: Catalogue DataFrame (final_data)
+
+    Returns:
+    - Dictionary with n_products, min/max per STATS_COLUMNS column and the colour names
+    """
+    return {
+        'n_products': int(len(df)),
+        'columns': {
+            column: {'min': float(df[column].min()), 'max': float(df[column].max())}
+            for column in STATS_COLUMNS if column in df.columns
+        },
+        'colours': [column.replace('Colour_', '') for column in df.columns if column.startswith('Colour_')]
+    }
+
+
+def write_stats(df, csv_path):
+    """
+    Writes the widget bounds of a catalogue next to it (called when the catalogue is exported).
+    """
+    with open(stats_path(csv_path), 'w') as f:
+        json.dump(compute_stats(df), f, indent=2)
+
+
+def load_stats(csv_path):
+    """
+    Returns the widget bounds of a catalogue, read from its stats file when that is up to date.
+
+    Parameters:
+    - csv_path: Catalogue CSV path as passed to artifacts.load_catalogue
+
+    Returns:
+    - Dictionary as returned by compute_stats. Without a current stats file the catalogue is loaded
+      instead (imports pandas), so a stale file never gives the sliders out of date bounds.
+    """
+    path = stats_path(csv_path)
+    sources = [source for source in (csv_path, os.path.splitext(csv_path)[0] + '.parquet') if os.path.exists(source)]
+    if os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(source) for source in sources):
+        with open(path) as f:
+            return json.load(f)
+
+    from artifacts import load_catalogue
+    return compute_stats(load_catalogue(csv_path, ['Product ID'] + STATS_COLUMNS + ['Colour_*']))
@@ -0,0 +1,136 @@
+import time
+import numpy as np
+import pandas as pd
+import joblib
+from hybrid_recommender import get_engine
+
+#-----------------------------------------
+# Cluster Index
+#-----------------------------------------
+class ClusterIndex:
+    """
+    Coarse inverted-file index over the KMeans segmentation of the catalogue (notebooks/02_data_eda/02-clustering.ipynb).
+
+    Every product belongs to one cluster. A query probes the anchors' cluster and its nearest clusters by
+    centroid distance, so only the products in those clusters are scored (about n_probe / n_clusters of the
+    catalogue). Only the labels and centroids are stored, sklearn is needed to build the index but not to use it.
+    """
+
+    def __init__(self, labels, centroids, product_ids=None):
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.product_ids = product_ids
+        # Clusters in order of centroid distance from each cluster, itself first
+        distances = ((self.centroids[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        self.nearest = np.argsort(distances, axis=1, kind='stable')
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    @classmethod
+    def from_features(cls, features, n_clusters=20, random_state=1, product_ids=None, scale=True):
+        """
+        Fits the notebook's segmentation: StandardScaler then KMeans(n_clusters=20, n_init='auto', random_state=1).
+
+        Parameters:
+        - features: Feature table or matrix (dense or sparse), one row per product
+        - n_clusters: Number of clusters
+        - random_state: Seed passed to KMeans
+        - product_ids: Optional Product ID of each row, so catalogues can be matched by ID
+        - scale: Standardise the features first as the notebook does. Use False for vectors that are already in
+            the similarity model's space (e.g. SimilarityIndex vectors), so clusters follow cosine similarity
+
+        Returns:
+        - ClusterIndex
+        """
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+
+        if scale:
+            features = StandardScaler().fit_transform(features)
+        k_means = KMeans(n_clusters=n_clusters, n_init='auto', random_state=random_state).fit(features)
+        return cls(k_means.labels_, k_means.cluster_centers_, product_ids)
+
+    def probe(self, cluster, n_probe):
+        """
+        Returns the cluster and its n_probe - 1 nearest clusters.
+        """
+        return self.nearest[cluster, :n_probe]
+
+    def align(self, product_ids):
+        """
+        Returns the cluster of each Product ID, -1 for products not in the index (e.g. added since it was built).
+        """
+        if self.product_ids is None:
+            if len(product_ids) != len(self.labels):
+                raise ValueError('ClusterIndex without product_ids only matches a catalogue of the same length.')
+            return self.labels
+        rows = pd.Index(self.product_ids).get_indexer(product_ids)
+        return np.where(rows >= 0, self.labels[rows], -1).astype(np.int32)
+
+    def save(self, path):
+        joblib.dump({'labels': self.labels, 'centroids': self.centroids, 'product_ids': self.product_ids}, path)
+
+    @classmethod
+    def load(cls, path):
+        stored = joblib.load(path)
+        return cls(stored['labels'], stored['centroids'], stored.get('product_ids'))
+
+
+#-----------------------------------------
+# Helper Functions
+#-----------------------------------------
+def compare_with_exhaustive(df, similarities, clusters, n_probes=(1, 2, 3, 5), alpha=0.6, k=5, n_queries=200,
+                            random_state=1):
+    """
+    Measures how often probing a few clusters returns the same recommendations as scoring every product.
+
+    Parameters:
+    - df: Catalogue DataFrame
+    - similarities: Similarity model of the catalogue
+    - clusters: ClusterIndex to evaluate
+    - n_probes: Probe counts to evaluate
+    - alpha: Weighting factor for combining feature similarity and rating
+    - k: Number of recommendations compared
+    - n_queries: Number of random anchor products, each querying the whole catalogue
+    - random_state: Seed used to pick the anchors
+
+    Anchors missing from the cluster index (label -1) are probed the way top_k_probed does: every product is
+    scored, and they are counted in unaligned_anchors. With a top_k SimilarityIndex probing lowers recall
+    without saving time, hybrid_recommender doesn't probe that backend.
+
+    Returns:
+    - List of dictionaries per probe count with recall@k, share of products scored, number of unaligned anchors
+      and mean latency (microseconds)
+    """
+    engine = get_engine(df, similarities)
+    rng = np.random.default_rng(random_state)
+    anchors = rng.integers(0, len(df), size=n_queries)
+    candidates = np.arange(len(df))
+
+    start = time.perf_counter()
+    exhaustive = [engine.top_k(anchor, candidates, alpha, k)[0] for anchor in anchors]
+    exhaustive_us = (time.perf_counter() - start) / n_queries * 1e6
+
+    labels = engine.cluster_labels(clusters)
+    results = []
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        probed = [engine.top_k_probed([anchor], candidates, clusters, n_probe, alpha, k)[0] for anchor in anchors]
+        probed_us = (time.perf_counter() - start) / n_queries * 1e6
+
+        # Products missing from the index are always scored, unaligned anchors score everything
+        scored = [np.isin(labels, np.append(clusters.probe(labels[anchor], n_probe), -1)).mean()
+                  if labels[anchor] >= 0 else 1.0 for anchor in anchors]
+        recall = [len(np.intersect1d(a, b)) / len(a) for a, b in zip(exhaustive, probed)]
+        results.append({
+            'n_probe': n_probe,
+            'n_clusters': clusters.n_clusters,
+            'recall_at_k': float(np.mean(recall)),
+            'scored_fraction': float(np.mean(scored)),
+            'unaligned_anchors': int(np.sum(labels[anchors] < 0)),
+            'exhaustive_us': exhaustive_us,
+            'probed_us': probed_us
+        })
+    return results
@@ -0,0 +1,304 @@
+import os
+import glob
+import atexit
+import json
+import time
+import queue
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#-----------------------------------------
+# Feedback Event Log
+#-----------------------------------------
+# Feedback on recommendations (likes/dislikes from the app, impressions of every recommendation shown) is
+# appended to a local log without slowing requests down:
+#   - record() only puts the event on an in-process queue (never blocks, events are dropped and counted
+#     when the queue is full)
+#   - a background thread writes the queue in batches to JSONL segments, events-<pid>-<start>.jsonl.open,
+#     renamed to .jsonl once they reach segment_bytes / segment_seconds (checked while idle too) or the log
+#     is closed
+#   - compact() (run offline, see __main__) folds closed segments into per-product aggregates at
+#     model/feedback_aggregates.parquet, which the recommender loads as an extra ranking signal. Open
+#     segments left by a process that was killed (SIGTERM/SIGKILL skip atexit) are taken over once their
+#     pid is gone, live processes close their own segments after segment_seconds even when idle
+
+EVENT_TYPES = ('impression', 'like', 'dislike')
+# Aggregates file metadata listing the segments folded into it, see compact()
+FOLDED_SEGMENTS_KEY = b'feedback_segments'
+AGGREGATE_COLUMNS = ['impressions', 'likes', 'dislikes']
+
+
+class FeedbackLog:
+    """
+    Append-only, buffered log of feedback events for one process.
+
+    The writer thread is started by the first record() in each process, so a log created before Tornado
+    forks its workers gives every worker its own thread and segment files.
+    """
+
+    def __init__(self, log_dir, batch_size=256, flush_interval=1.0, segment_bytes=16 * 1024 * 1024,
+                 segment_seconds=3600, max_queue=100000):
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._segment = None
+
+    def record(self, product_id, event, **fields):
+        """
+        Queues one event, returns immediately.
+
+        Parameters:
+        - product_id: Product ID the event is about
+        - event: One of EVENT_TYPES
+        - fields: Extra JSON-serialisable fields stored with the event (e.g. session, alpha)
+
+        Returns:
+        - True if the event was queued, False if the queue was full and it was dropped
+        """
+        if event not in EVENT_TYPES:
+            raise ValueError(f"event must be one of {list(EVENT_TYPES)}, got '{event}'")
+        self._start()
+        try:
+            self._queue.put_nowait({'ts': time.time(), 'product_id': str(product_id), 'event': event, **fields})
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        """
+        Blocks until every queued event is written (tests, shutdown).
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes the queued events and closes the current segment so it can be compacted.
+        """
+        self.flush()
+        with self._lock:
+            self._close_segment()
+
+    def _start(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                # A forked child inherits the parent's queue and segment but not its thread
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._segment = None
+                self._thread = threading.Thread(target=self._run, name='feedback-log', daemon=True)
+                self._thread.start()
+                self._pid = pid
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            # Wakes up when the open segment is due to rotate, so an idle worker doesn't keep it open
+            try:
+                batch = [self._queue.get(timeout=self._seconds_to_rotation())]
+            except queue.Empty:
+                with self._lock:
+                    self._rotate()
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                with self._lock:
+                    self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _seconds_to_rotation(self):
+        segment = self._segment
+        if segment is None:
+            return None
+        return max(segment[1] + self.segment_seconds - time.time(), 0)
+
+    def _rotate(self):
+        if self._segment is not None:
+            path, started = self._segment
+            try:
+                full = os.path.getsize(path) >= self.segment_bytes
+            except OSError:
+                # Already taken over by compact()
+                full = True
+            if full or time.time() - started >= self.segment_seconds:
+                self._close_segment()
+
+    def _write(self, batch):
+        self._rotate()
+        if self._segment is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            started = time.time()
+            self._segment = (os.path.join(self.log_dir, f'events-{os.getpid()}-{time.time_ns()}.jsonl.open'), started)
+        with open(self._segment[0], 'a') as f:
+            f.write(''.join(json.dumps(event) + '\n' for event in batch))
+
+    def _close_segment(self):
+        if self._segment is not None:
+            path = self._segment[0]
+            if os.path.exists(path):
+                os.replace(path, path[:-len('.open')])
+            self._segment = None
+
+
+# One log per folder in the process, shared by the Streamlit sessions / Tornado handlers
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def shared_log(log_dir='../data/feedback'):
+    with _logs_lock:
+        if log_dir not in _logs:
+            _logs[log_dir] = FeedbackLog(log_dir)
+        return _logs[log_dir]
+
+#-----------------------------------------
+# Offline Compaction
+#-----------------------------------------
+def read_segments(paths):
+    """
+    Reads feedback events from JSONL segments, skipping a half-written last line left by a crash.
+
+    Returns:
+    - DataFrame with one row per event
+    """
+    events = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return pd.DataFrame(events, columns=['ts', 'product_id', 'event'] if not events else None)
+
+
+def feedback_score(aggregates):
+    """
+    Smoothed share of likes among likes and dislikes, (likes + 1) / (likes + dislikes + 2).
+    Products without votes score 0.5.
+    """
+    return (aggregates['likes'] + 1) / (aggregates['likes'] + aggregates['dislikes'] + 2)
+
+
+def _pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def abandoned_segments(log_dir):
+    """
+    Returns the open segments whose process has exited (e.g. killed by SIGTERM before atexit ran), no
+    FeedbackLog will write to them again. Segments of live processes are left to them: a running log
+    closes its segment after segment_seconds even when idle.
+    """
+    paths = []
+    for path in sorted(glob.glob(os.path.join(log_dir, 'events-*-*.jsonl.open'))):
+        try:
+            pid, _ = map(int, os.path.basename(path)[len('events-'):-len('.jsonl.open')].split('-'))
+        except ValueError:
+            continue
+        if not _pid_running(pid):
+            paths.append(path)
+    return paths
+
+
+def folded_segments(output_path):
+    """
+    Returns the names of the segments the last compact() folded into an aggregates file.
+    """
+    if not os.path.exists(output_path):
+        return []
+    metadata = pq.read_schema(output_path).metadata or {}
+    return json.loads(metadata.get(FOLDED_SEGMENTS_KEY, b'[]'))
+
+
+def compact(log_dir='../data/feedback', output_path='../model/feedback_aggregates.parquet', include_open=False):
+    """
+    Folds closed and abandoned segments into the per-product aggregates, then deletes them.
+
+    The names of the folded segments are published with the aggregates, so if compact() is stopped before
+    deleting them the next run deletes them instead of counting them twice.
+
+    Parameters:
+    - log_dir: Folder the FeedbackLogs write to
+    - output_path: Aggregates Parquet file, counts already in it are kept and added to
+    - include_open: Also compact segments still open, only safe when no app or service is running
+
+    Returns:
+    - DataFrame indexed by Product ID with impressions/likes/dislikes, score and last_event (epoch seconds)
+    """
+    # Left behind by a run that published its aggregates but didn't get to delete them
+    for name in folded_segments(output_path):
+        if os.path.exists(os.path.join(log_dir, name)):
+            os.remove(os.path.join(log_dir, name))
+
+    if include_open:
+        open_paths = sorted(glob.glob(os.path.join(log_dir, '*.jsonl.open')))
+    else:
+        open_paths = abandoned_segments(log_dir)
+    # Closed the same way a FeedbackLog closes them
+    for path in open_paths:
+        if os.path.exists(path):
+            os.replace(path, path[:-len('.open')])
+    paths = sorted(glob.glob(os.path.join(log_dir, '*.jsonl')))
+
+    events = read_segments(paths)
+    counts = pd.DataFrame({
+        column: (events['event'] == event).groupby(events['product_id']).sum()
+        for column, event in zip(AGGREGATE_COLUMNS, EVENT_TYPES)
+    })
+    counts['last_event'] = events.groupby('product_id')['ts'].max()
+
+    if os.path.exists(output_path):
+        previous = pd.read_parquet(output_path)
+        last_event = pd.concat([previous['last_event'], counts['last_event']]).groupby(level=0).max()
+        counts = previous[AGGREGATE_COLUMNS].add(counts[AGGREGATE_COLUMNS], fill_value=0)
+        counts['last_event'] = last_event
+    counts = counts.astype({column: 'int64' for column in AGGREGATE_COLUMNS})
+    counts.index.name = 'Product ID'
+    counts['score'] = feedback_score(counts)
+
+    # Replaced atomically so a running app never reads a half-written file, segments are only removed after
+    table = pa.Table.from_pandas(counts)
+    folded = json.dumps([os.path.basename(path) for path in paths]).encode()
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), FOLDED_SEGMENTS_KEY: folded})
+    temp_path = output_path + '.tmp'
+    pq.write_table(table, temp_path)
+    os.replace(temp_path, output_path)
+    for path in paths:
+        os.remove(path)
+    return counts
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    log_dir = '../data/feedback'
+    output_path = '../model/feedback_aggregates.parquet'
+
+    aggregates = compact(log_dir, output_path)
+    print(f"{len(aggregates)} products with feedback")
+    print(aggregates.sort_values('likes', ascending=False).head(10))
@@ -1,56 +1,465 @@
+import hashlib
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+from similarity_index import similarity_row, similarity_rows, similarity_mean, similarity_mean_at
+from instrumentation import span
 
-def hybrid_recommender(df, filtered_df, similarities, alpha=0.6):
+# How hybrid_recommender picks the product(s) similarity is measured against
+ANCHOR_MODES = ('first', 'centroid', 'top_m')
+
+#-----------------------------------------
+# NumPy Scoring Engine
+#-----------------------------------------
+class RecommenderEngine:
+    """
+    Holds the per-catalogue state hybrid_recommender needs so it is computed once, not per request.
+
+    Ratings are min-max normalised on creation (same as MinMaxScaler, NaNs ignored), scoring is
+    restricted to the candidate positions and the top k is selected with argpartition.
+    """
+
+    def __init__(self, df, similarities):
+        self.df = df
+        self.similarities = similarities
+        self.product_ids = df['Product ID'].to_numpy()
+        self.ratings = df['Rating'].to_numpy(dtype=float)
+        self.normalised_ratings = _min_max(self.ratings)
+        self.similarity_rows, self.aligned = _match_similarity_rows(df, similarities)
+        # (ClusterIndex, cluster of each catalogue position) of the last cluster index used
+        self._clusters = (None, None)
+        # ((aggregates, weight), quality of each catalogue position) of the last feedback used
+        self._feedback = (None, None)
+        # (TopKTable, whether it matches this catalogue and similarity model) of the last table used
+        self._table = (None, False)
+        self._ratings_digest = None
+
+    def top_k(self, anchor_position, candidate_positions, alpha=0.6, k=5, quality=None):
+        """
+        Ranks candidates by alpha * similarity to the anchor + (1 - alpha) * normalised rating.
+
+        Parameters:
+        - anchor_position: Catalogue position of the product to compare against
+        - candidate_positions: Array of catalogue positions allowed in the results
+        - alpha: Weighting factor for combining feature similarity and rating
+        - k: Number of products to return
+        - quality: Optional score per catalogue position used instead of the normalised rating (see feedback_quality)
+
+        Returns:
+        - Tuple of (positions, scores) of the top k candidates, best first
+        """
+        candidate_positions = np.asarray(candidate_positions)
+        cosine_sim = self._similarity_block(np.array([anchor_position]), candidate_positions)[0]
+        scores = (alpha * cosine_sim[candidate_positions]) + ((1 - alpha) * self._quality(quality)[candidate_positions])
+        return _select_top_k(candidate_positions, scores, k)
+
+    def top_k_multi(self, anchor_positions, candidate_positions, alpha=0.6, k=5, quality=None):
+        """
+        Ranks candidates by alpha * mean similarity to several anchors + (1 - alpha) * normalised rating.
+
+        Parameters:
+        - anchor_positions: Array of catalogue positions to compare against
+        - candidate_positions: Array of catalogue positions allowed in the results
+        - alpha: Weighting factor for combining feature similarity and rating
+        - k: Number of products to return
+        - quality: Optional score per catalogue position used instead of the normalised rating
+
+        Returns:
+        - Tuple of (positions, scores) of the top k candidates, best first
+        """
+        candidate_positions = np.asarray(candidate_positions)
+        cosine_sim = self._mean_similarity(np.asarray(anchor_positions), candidate_positions)
+        scores = (alpha * cosine_sim[candidate_positions]) + ((1 - alpha) * self._quality(quality)[candidate_positions])
+        return _select_top_k(candidate_positions, scores, k)
+
+    def top_k_probed(self, anchor_positions, candidate_positions, clusters, n_probe, alpha=0.6, k=5, quality=None):
+        """
+        Ranks like top_k_multi but only scores candidates in the anchors' (most common) cluster and its
+        n_probe - 1 nearest clusters. Products missing from the cluster index are always scored.
+
+        Parameters:
+        - anchor_positions: Array of catalogue positions to compare against
+        - candidate_positions: Array of catalogue positions allowed in the results
+        - clusters: ClusterIndex of the catalogue
+        - n_probe: Number of clusters scored
+        - alpha: Weighting factor for combining feature similarity and rating
+        - k: Number of products to return
+        - quality: Optional score per catalogue position used instead of the normalised rating
+
+        Returns:
+        - Tuple of (positions, scores) of the top k probed candidates, best first
+        """
+        anchor_positions = np.asarray(anchor_positions)
+        candidate_positions = np.asarray(candidate_positions)
+        labels = self.cluster_labels(clusters)
+
+        anchor_labels = labels[anchor_positions]
+        anchor_labels = anchor_labels[anchor_labels >= 0]
+        if len(anchor_labels):
+            # Indexed by label, the extra last slot is label -1 (not in the index)
+            probed = np.zeros(clusters.n_clusters + 1, dtype=bool)
+            probed[clusters.probe(np.bincount(anchor_labels).argmax(), n_probe)] = True
+            probed[-1] = True
+            candidate_positions = candidate_positions[probed[labels[candidate_positions]]]
+
+        cosine_sim = self._similarity_at(anchor_positions, candidate_positions)
+        scores = (alpha * cosine_sim) + ((1 - alpha) * self._quality(quality)[candidate_positions])
+        return _select_top_k(candidate_positions, scores, k)
+
+    def cluster_labels(self, clusters):
+        """
+        Returns the cluster of each catalogue position (-1 when missing), matched once per ClusterIndex.
+        """
+        if self._clusters[0] is not clusters:
+            self._clusters = (clusters, clusters.align(self.product_ids))
+        return self._clusters[1]
+
+    def top_k_materialised(self, table, anchor_position, candidate_positions, alpha=0.6, k=5):
+        """
+        Looks up what top_k would return in a precomputed TopKTable (topk_table.py).
+
+        Parameters:
+        - table: TopKTable built from this catalogue and similarity model
+        - anchor_position: Catalogue position of the product to compare against
+        - candidate_positions: Array of catalogue positions allowed in the results
+        - alpha: Weighting factor, one of the table's alphas
+        - k: Number of products to return
+
+        Returns:
+        - Tuple of (positions, scores) like top_k, or None when the table can't answer (then score live)
+        """
+        if self._table[0] is not table:
+            # Approximate backends only score the allowed rows live, so their results depend on the filters.
+            # A table built from other ratings (e.g. before the catalogue was re-exported) would rank stale scores
+            aligned = (table.n_products == len(self.product_ids) and not getattr(self.similarities, 'approximate', False)
+                       and table.ratings_digest == self.ratings_digest
+                       and (table.product_ids is None or np.array_equal(table.product_ids, self.product_ids)))
+            self._table = (table, aligned)
+        if not self._table[1]:
+            return None
+        allowed = np.zeros(len(self.product_ids), dtype=bool)
+        allowed[np.asarray(candidate_positions)] = True
+        return table.lookup(anchor_position, alpha, allowed, k)
+
+    @property
+    def ratings_digest(self):
+        """
+        SHA-256 of the normalised ratings, identifies the rating term a TopKTable was built with.
+        """
+        if self._ratings_digest is None:
+            self._ratings_digest = hashlib.sha256(np.ascontiguousarray(self.normalised_ratings).tobytes()).hexdigest()
+        return self._ratings_digest
+
+    def feedback_quality(self, feedback, weight=0.2):
+        """
+        Blends the feedback score into the normalised rating, (1 - weight) * rating + weight * score.
+
+        Products without feedback get the neutral score 0.5, so their order among themselves is unchanged.
+        Computed once per aggregates table and weight.
+
+        Parameters:
+        - feedback: Aggregates from feedback_log.compact, indexed by Product ID with a score column
+        - weight: Share of the rating term given to feedback
+
+        Returns:
+        - Array with the quality of each catalogue position, in place of normalised_ratings
+        """
+        if self._feedback[0] is None or self._feedback[0][0] is not feedback or self._feedback[0][1] != weight:
+            scores = feedback['score'].reindex(self.product_ids).fillna(0.5).to_numpy(dtype=float)
+            self._feedback = ((feedback, weight), (1 - weight) * self.normalised_ratings + weight * scores)
+        return self._feedback[1]
+
+    def top_rated(self, candidate_positions, m):
+        """
+        Returns the m best rated candidate positions, ties in catalogue order and missing ratings last.
+        """
+        candidate_positions = np.asarray(candidate_positions)
+        ratings = np.nan_to_num(self.ratings[candidate_positions], nan=-np.inf)
+        best, _ = _select_top_k(candidate_positions, ratings, m)
+        return best
+
+    def top_k_batch(self, anchor_positions, masks, alphas=0.6, k=5, chunk_size=1024):
+        """
+        Scores many preference profiles at once, one matrix operation per chunk of profiles.
+
+        Parameters:
+        - anchor_positions: Array (P,) of anchor catalogue positions, None uses each mask's first match
+        - masks: Boolean array (P, N) of allowed products, or packed bitmaps (P, ceil(N / 8)) from CatalogueIndex
+        - alphas: Scalar or array (P,) of weighting factors
+        - k: Number of products to return per profile
+        - chunk_size: Profiles scored together, peak memory is about chunk_size x N floats.
+          Approximate backends (LSHIndex) are queried one profile at a time with its allowed products
+
+        Returns:
+        - Tuple of (positions, scores) arrays of shape (P, k), padded with -1 / NaN when fewer than k products match
+        """
+        n_products = len(self.product_ids)
+        masks = np.asarray(masks)
+        packed = masks.dtype == np.uint8 and masks.shape[1] != n_products
+        n_profiles = masks.shape[0]
+        alphas = np.broadcast_to(np.asarray(alphas, dtype=float), (n_profiles,))
+
+        positions = np.full((n_profiles, k), -1, dtype=np.int64)
+        scores = np.full((n_profiles, k), np.nan, dtype=float)
+
+        for start in range(0, n_profiles, chunk_size):
+            end = min(start + chunk_size, n_profiles)
+            chunk_masks = masks[start:end]
+            if packed:
+                chunk_masks = np.unpackbits(chunk_masks, axis=1, count=n_products).astype(bool)
+            else:
+                chunk_masks = chunk_masks.astype(bool, copy=False)
+
+            has_match = chunk_masks.any(axis=1)
+            if anchor_positions is None:
+                chunk_anchors = chunk_masks.argmax(axis=1)
+            else:
+                chunk_anchors = np.asarray(anchor_positions)[start:end]
+
+            # (chunk, N) combined scores, products outside the mask can never be selected
+            chunk_alphas = alphas[start:end, None]
+            if getattr(self.similarities, 'approximate', False):
+                # Each profile's matches are passed on, so too few candidates fall back to exact scoring like top_k
+                chunk_scores = np.vstack([self._similarity_block(np.array([anchor]), np.flatnonzero(mask))
+                                          for anchor, mask in zip(chunk_anchors, chunk_masks)]).astype(float)
+            else:
+                chunk_scores = self._similarity_block(chunk_anchors).astype(float)
+            chunk_scores = (chunk_alphas * chunk_scores) + ((1 - chunk_alphas) * self.normalised_ratings[None, :])
+            chunk_scores[~chunk_masks] = -np.inf
+
+            chunk_k = min(k, n_products)
+            best = np.argpartition(-chunk_scores, chunk_k - 1, axis=1)[:, :chunk_k]
+            best_scores = np.take_along_axis(chunk_scores, best, axis=1)
+            # Sort each row's winners by score, ties keep catalogue order
+            order = np.lexsort((best, -best_scores), axis=1)
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+            valid = np.isfinite(best_scores) & has_match[:, None]
+            positions[start:end, :chunk_k] = np.where(valid, best, -1)
+            scores[start:end, :chunk_k] = np.where(valid, best_scores, np.nan)
+
+        return positions, scores
+
+    def top_k_alphas(self, anchor_positions, alphas, k=5):
+        """
+        Unfiltered top k of several anchors at several alphas, each anchor's similarities computed once.
+
+        Parameters:
+        - anchor_positions: Array (P,) of anchor catalogue positions
+        - alphas: Array (A,) of weighting factors
+        - k: Number of products to return per anchor and alpha
+
+        Returns:
+        - Tuple of (positions, scores) arrays of shape (P, A, k), best first, padded with -1 / NaN like top_k_batch
+        """
+        anchor_positions = np.asarray(anchor_positions)
+        k = min(k, len(self.product_ids))
+        positions = np.full((len(anchor_positions), len(alphas), k), -1, dtype=np.int64)
+        scores = np.full((len(anchor_positions), len(alphas), k), np.nan, dtype=float)
+
+        similarity = self._similarity_block(anchor_positions).astype(float)
+        for column, alpha in enumerate(alphas):
+            alpha_scores = (alpha * similarity) + ((1 - alpha) * self.normalised_ratings[None, :])
+            best = np.argpartition(-alpha_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(alpha_scores, best, axis=1)
+            # Sort each row's winners by score, ties keep catalogue order
+            order = np.lexsort((best, -best_scores), axis=1)
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+            valid = np.isfinite(best_scores)
+            positions[:, column] = np.where(valid, best, -1)
+            scores[:, column] = np.where(valid, best_scores, np.nan)
+        return positions, scores
+
+    def _allowed_rows(self, candidate_positions):
+        # Similarity model rows of the candidates, approximate backends only score these
+        if candidate_positions is None or not getattr(self.similarities, 'approximate', False):
+            return None
+        rows = self.similarity_rows[candidate_positions]
+        return rows[rows >= 0]
+
+    def _similarity_block(self, anchor_positions, candidate_positions=None):
+        # (len(anchor_positions), N) similarities with columns in catalogue order
+        rows = self.similarity_rows[anchor_positions]
+        allowed = self._allowed_rows(candidate_positions)
+        if self.aligned:
+            if len(rows) == 1:
+                return similarity_row(self.similarities, rows[0], allowed)[None, :]
+            return similarity_rows(self.similarities, rows, allowed)
+
+        # Products missing from the similarity model (e.g. added since its last build) get a similarity of 0
+        block = similarity_rows(self.similarities, np.maximum(rows, 0), allowed)
+        block = np.hstack([block, np.zeros((len(rows), 1), dtype=block.dtype)])[:, self.similarity_rows]
+        block[rows < 0] = 0
+        return block
+
+    def _mean_similarity(self, anchor_positions, candidate_positions=None):
+        # (N,) mean similarity to the anchors with entries in catalogue order
+        rows = self.similarity_rows[anchor_positions]
+        allowed = self._allowed_rows(candidate_positions)
+        if self.aligned:
+            return similarity_mean(self.similarities, rows, allowed)
+
+        # Anchors missing from the similarity model are left out, as are their columns (similarity 0)
+        rows = rows[rows >= 0]
+        if len(rows) == 0:
+            return np.zeros(len(self.product_ids), dtype=np.float32)
+        mean = similarity_mean(self.similarities, rows, allowed)
+        return np.append(mean, np.zeros(1, dtype=mean.dtype))[self.similarity_rows]
+
+    def _quality(self, quality):
+        return self.normalised_ratings if quality is None else quality
+
+    def _similarity_at(self, anchor_positions, positions):
+        # Mean similarity to the anchors for the given catalogue positions only, missing products get 0
+        anchors = self.similarity_rows[anchor_positions]
+        anchors = anchors[anchors >= 0]
+        columns = self.similarity_rows[positions]
+        present = columns >= 0
+        sims = np.zeros(len(positions), dtype=np.float32)
+        if len(anchors) and present.any():
+            sims[present] = similarity_mean_at(self.similarities, anchors, columns[present])
+        return sims
+
+
+def _match_similarity_rows(df, similarities):
+    # Row in the similarity structure for each catalogue position and whether columns follow catalogue order
+    product_ids = getattr(similarities, 'product_ids', None)
+    if product_ids is None:
+        # Matrix or index built from this catalogue, rows are the df index labels (as before)
+        return df.index.to_numpy(), True
+    rows = pd.Index(product_ids).get_indexer(df['Product ID'])
+    aligned = len(product_ids) == len(df) and np.array_equal(rows, np.arange(len(df)))
+    return rows, aligned
+
+
+def _min_max(values):
+    low, high = np.nanmin(values), np.nanmax(values)
+    scale = high - low
+    # MinMaxScaler leaves constant columns at 0
+    return (values - low) / (scale if scale != 0 else 1.0)
+
+
+def _select_top_k(positions, scores, k):
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    # Sort the k winners by score, ties keep catalogue order
+    best = best[np.lexsort((positions[best], -scores[best]))]
+    return positions[best], scores[best]
+
+
+# One-slot cache, the app passes the same shared df/similarities on every rerun
+_engine = None
+
+
+def get_engine(df, similarities):
+    global _engine
+    engine = _engine
+    if engine is None or engine.df is not df or engine.similarities is not similarities:
+        with span('build_engine'):
+            engine = RecommenderEngine(df, similarities)
+        _engine = engine
+    return engine
+
+#-----------------------------------------
+# Recommender
+#-----------------------------------------
+def hybrid_recommender(df, filtered_df, similarities, alpha=0.6, anchor='first', n_anchors=10, clusters=None, n_probe=None,
+                       feedback=None, feedback_weight=0.2, topk_table=None):
     """
     Recommends products based on features (selected by the user) and product ratings.
 
     Parameters:
-    - df: Unfiltered dataframe
+    - df: Unfiltered dataframe (not modified)
     - filtered_df: DataFrame of products filtered by user preferences
-    - similarities: Pre-made cosine similarity matrix
+    - similarities: Pre-made cosine similarity matrix or SimilarityIndex
     - alpha: Weighting factor for combining feature similarity and rating
+    - anchor: What similarity is measured against, one of ANCHOR_MODES:
+        'first' - the first filtered product
+        'centroid' - every filtered product (mean similarity, one pass over the vectors of an exact SimilarityIndex)
+        'top_m' - the n_anchors best rated filtered products
+    - n_anchors: Number of anchors used by 'top_m'
+    - clusters: Optional ClusterIndex (cluster_index.py) of the catalogue
+    - n_probe: With clusters, only products in the anchors' cluster and its n_probe - 1 nearest clusters are scored,
+        None scores every filtered product. Ignored for a top_k SimilarityIndex, which builds whole rows either way
+    - feedback: Optional per-product feedback aggregates (feedback_log.py), blended into the rating term
+    - feedback_weight: Share of the rating term given to the feedback score
+    - topk_table: Optional TopKTable (topk_table.py), 'first' mode without feedback is answered from it when
+        enough of the anchor's precomputed products pass the filters
 
     Returns:
     - top_df: DataFrame of top recommended products
     """
 
+    if anchor not in ANCHOR_MODES:
+        raise ValueError(f"anchor must be one of {list(ANCHOR_MODES)}, got '{anchor}'")
+
     # Check if filtered_df is empty
     if filtered_df.empty:
         return ('No products found matching your preferences. Please adjust filters.')
-    
-    # Normalising the Rating field for calculation
-    scaler = MinMaxScaler()
-    df['Normalised Rating'] = scaler.fit_transform(df[['Rating']])
-
-    # Find first product_id of product after filtering
-    product_id = filtered_df['Product ID'].iloc[0]  
-    product_index = df[df['Product ID'] == product_id].index[0]
-
-    # Use this id to generate recommendations
-    cosine_sim = similarities[product_index, :].flatten()
-
-    # Combine similarity score with the ratings from the filtered DataFrame
-    combined_score = (alpha * cosine_sim) + ((1 - alpha) * df['Normalised Rating'])
-
-    # Create a DataFrame for the recommended products
-    sim_df = pd.DataFrame({
-        'Product ID': df['Product ID'],
-        'Combined Similarity': combined_score,
-        'Rating': df['Rating']
-    })
 
-    #Since I am filtering the dataset its probably best to bring back the first record, so commenting out line below
-    #sim_df = sim_df[sim_df['Product ID'] != product_id]
+    engine = get_engine(df, similarities)
+
+    with span('hybrid_recommender'):
+        # Catalogue positions of the filtered products
+        candidate_positions = df.index.get_indexer(filtered_df.index)
+        quality = engine.feedback_quality(feedback, feedback_weight) if feedback is not None else None
 
-    # Only keep products that are in the filtered DataFrame
-    sim_df = sim_df[sim_df['Product ID'].isin(filtered_df['Product ID'])]
-    
-    # Filter and sort to get the top recommendations
-    top_df = sim_df.sort_values(by='Combined Similarity', ascending=False).head(5)
-    top_df.reset_index(drop=True, inplace=True)
+        # A top_k index sums whole pruned rows whatever the columns, so probing would only cost recall there
+        if clusters is not None and n_probe is not None and getattr(similarities, 'mode', None) != 'top_k':
+            # Coarse pass: only the clusters nearest the anchors are scored
+            if anchor == 'first':
+                anchor_positions = candidate_positions[:1]
+            else:
+                anchor_positions = candidate_positions if anchor == 'centroid' else engine.top_rated(candidate_positions, n_anchors)
+            positions, _ = engine.top_k_probed(anchor_positions, candidate_positions, clusters, n_probe, alpha, k=5, quality=quality)
+        elif anchor == 'first':
+            #Since I am filtering the dataset its probably best to bring back the first record, so the anchor stays a candidate
+            materialised = None
+            if topk_table is not None and feedback is None:
+                materialised = engine.top_k_materialised(topk_table, candidate_positions[0], candidate_positions, alpha, k=5)
+            if materialised is not None:
+                positions, _ = materialised
+            else:
+                positions, _ = engine.top_k(candidate_positions[0], candidate_positions, alpha, k=5, quality=quality)
+        else:
+            # All anchors are scored in one pass, so this costs about the same as a single row
+            anchor_positions = candidate_positions if anchor == 'centroid' else engine.top_rated(candidate_positions, n_anchors)
+            positions, _ = engine.top_k_multi(anchor_positions, candidate_positions, alpha, k=5, quality=quality)
+
+    top_df = pd.DataFrame({
+        'Product ID': engine.product_ids[positions],
+        'Rating': engine.ratings[positions]
+    })
 
     # Adding tags to make link clickable
     top_df['Product URL'] = '<a href="https://www.amazon.co.uk/dp/' + top_df['Product ID'] + '" target="_blank">'+ top_df['Product ID'] + '</a>'
 
     return top_df[['Product ID', 'Rating', 'Product URL']]
+
+
+def batch_recommender(df, similarities, masks, alphas=0.6, anchor_positions=None, k=5, chunk_size=1024):
+    """
+    Recommends products for many saved preference profiles at once (e.g. a nightly precompute job).
+
+    Parameters:
+    - df: Unfiltered dataframe (not modified)
+    - similarities: Pre-made cosine similarity matrix or SimilarityIndex
+    - masks: Boolean array (P, N) or packed bitmaps of the products each profile's filters allow
+    - alphas: Scalar or array (P,) of weighting factors
+    - anchor_positions: Array (P,) of anchor catalogue positions, None uses each profile's first match like the app
+    - k: Number of products to return per profile
+    - chunk_size: Profiles scored together, bounds peak memory to about chunk_size x N floats
+
+    Returns:
+    - Tuple of (product_ids, scores) arrays of shape (P, k), padded with None / NaN when fewer than k products match
+    """
+    engine = get_engine(df, similarities)
+    with span('batch_recommender'):
+        positions, scores = engine.top_k_batch(anchor_positions, masks, alphas, k, chunk_size)
+
+    product_ids = np.where(positions >= 0, engine.product_ids[np.maximum(positions, 0)], None)
+    return product_ids, scores
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+import contextlib
+
+#-----------------------------------------
+# Opt-in Span Instrumentation
+#-----------------------------------------
+# Disabled unless SOUND_DECISIONS_METRICS=1 (or enable() is called), span() is then a shared no-op.
+# When enabled every span:
+#   - logs one JSON line to the 'sound_decisions.metrics' logger (stderr, or SOUND_DECISIONS_METRICS_LOG if set)
+#   - adds to a per-process histogram exported as Prometheus text by prometheus_text(), written to
+#     SOUND_DECISIONS_METRICS_FILE by export() and served on /metrics by api.py
+# Spans record wall time, resident memory before/after and the process peak RSS.
+
+ENABLED_ENV = 'SOUND_DECISIONS_METRICS'
+LOG_ENV = 'SOUND_DECISIONS_METRICS_LOG'
+FILE_ENV = 'SOUND_DECISIONS_METRICS_FILE'
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, float('inf'))
+
+logger = logging.getLogger('sound_decisions.metrics')
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+# (name, labels) -> {'count', 'sum', 'max', 'buckets', 'rss_delta'}
+_spans = {}
+
+
+def enable(log_path=None):
+    """
+    Turns instrumentation on for this process.
+
+    Parameters:
+    - log_path: File to append JSON span lines to, None logs to stderr
+    """
+    global _enabled
+    _enabled = True
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.FileHandler(log_path) if log_path else logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+
+def is_enabled():
+    return _enabled
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes (Linux /proc, otherwise the peak is returned).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+#-----------------------------------------
+# Spans
+#-----------------------------------------
+class _Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self.name)
+        self.rss_before = current_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        _local.stack.pop()
+        rss_after = current_rss()
+        _record(self.name, self.labels, seconds, rss_after - self.rss_before)
+        logger.info(json.dumps({
+            'span': self.name,
+            'labels': self.labels,
+            'parent': self.parent,
+            'seconds': round(seconds, 6),
+            'rss_bytes': rss_after,
+            'rss_delta_bytes': rss_after - self.rss_before,
+            'peak_rss_bytes': peak_rss(),
+            'pid': os.getpid(),
+            'ts': time.time()
+        }))
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name, **labels):
+    """
+    Context manager timing a block of code, a no-op unless instrumentation is enabled.
+
+    Parameters:
+    - name: Span name, e.g. 'load_catalogue'
+    - labels: Low-cardinality labels (e.g. artifact='final_data.parquet'), values are converted to strings
+
+    Returns:
+    - Context manager
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, {key: str(value) for key, value in labels.items()})
+
+
+def _record(name, labels, seconds, rss_delta):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        stats = _spans.get(key)
+        if stats is None:
+            stats = _spans[key] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(BUCKETS), 'rss_delta': 0}
+        stats['count'] += 1
+        stats['sum'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        stats['rss_delta'] += rss_delta
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+
+#-----------------------------------------
+# Export
+#-----------------------------------------
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _escape(value):
+    # Label values are arbitrary strings (e.g. artifact file names), the text format escapes \, " and newlines
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """
+    Returns the span histograms and memory gauges in the Prometheus text exposition format.
+    """
+    with _lock:
+        spans = {key: dict(stats, buckets=list(stats['buckets'])) for key, stats in _spans.items()}
+
+    lines = ['# HELP sound_decisions_span_seconds Time spent in instrumented spans.',
+             '# TYPE sound_decisions_span_seconds histogram']
+    for (name, labels), stats in sorted(spans.items()):
+        labels = (('span', name),) + labels
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"sound_decisions_span_seconds_bucket{_label_text(labels, [('le', le)])} {count}")
+        lines.append(f"sound_decisions_span_seconds_sum{_label_text(labels)} {stats['sum']}")
+        lines.append(f"sound_decisions_span_seconds_count{_label_text(labels)} {stats['count']}")
+
+    lines += ['# HELP sound_decisions_span_max_seconds Slowest call of each span.',
+              '# TYPE sound_decisions_span_max_seconds gauge']
+    lines += [f"sound_decisions_span_max_seconds{_label_text((('span', name),) + labels)} {stats['max']}"
+              for (name, labels), stats in sorted(spans.items())]
+
+    lines += ['# HELP sound_decisions_span_rss_delta_bytes Total change in resident memory across each span.',
+              '# TYPE sound_decisions_span_rss_delta_bytes counter']
+    lines += [f"sound_decisions_span_rss_delta_bytes{_label_text((('span', name),) + labels)} {stats['rss_delta']}"
+              for (name, labels), stats in sorted(spans.items())]
+
+    lines += ['# HELP sound_decisions_rss_bytes Resident memory of the process.',
+              '# TYPE sound_decisions_rss_bytes gauge',
+              f'sound_decisions_rss_bytes {current_rss()}',
+              '# HELP sound_decisions_peak_rss_bytes Peak resident memory of the process.',
+              '# TYPE sound_decisions_peak_rss_bytes gauge',
+              f'sound_decisions_peak_rss_bytes {peak_rss()}']
+    return '\n'.join(lines) + '\n'
+
+
+def export(path=None):
+    """
+    Writes prometheus_text() to path (default SOUND_DECISIONS_METRICS_FILE), e.g. for a textfile collector.
+    Does nothing when instrumentation is disabled or no path is configured.
+    """
+    path = path or os.environ.get(FILE_ENV)
+    if not _enabled or not path:
+        return
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+if os.environ.get(ENABLED_ENV, '').lower() in ('1', 'true', 'yes'):
+    enable(os.environ.get(LOG_ENV))
@@ -0,0 +1,272 @@
+import time
+import threading
+from numbers import Real
+import numpy as np
+from artifacts import (load_catalogue, load_catalogue_index, load_similarities, load_clusters, load_feedback,
+                       load_topk_table, artifact_version, source_signatures)
+from hybrid_recommender import hybrid_recommender, get_engine, ANCHOR_MODES
+from result_cache import ResultCache, canonical_preferences
+from feedback_log import shared_log
+from instrumentation import span
+
+# Only the columns the app filters on or displays are read (Description etc. stay on disk)
+CATALOGUE_COLUMNS = ['Product ID', 'Price', 'Rating', 'Battery Life', 'Is Prime', 'Wireless', 'Noise Cancelling',
+                     'Microphone', 'Foldable', 'Over Ear', 'Gaming', 'Colour_*']
+FEATURES = ['Is Prime', 'Wireless', 'Noise Cancelling', 'Microphone', 'Foldable', 'Over Ear', 'Gaming']
+
+#-----------------------------------------
+# Recommendation Engine
+#-----------------------------------------
+class RecommendationEngine:
+    """
+    Filter and ranking logic behind the Streamlit page and the HTTP service, independent of any UI.
+
+    Artifacts are loaded through the process-wide artifact cache and swapped in as one snapshot when
+    the catalogue or similarity model changes on disk (checked at most every check_interval seconds).
+    Results are cached per canonical preference set and artifact version, in a ResultCache of the engine's
+    own unless one is passed (share one only between engines over the same artifacts). shared_engine gives
+    every Streamlit session of the process the same engine, and so the same cache.
+
+    With n_probe set and a cluster index in model_dir (scripts/03c-cluster-index.py), only the products in
+    the anchors' cluster and its n_probe - 1 nearest clusters are scored. None scores every matching product,
+    as does a top_k similarity index, where probing saves no work.
+
+    Once feedback has been compacted into model_dir (feedback_log.py) it is blended into the rating term with
+    feedback_weight. Every recommendation returned is logged as an impression to feedback_log when one is given.
+    """
+
+    def __init__(self, catalogue_path='../data/final_data.csv', model_dir='../model', cache=None,
+                 check_interval=1.0, n_probe=None, feedback_weight=0.2, feedback_log=None):
+        self.catalogue_path = catalogue_path
+        self.model_dir = model_dir
+        self.cache = cache if cache is not None else ResultCache(max_size=1024, ttl=600)
+        self.check_interval = check_interval
+        self.n_probe = n_probe
+        self.feedback_weight = feedback_weight
+        self.feedback_log = feedback_log
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._snapshot = None
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """
+        Reloads the artifacts if they changed on disk since the last check.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            # Read before loading so results are never cached under a newer version than their data
+            version = artifact_version(self.catalogue_path, self.model_dir)
+            if force or self._snapshot is None or version != self._snapshot[0]:
+                with span('refresh_artifacts'):
+                    df = load_catalogue(self.catalogue_path, CATALOGUE_COLUMNS)
+                    catalogue_index = load_catalogue_index(self.catalogue_path, CATALOGUE_COLUMNS)
+                    similarities = load_similarities(self.model_dir)
+                    clusters = load_clusters(self.model_dir)
+                    feedback = load_feedback(self.model_dir)
+                    topk_table = load_topk_table(self.model_dir)
+                    # Only used with the catalogue and similarity model it was built from (see TopKTable)
+                    if topk_table is not None and topk_table.sources != source_signatures(version):
+                        topk_table = None
+                    # Precompute the scoring state now rather than on the first request
+                    get_engine(df, similarities)
+                self._snapshot = (version, df, catalogue_index, similarities, clusters, feedback, topk_table)
+            self._checked = now
+
+    @property
+    def version(self):
+        return self._snapshot[0]
+
+    @property
+    def df(self):
+        return self._snapshot[1]
+
+    @property
+    def similarities(self):
+        return self._snapshot[3]
+
+    @property
+    def colours(self):
+        """
+        Colour names that can be filtered on.
+        """
+        return [column.replace('Colour_', '') for column in self.df.columns if column.startswith('Colour_')]
+
+    def filter(self, preferences, snapshot=None):
+        """
+        Returns the catalogue rows matching a set of preferences.
+
+        Parameters:
+        - preferences: Dictionary as accepted by parse_preferences
+        - snapshot: Artifacts to filter, defaults to the current ones
+
+        Returns:
+        - DataFrame of matching products
+        """
+        _, df, catalogue_index, *_ = snapshot or self._snapshot
+        preferences = parse_preferences(preferences, [column for column in df.columns if column.startswith('Colour_')])
+
+        ranges = {}
+        for column, key in [('Price', 'price_range'), ('Rating', 'rating'), ('Battery Life', 'battery_life')]:
+            bounds = preferences[key] if key == 'price_range' else (preferences[key], None)
+            # Products with a missing value are only excluded when the column is actually filtered on
+            if bounds != (None, None):
+                ranges[column] = bounds
+
+        with span('filter'):
+            bitmap = catalogue_index.match(
+                flags=preferences['features'],
+                ranges=ranges,
+                # Products matching any of the selected colours
+                any_flags=[f'Colour_{colour}' for colour in preferences['colours']]
+            )
+            return df.iloc[catalogue_index.rows(bitmap)]
+
+    def recommend(self, preferences):
+        """
+        Recommends products for a set of preferences, reusing cached results for identical requests.
+
+        Parameters:
+        - preferences: Dictionary as accepted by parse_preferences
+
+        Returns:
+        - DataFrame of top recommended products, or a message when nothing matches the filters
+        """
+        with span('recommend'):
+            self.refresh()
+            snapshot = self._snapshot
+            version, df, _, similarities, clusters, feedback, topk_table = snapshot
+            parsed = parse_preferences(preferences, [column for column in df.columns if column.startswith('Colour_')])
+            key = canonical_preferences(parsed['features'], parsed['price_range'], parsed['rating'],
+                                        parsed['battery_life'], parsed['colours'], parsed['alpha'], parsed['anchor'])
+            # Probed and feedback-weighted results differ from plain ones, so they are cached separately
+            recommended_products = self.cache.get_or_compute(
+                (key, self.n_probe, self.feedback_weight), version,
+                lambda: hybrid_recommender(df, self.filter(parsed, snapshot), similarities, parsed['alpha'],
+                                           parsed['anchor'], clusters=clusters, n_probe=self.n_probe,
+                                           feedback=feedback, feedback_weight=self.feedback_weight, topk_table=topk_table))
+
+        # Only queued here, the log's writer thread does the I/O
+        if self.feedback_log is not None and not isinstance(recommended_products, str):
+            for product_id in recommended_products['Product ID']:
+                self.feedback_log.record(product_id, 'impression', alpha=parsed['alpha'], anchor=parsed['anchor'])
+        return recommended_products
+
+    def record_feedback(self, product_id, event, **fields):
+        """
+        Logs a like/dislike (or impression) for a product, see FeedbackLog.record.
+
+        Raises:
+        - ValueError for an unknown event or a product not in the catalogue, or when there is no feedback log
+        """
+        if self.feedback_log is None:
+            raise ValueError('This engine has no feedback log')
+        if not (self.df['Product ID'] == product_id).any():
+            raise ValueError(f"Unknown product '{product_id}'")
+        return self.feedback_log.record(product_id, event, **fields)
+
+
+#-----------------------------------------
+# Helper Functions
+#-----------------------------------------
+def _check_number(key, value):
+    if value is not None and (isinstance(value, bool) or not isinstance(value, Real)):
+        raise ValueError(f"'{key}' must be a number")
+    return value
+
+
+def parse_preferences(preferences, colour_columns):
+    """
+    Validates a preference dictionary and fills in defaults.
+
+    Parameters:
+    - preferences: Dictionary with any of
+        features (list of FEATURES that must be present), price_range ([min, max], either can be null),
+        rating (minimum), battery_life (minimum hours), colours (list, any may match), alpha (0-1, default 0.6),
+        anchor (one of ANCHOR_MODES, default 'first')
+    - colour_columns: Colour_* columns of the catalogue
+
+    Returns:
+    - Dictionary with every key set, missing filters are None / empty
+
+    Raises:
+    - ValueError describing the first invalid field
+    """
+    if not isinstance(preferences, dict):
+        raise ValueError('Preferences must be a JSON object')
+
+    features = preferences.get('features', [])
+    if isinstance(features, dict):
+        features = [feature for feature, selected in features.items() if selected]
+    if not isinstance(features, (list, tuple)):
+        raise ValueError("'features' must be a list")
+    unknown = [feature for feature in features if feature not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}, expected any of {FEATURES}")
+
+    price_range = preferences.get('price_range') or (None, None)
+    if not isinstance(price_range, (list, tuple)) or len(price_range) != 2:
+        raise ValueError("'price_range' must be [min, max]")
+    price_range = tuple(_check_number('price_range', bound) for bound in price_range)
+
+    colours = preferences.get('colours', [])
+    if not isinstance(colours, (list, tuple)):
+        raise ValueError("'colours' must be a list")
+    unknown = [colour for colour in colours if f'Colour_{colour}' not in colour_columns]
+    if unknown:
+        raise ValueError(f"Unknown colours {unknown}")
+
+    alpha = _check_number('alpha', preferences.get('alpha', 0.6))
+    if alpha is None or not 0 <= alpha <= 1:
+        raise ValueError("'alpha' must be between 0 and 1")
+
+    anchor = preferences.get('anchor', 'first')
+    if anchor not in ANCHOR_MODES:
+        raise ValueError(f"'anchor' must be one of {list(ANCHOR_MODES)}")
+
+    return {
+        'features': list(features),
+        'price_range': price_range,
+        'rating': _check_number('rating', preferences.get('rating')),
+        'battery_life': _check_number('battery_life', preferences.get('battery_life')),
+        'colours': list(colours),
+        'alpha': alpha,
+        'anchor': anchor
+    }
+
+
+def random_preferences(df, n_queries, seed=0):
+    """
+    Draws preference sets like the app's widgets produce (benchmarks and top-k table checks).
+    """
+    rng = np.random.default_rng(seed)
+    colours = [column.replace('Colour_', '') for column in df.columns if column.startswith('Colour_')]
+    preferences = []
+    for _ in range(n_queries):
+        low = float(rng.choice([0.0, 20.0, 50.0]))
+        preferences.append({
+            'features': [feature for feature in ['Is Prime', 'Wireless', 'Noise Cancelling', 'Gaming'] if rng.random() < 0.25],
+            'price_range': (low, low + float(rng.choice([50.0, 150.0, 400.0]))),
+            'rating': float(rng.choice([1.0, 3.5, 4.0])),
+            'battery_life': int(rng.choice([0, 10, 20])),
+            'colours': list(rng.choice(colours, size=rng.integers(0, 3), replace=False)),
+            'alpha': float(rng.choice([0.2, 0.6, 1.0]))
+        })
+    return preferences
+
+
+# One engine per (catalogue, model) in the process, Streamlit re-runs app.py but this module stays loaded
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def shared_engine(catalogue_path='../data/final_data.csv', model_dir='../model', n_probe=None,
+                  feedback_dir='../data/feedback'):
+    with _engines_lock:
+        key = (catalogue_path, model_dir, n_probe, feedback_dir)
+        if key not in _engines:
+            _engines[key] = RecommendationEngine(catalogue_path, model_dir, n_probe=n_probe,
+                                                 feedback_log=shared_log(feedback_dir) if feedback_dir else None)
+        return _engines[key]
@@ -0,0 +1,133 @@
+import time
+import threading
+from collections import OrderedDict
+
+#-----------------------------------------
+# Recommendation Result Cache
+#-----------------------------------------
+class ResultCache:
+    """
+    Thread-safe LRU cache of recommendation results with a time-to-live.
+
+    Entries are keyed by a canonical preference tuple and belong to one artifact version. When a
+    lookup arrives with a different version (catalogue or similarity model rebuilt) every entry is
+    dropped, so results computed from old artifacts are never served. There is a single version slot,
+    so each RecommendationEngine has its own cache: engines over other artifacts would clear it on every call.
+    """
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        # Caller holds the lock
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        """
+        Returns the cached result for key, or None on a miss (missing, expired or from an older version).
+        """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, version, compute):
+        """
+        Returns the cached result for key, calling compute() and caching its result on a miss.
+
+        Parameters:
+        - key: Canonical preference tuple (see canonical_preferences), with any engine settings the result depends on
+        - version: Artifact version the result depends on (see artifacts.artifact_version)
+        - compute: Function with no arguments producing the result
+
+        Returns:
+        - Result, callers must not modify it in place as it is shared between sessions
+        """
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+#-----------------------------------------
+# Helper Functions
+#-----------------------------------------
+def canonical_preferences(features, price_range, rating, battery_life, colours, alpha, anchor='first'):
+    """
+    Builds a hashable key that is identical for identical preference combinations.
+
+    Parameters:
+    - features: Selected feature names, or dictionary of feature name -> selected checkbox value
+    - price_range: Tuple of (min, max) price, either can be None
+    - rating: Minimum rating or None
+    - battery_life: Minimum battery life in hours or None
+    - colours: Selected colours, in any order
+    - alpha: Weighting factor for combining feature similarity and rating
+    - anchor: Anchor mode passed to hybrid_recommender
+
+    Returns:
+    - Tuple key. Numbers are kept exact (as floats, so 4 and 4.0 match): the filters run on the exact values,
+      so rounding them here would let e.g. a rating of 4.04 share the cached result of 4.0
+    """
+    if isinstance(features, dict):
+        features = [feature for feature, selected in features.items() if selected]
+    return (
+        tuple(sorted(set(features))),
+        (_number(price_range[0]), _number(price_range[1])),
+        _number(rating),
+        _number(battery_life),
+        tuple(sorted(set(colours))),
+        _number(alpha),
+        anchor
+    )
+
+
+def _number(value):
+    return None if value is None else float(value)
+
@@ -0,0 +1,303 @@
+import time
+import numpy as np
+import joblib
+from scipy import sparse
+
+#-----------------------------------------
+# Similarity Index
+#-----------------------------------------
+class SimilarityIndex:
+    """
+    Answers cosine similarity row queries on demand instead of storing the full N x N matrix.
+
+    Two storage modes are supported:
+    - exact: L2-normalised feature vectors, a row is computed as vectors @ vectors[i] (N x F memory)
+    - top_k: pruned neighbour list per product stored as a CSR matrix, products outside a row's
+      top k neighbours get a similarity of 0 (N x k memory)
+
+    product_ids optionally records the Product ID of each row, so a catalogue can be matched to the
+    index by ID rather than by position (e.g. after an incremental build).
+    """
+
+    def __init__(self, vectors=None, neighbours=None, product_ids=None):
+        if (vectors is None) == (neighbours is None):
+            raise ValueError('SimilarityIndex needs exactly one of vectors or neighbours.')
+        self.vectors = vectors
+        self.neighbours = neighbours
+        self.product_ids = product_ids
+
+    @property
+    def mode(self):
+        return 'exact' if self.vectors is not None else 'top_k'
+
+    @property
+    def n_products(self):
+        store = self.vectors if self.vectors is not None else self.neighbours
+        return store.shape[0]
+
+    @property
+    def nbytes(self):
+        store = self.vectors if self.vectors is not None else self.neighbours
+        return _nbytes(store)
+
+    @classmethod
+    def from_features(cls, features, top_k=None, block_size=1024):
+        """
+        Builds an index from a feature matrix (e.g. the TF-IDF + scaled features in the recommender notebook).
+
+        Parameters:
+        - features: Dense array, sparse matrix or DataFrame with one row per product
+        - top_k: Number of neighbours to keep per product, None keeps the normalised vectors (exact)
+        - block_size: Number of rows scored at once when pruning, bounds peak memory to block_size x N
+
+        Returns:
+        - SimilarityIndex
+        """
+        vectors = _l2_normalise(features)
+        if top_k is None:
+            return cls(vectors=vectors)
+
+        n_products = vectors.shape[0]
+        top_k = min(top_k, n_products)
+        rows, cols, vals = [], [], []
+        for start in range(0, n_products, block_size):
+            block = vectors[start:start + block_size] @ vectors.T
+            block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+            block_cols, block_vals = _top_k_per_row(block, top_k)
+            rows.append(np.repeat(np.arange(start, start + block.shape[0]), top_k))
+            cols.append(block_cols.ravel())
+            vals.append(block_vals.ravel())
+
+        neighbours = sparse.csr_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n_products, n_products), dtype=np.float32)
+        return cls(neighbours=neighbours)
+
+    @classmethod
+    def from_matrix(cls, similarities, top_k):
+        """
+        Prunes an existing all-pairs similarity matrix (e.g. cosine_similarity_matrix.joblib) to top-k lists.
+
+        Parameters:
+        - similarities: Dense or sparse N x N similarity matrix
+        - top_k: Number of neighbours to keep per product
+
+        Returns:
+        - SimilarityIndex
+        """
+        dense = similarities.toarray() if sparse.issparse(similarities) else np.asarray(similarities)
+        top_k = min(top_k, dense.shape[0])
+        cols, vals = _top_k_per_row(dense, top_k)
+        rows = np.repeat(np.arange(dense.shape[0]), top_k)
+        neighbours = sparse.csr_matrix(
+            (vals.ravel(), (rows, cols.ravel())), shape=dense.shape, dtype=np.float32)
+        return cls(neighbours=neighbours)
+
+    def row(self, product_index):
+        """
+        Returns the similarity of product_index to every product as a dense 1-D float32 array.
+        """
+        if self.vectors is not None:
+            query = self.vectors[product_index]
+            if sparse.issparse(query):
+                query = query.toarray()
+            return np.asarray(self.vectors @ np.ravel(query), dtype=np.float32)
+
+        # Read the CSR arrays directly, slicing a row out of a csr_matrix is much slower
+        row = np.zeros(self.neighbours.shape[1], dtype=np.float32)
+        start, end = self.neighbours.indptr[product_index], self.neighbours.indptr[product_index + 1]
+        row[self.neighbours.indices[start:end]] = self.neighbours.data[start:end]
+        return row
+
+    def rows(self, product_indices):
+        """
+        Returns the similarity rows for several products as a dense (len(product_indices), N) float32 array.
+        """
+        product_indices = np.asarray(product_indices)
+        if self.vectors is not None:
+            queries = self.vectors[product_indices]
+            rows = queries @ self.vectors.T
+        else:
+            rows = self.neighbours[product_indices]
+        if sparse.issparse(rows):
+            rows = rows.toarray()
+        return np.asarray(rows, dtype=np.float32)
+
+    def mean_row(self, product_indices):
+        """
+        Returns the mean similarity of every product to several products as a dense 1-D float32 array.
+
+        In exact mode this is a single product with the mean of their vectors (the dot product is linear),
+        so it costs one row whatever the number of products. In top_k mode their pruned rows are summed.
+        """
+        product_indices = np.asarray(product_indices)
+        if self.vectors is not None:
+            centroid = np.asarray(self.vectors[product_indices].mean(axis=0), dtype=np.float32)
+            return np.asarray(self.vectors @ np.ravel(centroid), dtype=np.float32)
+        return np.asarray(self.neighbours[product_indices].mean(axis=0), dtype=np.float32).ravel()
+
+    def mean_row_at(self, product_indices, columns):
+        """
+        Returns mean_row(product_indices) for the given columns only, e.g. the products of a few clusters.
+
+        In exact mode only those columns' vectors are multiplied, so the cost scales with len(columns)
+        (past half the catalogue gathering the vectors costs more than scoring them all). In top_k mode
+        the full rows are built and then indexed, so fewer columns save nothing.
+        """
+        product_indices, columns = np.asarray(product_indices), np.asarray(columns)
+        if self.vectors is not None:
+            centroid = np.ravel(np.asarray(self.vectors[product_indices].mean(axis=0), dtype=np.float32))
+            if 2 * len(columns) > self.n_products:
+                return np.asarray(self.vectors @ centroid, dtype=np.float32).ravel()[columns]
+            return np.asarray(self.vectors[columns] @ centroid, dtype=np.float32).ravel()
+        if len(product_indices) == 1:
+            return self.row(product_indices[0])[columns]
+        return self.mean_row(product_indices)[columns]
+
+    def save(self, path):
+        joblib.dump({'vectors': self.vectors, 'neighbours': self.neighbours, 'product_ids': self.product_ids}, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        stored = joblib.load(path, mmap_mode=mmap_mode)
+        return cls(vectors=stored['vectors'], neighbours=stored['neighbours'], product_ids=stored.get('product_ids'))
+
+
+#-----------------------------------------
+# Helper Functions
+#-----------------------------------------
+def similarity_row(similarities, product_index, allowed=None):
+    """
+    Returns one row of similarities as a flat array for either a SimilarityIndex or an N x N matrix.
+
+    allowed optionally lists the rows the caller will use, approximate backends (see ann_index.py) only score those.
+    """
+    if getattr(similarities, 'approximate', False):
+        return similarities.row(product_index, allowed)
+    if isinstance(similarities, SimilarityIndex):
+        return similarities.row(product_index)
+    row = similarities[product_index, :]
+    if sparse.issparse(row):
+        row = row.toarray()
+    return np.asarray(row).ravel()
+
+
+def similarity_rows(similarities, product_indices, allowed=None):
+    """
+    Returns several rows of similarities as a 2-D array for either a SimilarityIndex or an N x N matrix.
+    """
+    if getattr(similarities, 'approximate', False):
+        return similarities.rows(product_indices, allowed)
+    if isinstance(similarities, SimilarityIndex):
+        return similarities.rows(product_indices)
+    rows = similarities[np.asarray(product_indices)]
+    if sparse.issparse(rows):
+        rows = rows.toarray()
+    return np.asarray(rows)
+
+
+def similarity_mean(similarities, product_indices, allowed=None):
+    """
+    Returns the mean of several rows of similarities as a flat array for either a SimilarityIndex or an N x N matrix.
+    """
+    if getattr(similarities, 'approximate', False):
+        return similarities.mean_row(product_indices, allowed)
+    if isinstance(similarities, SimilarityIndex):
+        return similarities.mean_row(product_indices)
+    rows = similarities[np.asarray(product_indices)]
+    if sparse.issparse(rows):
+        return np.asarray(rows.mean(axis=0)).ravel()
+    return np.asarray(rows).mean(axis=0)
+
+
+def similarity_mean_at(similarities, product_indices, columns):
+    """
+    Returns the mean of several rows of similarities restricted to some columns, for any similarity structure.
+    """
+    if getattr(similarities, 'approximate', False):
+        return similarities.mean_row(product_indices, columns)[np.asarray(columns)]
+    if isinstance(similarities, SimilarityIndex):
+        return similarities.mean_row_at(product_indices, columns)
+    block = similarities[np.asarray(product_indices)][:, np.asarray(columns)]
+    if sparse.issparse(block):
+        return np.asarray(block.mean(axis=0)).ravel()
+    return np.asarray(block).mean(axis=0)
+
+
+def compare_with_matrix(index, similarities, n_queries=100, random_state=1):
+    """
+    Compares memory and per-row latency of a SimilarityIndex against the all-pairs matrix.
+
+    Parameters:
+    - index: SimilarityIndex to evaluate
+    - similarities: The N x N matrix the index replaces
+    - n_queries: Number of random rows to time
+    - random_state: Seed used to pick the rows
+
+    Returns:
+    - Dictionary with bytes, mean row latency (microseconds) and max absolute error on the sampled rows
+    """
+    rng = np.random.default_rng(random_state)
+    queries = rng.integers(0, index.n_products, size=n_queries)
+
+    start = time.perf_counter()
+    matrix_rows = [similarity_row(similarities, i) for i in queries]
+    matrix_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_rows = [index.row(i) for i in queries]
+    index_time = time.perf_counter() - start
+
+    max_error = max(float(np.abs(m - i).max()) for m, i in zip(matrix_rows, index_rows))
+
+    return {
+        'mode': index.mode,
+        'n_products': index.n_products,
+        'matrix_bytes': _nbytes(similarities),
+        'index_bytes': index.nbytes,
+        'matrix_row_us': matrix_time / n_queries * 1e6,
+        'index_row_us': index_time / n_queries * 1e6,
+        'max_abs_error': max_error
+    }
+
+
+def _l2_normalise(features):
+    if hasattr(features, 'values') and not sparse.issparse(features):
+        features = features.values
+    if sparse.issparse(features):
+        features = sparse.csr_matrix(features, dtype=np.float32)
+        norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms).astype(np.float32) @ features
+    features = np.asarray(features, dtype=np.float32)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return features / norms
+
+
+def _top_k_per_row(block, top_k):
+    # argpartition keeps this O(N) per row rather than a full sort
+    cols = np.argpartition(-block, top_k - 1, axis=1)[:, :top_k]
+    vals = np.take_along_axis(block, cols, axis=1)
+    return cols, vals
+
+
+def _nbytes(store):
+    if sparse.issparse(store):
+        store = store.tocsr()
+        return store.data.nbytes + store.indices.nbytes + store.indptr.nbytes
+    return np.asarray(store).nbytes
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    matrix_path = '../model/cosine_similarity_matrix.joblib'
+    index_path = '../model/similarity_index.joblib'
+    top_k = 50
+
+    # Prune the existing matrix into a top-k index and report the savings
+    cosine_sim = joblib.load(matrix_path)
+    index = SimilarityIndex.from_matrix(cosine_sim, top_k=top_k)
+    print(compare_with_matrix(index, cosine_sim))
+
+    index.save(index_path)
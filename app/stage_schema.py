@@ -0,0 +1,37 @@
+import json
+import numpy as np
+
+#-----------------------------------------
+# Stage Precision Metadata
+#-----------------------------------------
+# scripts/stage_store.py writes Price/Rating as float32 and records the decimals they were rounded to in the
+# Parquet schema metadata. Readers (the pipeline stages and the app's catalogue loader) round them back to
+# the float64 values they came from, so range filters such as Rating >= 4.1 stay exact.
+METADATA_KEY = b'sound_decisions'
+
+
+def precision_metadata(decimals):
+    """
+    Returns the schema metadata entry recording the decimals of float32 columns, e.g. {'Price': 2}.
+    """
+    return {METADATA_KEY: json.dumps({'float32_decimals': decimals}).encode()}
+
+
+def restore_precision(df, schema):
+    """
+    Rounds float32 columns written with known decimals back to the float64 values they came from.
+
+    Parameters:
+    - df: DataFrame read from a Parquet file
+    - schema: pyarrow schema of that file, files without the metadata are returned unchanged
+
+    Returns:
+    - df, with the recorded columns as float64
+    """
+    metadata = (schema.metadata or {}).get(METADATA_KEY)
+    if metadata is None:
+        return df
+    for column, decimals in json.loads(metadata)['float32_decimals'].items():
+        if column in df.columns:
+            df[column] = df[column].astype(np.float64).round(decimals)
+    return df
@@ -0,0 +1,157 @@
+import time
+import numpy as np
+import joblib
+
+# Values of the app's alpha slider (0.0 - 1.0, step 0.1)
+ALPHA_STEPS = np.round(np.linspace(0.0, 1.0, 11), 1)
+
+#-----------------------------------------
+# Materialised Top-k Table
+#-----------------------------------------
+class TopKTable:
+    """
+    Precomputed unfiltered top-k of every anchor product at every alpha step, shape (products, alphas, k).
+
+    The app's 'first' anchor mode ranks the filtered products by alpha * similarity to the anchor +
+    (1 - alpha) * normalised rating. That order doesn't depend on the filters, so the filtered top 5 is the
+    first 5 products of the anchor's unfiltered list that pass the filters, as long as 5 of them do. Otherwise
+    the caller falls back to live scoring. Loaded memory-mapped, a lookup only reads one row of k entries.
+
+    The table is only valid for the ratings and similarity model it was built from: ratings_digest is checked
+    by RecommenderEngine.top_k_materialised and sources (the artifact signatures of the catalogue and
+    similarity model) by RecommendationEngine, so a rebuilt or republished artifact is never served stale.
+    """
+
+    def __init__(self, positions, scores, alphas, product_ids=None, ratings_digest=None, sources=None):
+        self.positions = positions
+        self.scores = scores
+        self.alphas = np.asarray(alphas, dtype=float)
+        self.product_ids = product_ids
+        self.ratings_digest = ratings_digest
+        self.sources = sources
+
+    @property
+    def n_products(self):
+        return self.positions.shape[0]
+
+    @property
+    def k(self):
+        return self.positions.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.scores.nbytes
+
+    @classmethod
+    def from_engine(cls, engine, alphas=ALPHA_STEPS, k=50, chunk_size=512):
+        """
+        Scores every anchor at every alpha with RecommenderEngine.top_k_alphas, chunk_size anchors at a time.
+
+        Parameters:
+        - engine: RecommenderEngine of the catalogue the app serves (same rows and rating normalisation)
+        - alphas: Alpha values to precompute
+        - k: Products kept per anchor and alpha, more raise the share of filtered queries served from the table
+        - chunk_size: Anchors scored at once, bounds peak memory to about chunk_size x N floats
+
+        Returns:
+        - TopKTable, positions padded with -1 when fewer than k products can be ranked
+        """
+        n_products = len(engine.product_ids)
+        k = min(k, n_products)
+        positions = np.full((n_products, len(alphas), k), -1, dtype=np.int32)
+        scores = np.full((n_products, len(alphas), k), np.nan, dtype=np.float32)
+
+        for start in range(0, n_products, chunk_size):
+            end = min(start + chunk_size, n_products)
+            positions[start:end], scores[start:end] = engine.top_k_alphas(np.arange(start, end), alphas, k)
+        return cls(positions, scores, alphas, engine.product_ids, engine.ratings_digest)
+
+    def alpha_index(self, alpha):
+        """
+        Returns the column of an alpha value, None when it wasn't precomputed.
+        """
+        matches = np.flatnonzero(np.abs(self.alphas - alpha) <= 1e-9)
+        return int(matches[0]) if len(matches) else None
+
+    def lookup(self, anchor_position, alpha, allowed, k=5):
+        """
+        Returns the top k allowed products of an anchor from the table.
+
+        Parameters:
+        - anchor_position: Catalogue position of the anchor
+        - alpha: Weighting factor, must be one of the table's alphas
+        - allowed: Boolean array over catalogue positions of the products passing the filters
+        - k: Number of products to return
+
+        Returns:
+        - Tuple of (positions, scores) best first, or None when the table can't answer exactly
+          (alpha not precomputed, or fewer than k allowed products ranked above the table's last score)
+        """
+        column = self.alpha_index(alpha)
+        if column is None or k > self.k:
+            return None
+        positions = np.asarray(self.positions[anchor_position, column])
+        scores = np.asarray(self.scores[anchor_position, column])
+        ranked = positions >= 0
+
+        passing = np.flatnonzero(ranked & allowed[np.maximum(positions, 0)])
+        if len(passing) < k:
+            return None
+        passing = passing[:k]
+        # Products outside a full list can score as high as its last entry, so a tie there is answered live
+        if ranked.all() and not scores[passing[-1]] > scores[-1]:
+            return None
+        return positions[passing].astype(np.int64), scores[passing].astype(float)
+
+    def save(self, path):
+        joblib.dump({'positions': self.positions, 'scores': self.scores, 'alphas': self.alphas,
+                     'product_ids': self.product_ids, 'ratings_digest': self.ratings_digest,
+                     'sources': self.sources}, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        stored = joblib.load(path, mmap_mode=mmap_mode)
+        return cls(stored['positions'], stored['scores'], stored['alphas'], stored.get('product_ids'),
+                   stored.get('ratings_digest'), stored.get('sources'))
+
+
+#-----------------------------------------
+# Helper Functions
+#-----------------------------------------
+def compare_with_live(engine, table, candidate_sets, alpha=0.6, k=5):
+    """
+    Measures how many filtered 'first' mode queries the table answers and checks them against live scoring.
+
+    Parameters:
+    - engine: RecommenderEngine the table was built from
+    - table: TopKTable to evaluate
+    - candidate_sets: List of arrays of catalogue positions passing each query's filters (anchor first)
+    - alpha: Weighting factor of every query
+    - k: Number of recommendations compared
+
+    Returns:
+    - Dictionary with the share of queries answered from the table, the share of those identical to live
+      scoring and the mean latency of both (microseconds)
+    """
+    hits, matches, live_time, lookup_time = 0, 0, 0.0, 0.0
+    for candidates in candidate_sets:
+        start = time.perf_counter()
+        live, _ = engine.top_k(candidates[0], candidates, alpha, k)
+        live_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        materialised = engine.top_k_materialised(table, candidates[0], candidates, alpha, k)
+        lookup_time += time.perf_counter() - start
+
+        if materialised is not None:
+            hits += 1
+            matches += np.array_equal(materialised[0], live)
+    return {
+        'n_queries': len(candidate_sets),
+        'k': table.k,
+        'hit_rate': hits / len(candidate_sets),
+        'match_rate': matches / hits if hits else None,
+        'live_us': live_time / len(candidate_sets) * 1e6,
+        'lookup_us': lookup_time / len(candidate_sets) * 1e6,
+        'table_bytes': table.nbytes
+    }
@@ -8,86 +8,233 @@
 import numpy as np
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
+import json
+import os
+from page_cache import PageCache
+from stage_store import write_stage
+from search_parser import parse_search_results, DEFAULT_PARSER
+
+import app_modules
+from instrumentation import span, export
+
+# Define the headers for the GET request to mimic a browser (avoids error)
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/117.0.5938.62"
+}
+
+# -----------------------------------------
+# Fetching helpers
+# -----------------------------------------
+class TokenBucket:
+    '''
+    Thread-safe token bucket rate limiter shared by all fetch workers
+
+    Parameters
+    ---------
+    rate: tokens added per second (i.e. sustained requests per second)
+    capacity: maximum burst size
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Block until a token is available
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size):
+    '''
+    Creates a requests session with a connection pool shared by all workers
+
+    Parameters
+    ---------
+    pool_size: number of connections kept open per host
+
+    Returns
+    -------
+    requests.Session
+    '''
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_page(session, url, rate_limiter, max_retries=3, backoff=2.0, timeout=30):
+    '''
+    Fetches a page, retrying with exponential backoff on errors and non-200 responses
+
+    Parameters
+    ---------
+    session: shared requests.Session
+    url: page to fetch
+    rate_limiter: TokenBucket every request (including retries) must pass through
+    max_retries: number of retries after the first attempt
+    backoff: base delay in seconds, doubled after each failed attempt
+    timeout: request timeout in seconds
+
+    Returns
+    -------
+    Page content as bytes, or None if every attempt failed
+    '''
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code == 200:
+                return response.content
+            print(f"Got status {response.status_code} for {url} (attempt {attempt + 1})")
+        except requests.RequestException as error:
+            print(f"Request failed for {url} (attempt {attempt + 1}): {error}")
+
+        if attempt < max_retries:
+            time.sleep(backoff * (2 ** attempt))
+
+    print(f"Failed to access the webpage: {url}")
+    return None
+
+# -----------------------------------------
+# Checkpoint helpers
+# -----------------------------------------
+def load_checkpoint(checkpoint_path):
+    '''
+    Reads pages already scraped by an interrupted run
+
+    Parameters
+    ---------
+    checkpoint_path: append-only JSONL file with one {"page", "products"} line per completed page
+
+    Returns
+    -------
+    Dictionary of page number -> list of products
+    '''
+    completed = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            for line in f:
+                # A crash can leave a half-written last line, that page is simply scraped again
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                completed[entry['page']] = entry['products']
+    return completed
+
+
+def append_checkpoint(checkpoint_path, page, products, lock):
+    with lock:
+        with open(checkpoint_path, 'a') as f:
+            f.write(json.dumps({'page': page, 'products': products}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
 
 # -----------------------------------------
 # Scraping function
 # -----------------------------------------
-def scrape_headphone_data(base_url, num_pages):
-    # To store scraped data
-    data = []
+def scrape_headphone_data(base_url, num_pages, max_workers=4, requests_per_second=1.0, burst=1, max_retries=3, backoff=2.0,
+                          cache=None, max_age=None, checkpoint_path=None, parser=DEFAULT_PARSER):
+    '''
+    Scrapes search result pages concurrently through a pooled session and a shared rate limit
 
-    # Loop through the number of pages to scrape
-    for page in range(num_pages):
+    Parameters
+    ---------
+    base_url: search URL the page number is appended to (can point at a local stub server)
+    num_pages: number of pages to scrape
+    max_workers: number of pages fetched in parallel, 1 scrapes sequentially
+    requests_per_second: sustained request rate across all workers
+    burst: number of requests allowed back to back before the rate applies
+    max_retries: retries per page after a failed attempt
+    backoff: base delay in seconds between retries
+    cache: optional PageCache, cached pages are parsed instead of refetched and new pages are stored
+    max_age: seconds a cached page stays valid for, None means cached pages never expire
+    checkpoint_path: optional append-only file of completed pages, pages already in it are skipped
+    parser: search_parser backend used to extract products ('lxml', 'strainer' or 'bs4')
+
+    Returns
+    -------
+    DataFrame of scraped products, in page order
+    '''
+    session = make_session(max_workers)
+    rate_limiter = TokenBucket(requests_per_second, burst)
+    completed = load_checkpoint(checkpoint_path)
+    checkpoint_lock = threading.Lock()
+
+    def scrape_page(page):
+        if page + 1 in completed:
+            return completed[page + 1]
 
         # Print the current page number being scraped
         print(f"Scraping page {page + 1}...")
 
         # Construct the URL for the current page
         url = base_url + str(page + 1)
-        
-        # Define the headers for the GET request to mimic a browser (avoids error)
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/117.0.5938.62"
-        }
-        
-        # Send a GET request to the URL with the headers
-        response = requests.get(url, headers=headers)
-        
-        # Check if the request was successful (status code = 200)
-        if response.status_code == 200:
-            # Use BeautifulSoup to 'read' content on page
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Extracts div storing all search results
-            all_headphones = soup.find_all('div', {'data-component-type': 's-search-result'})
-
-            # Loop through each product found to extract product details
-            for headphone in all_headphones:
-                # Getting product IDs
-                if headphone.has_attr('data-asin'):
-                    hp_ASIN = headphone['data-asin']
-                else:
-                    hp_ASIN = 'Not Specified'
-
-                # Getting product descriptions
-                desc = headphone.find('span', class_='a-size-medium a-color-base a-text-normal')
-                hp_desc = desc.get_text(strip=True) if desc else 'N/A'
-
-                # Getting product price
-                price_pound = headphone.find('span', class_='a-price-whole')
-                price_pennies = headphone.find('span', class_='a-price-fraction')
-
-                if price_pound and price_pennies:
-                    hp_price = price_pound.get_text(strip=True) + (price_pennies.get_text(strip=True))
-                else:
-                    hp_price = 'Not Specified'
-                
-                # Get overall rating
-                rating = headphone.find('span', class_='a-icon-alt')
-                hp_rating = rating.get_text(strip=True) if rating else 'N/A'
-
-                # Check if headphone is prime
-                prime = headphone.find('span', class_='aok-relative s-icon-text-medium s-prime')
-                is_prime = '1' if prime else '0'
-
-                # Add product info to list
-                data.append({
-                    'Product ID': hp_ASIN,
-                    'Description': hp_desc,
-                    'Price': hp_price,
-                    'Rating': hp_rating,
-                    'Is Prime': is_prime
-                })
-            
-            # Delay by 2 seconds after each page to avoid overwhelming the server
-            time.sleep(2)
 
-        else:
-            print(f"Failed to access the webpage: {url}")
+        content = cache.get(url, max_age) if cache is not None else None
+        if content is None:
+            with span('fetch_page'):
+                content = fetch_page(session, url, rate_limiter, max_retries, backoff)
+            if content is None:
+                return []
+            if cache is not None:
+                cache.put(url, content)
+
+        with span('parse_page'):
+            products = parse_search_results(content, parser)
+        if checkpoint_path:
+            append_checkpoint(checkpoint_path, page + 1, products, checkpoint_lock)
+        return products
+
+    # map keeps results in page order regardless of which page finishes first
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = list(executor.map(scrape_page, range(num_pages)))
+
+    session.close()
 
     # Return the scraped data in a dataframe
+    return pd.DataFrame([product for page in pages for product in page])
+
+
+def reparse_cached_pages(cache, base_url, num_pages, parser=DEFAULT_PARSER):
+    '''
+    Rebuilds the dataset from cached HTML without touching the network
+
+    Parameters
+    ---------
+    cache: PageCache filled by a previous scrape
+    base_url: search URL used for that scrape
+    num_pages: number of pages to rebuild
+    parser: search_parser backend used to extract products
+
+    Returns
+    -------
+    DataFrame of products from every cached page, in page order
+    '''
+    data = []
+    for page in range(num_pages):
+        content = cache.get(base_url + str(page + 1))
+        if content is None:
+            print(f"Page {page + 1} not in cache, skipping")
+            continue
+        data.extend(parse_search_results(content, parser))
     return pd.DataFrame(data)
 
 # Calling the above function
@@ -95,10 +242,27 @@ if __name__ == "__main__":
     # Defining params to pass in
     base_url = "https://www.amazon.co.uk/s?keywords=adult+headphones&i=electronics&page="
     num_pages = 50
+    cache = PageCache('../data/page_cache')
+    # Cached pages younger than a day are parsed instead of refetched
+    max_age = 24 * 60 * 60
+    checkpoint_path = '../data/post_scrape.checkpoint.jsonl'
+    # Set to True to rebuild post_scrape from cached pages only, e.g. after changing the parser
+    reparse_only = False
+
+    # Run function (spans are only recorded when SOUND_DECISIONS_METRICS=1, see app/instrumentation.py)
+    with span('scrape', reparse_only=reparse_only):
+        if reparse_only:
+            headphones_df = reparse_cached_pages(cache, base_url, num_pages)
+        else:
+            headphones_df = scrape_headphone_data(base_url, num_pages, cache=cache, max_age=max_age, checkpoint_path=checkpoint_path)
 
-    # Run function
-    headphones_df = scrape_headphone_data(base_url, num_pages)
+    # Export results to data file (../data/post_scrape.parquet)
+    with span('write_stage', stage='post_scrape'):
+        write_stage(headphones_df, 'post_scrape')
 
-    # Export results to data file
-    headphones_df.to_csv('../data/post_scrape.csv')
+    # Run finished, the next run starts a fresh checkpoint (recent cached pages are still reused)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
+    # Prometheus text to SOUND_DECISIONS_METRICS_FILE, if set
+    export()
@@ -10,7 +10,12 @@ import numpy as np
 import pandas as pd
 import re
 import matplotlib
-import spacy
+from stage_store import read_stage, write_stage
+from description_nlp import extract_brands, EntityCache
+from near_duplicates import drop_near_duplicates
+
+import app_modules
+from instrumentation import span, export
 
 def df_check(df):
     '''
@@ -41,28 +46,35 @@ def df_check(df):
         """
     )
 
-def clean_data(df):
+def clean_data(df, near_duplicate_threshold=0.8, canonical_path=None, check=True):
     '''
     Perform data cleaning on the given df.
 
     Parameters
     ---------
     df: Dataframe to clean and process
+    near_duplicate_threshold: Jaccard similarity of description shingles at or above which listings are
+                              near-duplicates (near_duplicates.py), only the first is kept. None keeps them all
+    canonical_path: optional CSV the Product ID -> Canonical ID mapping of the near-duplicates is written to
+    check: print df_check's data quality summary after each step (off for the chunks of run-pipeline.py)
 
     Returns
     -------
     Cleaned and processed data as a dataframe, ready for EDA
     '''
     # Check initial data quality
-    df_check(df)
+    if check:
+        df_check(df)
 
     # Remove duplicates
     df = df.drop_duplicates()
-    df_check(df)
+    if check:
+        df_check(df)
 
     # Drop rows with missing data
     df = df.dropna()
-    df_check(df)
+    if check:
+        df_check(df)
 
     # Remove 'Not Specified' from Price column
     df = df[df['Price'] != 'Not Specified']
@@ -71,18 +83,45 @@ def clean_data(df):
     # Clean Rating
     df['Rating'] = df['Rating'].astype('str').str.replace('out of 5 stars', '').astype(float)
 
+    # Remove near-duplicate listings (colour variants, re-listed ASINs)
+    if near_duplicate_threshold is not None:
+        with span('drop_near_duplicates'):
+            df, canonical = drop_near_duplicates(df, near_duplicate_threshold)
+        if canonical_path is not None:
+            canonical.to_csv(canonical_path, index=False)
+        if check:
+            df_check(df)
+
     # Reset the index
     df = df.reset_index(drop=True)
 
     return df
 
 if __name__ == "__main__":
-    # Load the data
-    df = pd.read_csv('../data/post_scrape.csv', index_col=0)
+    # Defining params to pass in
+    near_duplicate_threshold = 0.8
+    canonical_path = '../data/canonical_asins.csv'
 
-    # Clean the data
-    cleaned_df = clean_data(df)
+    # Load the data (spans are only recorded when SOUND_DECISIONS_METRICS=1, see app/instrumentation.py)
+    with span('read_stage', stage='post_scrape'):
+        df = read_stage('post_scrape')
 
-    # Export to CSV
-    cleaned_df.to_csv('../data/post_cleaning.csv')
+    # Clean the data
+    with span('clean_data'):
+        cleaned_df = clean_data(df, near_duplicate_threshold, canonical_path)
+
+    # Brand extraction with spaCy (description_nlp.py), off by default as the notebook drops Brand:
+    # most descriptions give Unknown Brand and many ORG entities are not brands
+    extract_brand = False
+    if extract_brand:
+        with span('extract_brands'):
+            cleaned_df['Brand'] = extract_brands(cleaned_df['Description'],
+                                                 cache=EntityCache('../data/description_entities.jsonl'))
+
+    # Export to Parquet
+    with span('write_stage', stage='post_cleaning'):
+        write_stage(cleaned_df, 'post_cleaning')
+
+    # Prometheus text to SOUND_DECISIONS_METRICS_FILE, if set
+    export()
 
@@ -11,10 +11,15 @@ import pandas as pd
 import re
 import matplotlib
 import spacy
+from stage_store import read_stage, write_stage
 from sklearn.preprocessing import OneHotEncoder
+
+import app_modules
+from instrumentation import span, export
 # -----------------------------------------
 # Extraction Functions
 # -----------------------------------------
+# Per-field reference versions, extract_features uses scan_description below
 
 def search_description(description, regexp):
     '''
@@ -66,6 +71,69 @@ def get_battery_life(description):
     return match.group(1) if match else 'Not Specified'
 
 
+# -----------------------------------------
+# Single-pass Extraction
+# -----------------------------------------
+# Same patterns as the calls in the original extract_features, compiled once into one alternation
+BINARY_FEATURES = {
+    'Wireless': r'\bwireless\b',
+    'Noise Cancelling': r'\bnoise[-\s]?cancelling\b',
+    'Microphone': r'\b(?:mic?|microphone?)\b',
+    'Over Ear': r'\b(?:over[\s-]ear?|overhead?)\b',
+    'Gaming': r'\bgaming\b',
+    'Foldable': r'\bfoldable\b'
+}
+# The unit is a lookahead: get_battery_life doesn't require a word boundary after it, so 'h' can be the
+# first letter of the next word ('2 hotpink'), which must still be scanned for colours and features
+BATTERY_REGEXP = r'\b(?P<battery>[1-9]\d*)(?=\s*(?:battery|batteries|hours?|hrs?|h))'
+
+# get_colour returns the first CSS4 colour (in dict order) found in the text, not the leftmost one.
+# Colour names are single words, so \bcolour\b matches exactly when some whole word equals the name:
+# any word no other pattern starts with is matched and looked up in a dict instead of trying ~148 regexes.
+COLOUR_RANKS = {colour: rank for rank, colour in enumerate(matplotlib.colors.CSS4_COLORS.keys())}
+COLOUR_NAMES = list(COLOUR_RANKS)
+WORD_REGEXP = r'\b(?P<word>\w+)'
+
+# Every alternative starts with \b, it is hoisted out so positions inside a word fail on a single check
+FEATURE_PATTERN = re.compile(r'\b(?:' + '|'.join(
+    [f'(?P<f{i}>{regexp[2:]})' for i, regexp in enumerate(BINARY_FEATURES.values())]
+    + [BATTERY_REGEXP[2:], WORD_REGEXP[2:]]
+) + ')')
+
+
+def scan_description(description):
+    '''
+    Extracts every description feature in one scan of a lowercase description
+
+    Parameters
+    ---------
+    description: string of product description, already lowercase
+
+    Returns
+    -------
+    Tuple of (binary flags in BINARY_FEATURES order, colour, battery life), matching
+    search_description, get_colour and get_battery_life
+    '''
+    flags = [0] * len(BINARY_FEATURES)
+    battery = 'Not Specified'
+    colour_rank = len(COLOUR_NAMES)
+
+    # Every pattern starts at the beginning of a word and the feature patterns are tried first,
+    # so the word fallback never hides a feature match
+    for match in FEATURE_PATTERN.finditer(description):
+        group = match.lastgroup
+        if group == 'word':
+            colour_rank = min(colour_rank, COLOUR_RANKS.get(match.group('word'), colour_rank))
+        elif group == 'battery':
+            if battery == 'Not Specified':
+                battery = match.group('battery')
+        else:
+            flags[int(group[1:])] = 1
+
+    colour = COLOUR_NAMES[colour_rank] if colour_rank < len(COLOUR_NAMES) else 'Not Specified'
+    return flags, colour, battery
+
+
 def extract_features(df):
     '''
     Perform feature extraction of product description from given dataframe.
@@ -82,20 +150,34 @@ def extract_features(df):
     # Set description to all lowercase first
     df['Description'] = df['Description'].str.lower()
 
-    # Extract Features using functions above
-    df['Wireless'] = df['Description'].apply(search_description, args=(r'\bwireless\b',))
-    df['Noise Cancelling'] = df['Description'].apply(search_description, args=(r'\bnoise[-\s]?cancelling\b',))
-    df['Colour'] = df['Description'].apply(get_colour)
-    df['Battery Life'] = df['Description'].apply(get_battery_life)
-    df['Microphone'] = df['Description'].apply(search_description, args=(r'\b(mic?|microphone?)\b',))
-    df['Over Ear'] = df['Description'].apply(search_description, args=(r'\b(over[\s-]ear?|overhead?)\b',))
-    df['Gaming'] = df['Description'].apply(search_description, args=(r'\bgaming\b',))
-    df['Foldable'] = df['Description'].apply(search_description, args=(r'\bfoldable\b',))
+    # One scan per description instead of one apply per feature
+    scanned = [scan_description(description) for description in df['Description']]
+    flags = np.array([row[0] for row in scanned], dtype=np.int64).reshape(len(scanned), len(BINARY_FEATURES))
+    features = {feature: flags[:, i] for i, feature in enumerate(BINARY_FEATURES)}
+    features['Colour'] = [row[1] for row in scanned]
+    features['Battery Life'] = [row[2] for row in scanned]
+
+    # Keep the original column order
+    for column in ['Wireless', 'Noise Cancelling', 'Colour', 'Battery Life', 'Microphone', 'Over Ear', 'Gaming', 'Foldable']:
+        df[column] = features[column]
 
     return df
 
 
-def clean_features(df):
+def clean_features(df, colour_counts=None):
+    '''
+    Cleans extracted features and one-hot encodes colour
+
+    Parameters
+    ---------
+    df: Dataframe output by extract_features
+    colour_counts: optional value_counts of Colour (after gray -> grey) over the whole catalogue,
+                   lets chunks of a larger catalogue be cleaned separately with the same grouping and columns
+
+    Returns
+    -------
+    Dataframe ready for EDA/recommender
+    '''
 
     # Known issue from notebooks
     df['Colour'] = df['Colour'].replace('gray', 'grey')
@@ -107,12 +189,16 @@ def clean_features(df):
     df['price_trans'] = np.log(df['Price'])
 
     # Fixing colour
-    colours_to_grp = df['Colour'].value_counts() < 10
+    if colour_counts is None:
+        colour_counts = df['Colour'].value_counts()
+    colours_to_grp = colour_counts < 10
     df['Colour'] = df['Colour'].replace(colours_to_grp[colours_to_grp].index, 'Other')
 
-    encoder = OneHotEncoder()
+    # Vocabulary comes from the counts so every chunk gets the same (sorted) colour columns
+    categories = sorted(set(colours_to_grp[~colours_to_grp].index) | ({'Other'} if colours_to_grp.any() else set()))
+    encoder = OneHotEncoder(categories=[categories])
     one_hot_encoded = encoder.fit_transform(df[['Colour']])
-    colour_df = pd.DataFrame(one_hot_encoded.toarray(),columns = encoder.get_feature_names_out(['Colour']))
+    colour_df = pd.DataFrame(one_hot_encoded.toarray(),columns = encoder.get_feature_names_out(['Colour']), index=df.index)
     # Step 4: Concatenate the original DataFrame and the one-hot encoded DataFrame
     df_final = pd.concat([df, colour_df], axis=1)
 
@@ -122,15 +208,22 @@ def clean_features(df):
     return (df_final)
 
 if __name__ == "__main__":
-    # Load the data
-    df = pd.read_csv('../data/post_cleaning.csv', index_col=0)
+    # Load the data (spans are only recorded when SOUND_DECISIONS_METRICS=1, see app/instrumentation.py)
+    with span('read_stage', stage='post_cleaning'):
+        df = read_stage('post_cleaning')
 
     # Clean the data
-    df_extra_features = extract_features(df)
+    with span('extract_features'):
+        df_extra_features = extract_features(df)
 
     # Clean features
-    final_df = clean_features(df_extra_features)
+    with span('clean_features'):
+        final_df = clean_features(df_extra_features)
+
+    # Export to Parquet
+    with span('write_stage', stage='final_df'):
+        write_stage(final_df, 'final_df')
 
-    # Export to CSV
-    final_df.to_csv('../data/final_df.csv')
+    # Prometheus text to SOUND_DECISIONS_METRICS_FILE, if set
+    export()
 
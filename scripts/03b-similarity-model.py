@@ -0,0 +1,183 @@
+# -----------------------------------------
+# Similarity Model Build Script
+# -----------------------------------------
+# Builds the similarity artifact the app loads from the final feature table, in one of four formats:
+#   - dense: float32 N x N matrix written block by block to cosine_similarity_matrix.npy (memory-mapped by the app)
+#   - csr:   sparse matrix keeping similarities >= threshold, cosine_similarity_matrix.joblib
+#   - top_k: SimilarityIndex with the k nearest products per row, similarity_index.joblib
+#   - lsh:   LSHIndex (approximate, for catalogues too large to score every pair), ann_index.joblib, its recall@10
+#            and query latency against exact cosine similarity are recorded in the metadata. It saves compute,
+#            not memory: the vectors are kept for exact rescoring, so it is larger than an exact index
+# Rows are scored block_size at a time so peak memory stays around block_size x N floats.
+# Build timings and sizes are written next to the artifact as <artifact>.meta.json.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import json
+import time
+import numpy as np
+import joblib
+from scipy import sparse
+from stage_store import read_stage
+from similarity_builder import SimilarityFeatures
+
+import app_modules
+from similarity_index import SimilarityIndex
+from ann_index import ANN_BACKENDS, compare_with_exact
+from instrumentation import span, export
+
+ARTIFACTS = {
+    'dense': 'cosine_similarity_matrix.npy',
+    'csr': 'cosine_similarity_matrix.joblib',
+    'top_k': 'similarity_index.joblib',
+    'lsh': 'ann_index.joblib'
+}
+
+# -----------------------------------------
+# Helper functions
+# -----------------------------------------
+def similarity_blocks(vectors, block_size):
+    '''
+    Cosine similarities of every product, block_size rows at a time
+
+    Parameters
+    ---------
+    vectors: L2-normalised feature vectors (sparse or dense)
+    block_size: rows per block
+
+    Yields
+    -------
+    Tuple of (first row, dense float32 block of shape (rows, N))
+    '''
+    for start in range(0, vectors.shape[0], block_size):
+        block = vectors[start:start + block_size] @ vectors.T
+        block = block.toarray() if sparse.issparse(block) else np.asarray(block)
+        yield start, block.astype(np.float32, copy=False)
+
+
+def write_dense(vectors, path, block_size):
+    # Written through a memory-mapped .npy so the full matrix never has to fit in memory
+    n_products = vectors.shape[0]
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n_products, n_products))
+    for start, block in similarity_blocks(vectors, block_size):
+        matrix[start:start + block.shape[0]] = block
+    matrix.flush()
+    del matrix
+    return {'nnz': n_products * n_products}
+
+
+def write_csr(vectors, path, block_size, threshold):
+    n_products = vectors.shape[0]
+    blocks = []
+    for start, block in similarity_blocks(vectors, block_size):
+        block[block < threshold] = 0
+        blocks.append(sparse.csr_matrix(block))
+    matrix = sparse.vstack(blocks, format='csr') if blocks else sparse.csr_matrix((0, n_products), dtype=np.float32)
+    joblib.dump(matrix, path)
+    return {'nnz': int(matrix.nnz)}
+
+
+def write_top_k(vectors, path, block_size, top_k, product_ids):
+    index = SimilarityIndex.from_features(vectors, top_k=top_k, block_size=block_size)
+    index.product_ids = product_ids
+    index.save(path)
+    return {'nnz': int(index.neighbours.nnz)}
+
+def write_ann(vectors, path, product_ids, backend='lsh', n_queries=100):
+    index = ANN_BACKENDS[backend].from_features(vectors)
+    index.product_ids = product_ids
+    index.save(path)
+    # Sampled against exact scoring over the same vectors, unfiltered and with a 5% pre-filter
+    exact = SimilarityIndex(vectors=vectors)
+    report = compare_with_exact(index, exact, k=10, n_queries=n_queries)
+    filtered = compare_with_exact(index, exact, k=10, n_queries=n_queries, allowed_fraction=0.05)
+    return {
+        'nnz': int(index.sorted_codes.size),
+        'recall_at_10': report['recall_at_k'],
+        'recall_at_10_filtered': filtered['recall_at_k'],
+        'exact_query_us': report['exact_query_us'],
+        'ann_query_us': report['index_query_us']
+    }
+
+# -----------------------------------------
+# Build function
+# -----------------------------------------
+def build_similarity(df, model_dir, mode='top_k', top_k=50, threshold=0.2, block_size=1024):
+    '''
+    Builds and saves the similarity artifact for a feature table
+
+    Parameters
+    ---------
+    df: final feature table (final_data), rows are in the order the app's catalogue uses
+    model_dir: folder the artifact and its metadata are written to
+    mode: 'dense', 'csr', 'top_k' or 'lsh'
+    top_k: neighbours kept per product in top_k mode
+    threshold: smallest similarity kept in csr mode
+    block_size: rows scored at once, bounds peak memory to about block_size x N floats
+
+    Returns
+    -------
+    Dictionary of build metadata, also written to <artifact>.meta.json
+    '''
+    if mode not in ARTIFACTS:
+        raise ValueError(f"mode must be one of {list(ARTIFACTS)}, got '{mode}'")
+    path = os.path.join(model_dir, ARTIFACTS[mode])
+
+    start = time.perf_counter()
+    with span('similarity_features'):
+        features = SimilarityFeatures().fit_transform(df)
+        vectors = SimilarityIndex.from_features(features).vectors
+    feature_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with span('similarity_build', mode=mode):
+        if mode == 'dense':
+            stats = write_dense(vectors, path, block_size)
+        elif mode == 'csr':
+            stats = write_csr(vectors, path, block_size, threshold)
+        elif mode == 'lsh':
+            stats = write_ann(vectors, path, df['Product ID'].to_numpy())
+        else:
+            stats = write_top_k(vectors, path, block_size, top_k, df['Product ID'].to_numpy())
+    build_seconds = time.perf_counter() - start
+
+    metadata = {
+        'mode': mode,
+        'artifact': ARTIFACTS[mode],
+        'n_products': int(vectors.shape[0]),
+        'n_features': int(vectors.shape[1]),
+        'top_k': top_k if mode == 'top_k' else None,
+        'threshold': threshold if mode == 'csr' else None,
+        'block_size': block_size,
+        'dtype': 'float32',
+        'nnz': stats.pop('nnz'),
+        'artifact_bytes': os.path.getsize(path),
+        'feature_seconds': round(feature_seconds, 3),
+        'build_seconds': round(build_seconds, 3),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        # Recall and latency of approximate modes
+        **stats
+    }
+    with open(path + '.meta.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    # The app loads similarity/CURRENT, then ann_index.joblib, then similarity_index.joblib, then the cosine matrix (first one found)
+    model_dir = '../model'
+    mode = 'top_k'
+    top_k = 50
+    threshold = 0.2
+    block_size = 1024
+
+    # Run function
+    with span('read_stage', stage='final_data'):
+        df = read_stage('final_data')
+    print(build_similarity(df, model_dir, mode, top_k, threshold, block_size))
+
+    # Prometheus text to SOUND_DECISIONS_METRICS_FILE, if set
+    export()
@@ -0,0 +1,79 @@
+# -----------------------------------------
+# Cluster Index Build Script
+# -----------------------------------------
+# Fits the KMeans segmentation of notebooks/02_data_eda/02-clustering.ipynb (20 clusters, random_state=1) and
+# saves it as model/cluster_index.joblib. With RecommendationEngine(n_probe=...) the app then only scores the
+# products in the anchors' cluster and its nearest clusters instead of every product matching the filters
+# (not with a top_k similarity index, which builds whole rows anyway).
+#   - similarity: clusters the TF-IDF + scaled feature vectors the similarity model scores, so products close
+#                 in cosine similarity share a cluster (default, much higher recall)
+#   - features:   the notebook's StandardScaler-scaled numeric columns
+# Recall@5 against exhaustive scoring and the share of the catalogue scored are printed per probe count.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+from stage_store import read_stage
+from similarity_builder import SimilarityFeatures
+
+import app_modules
+from cluster_index import ClusterIndex, compare_with_exhaustive
+from similarity_index import SimilarityIndex
+from artifacts import load_similarities
+from instrumentation import span, export
+
+# Columns the notebook dropped before clustering
+NON_FEATURE_COLUMNS = ['Product ID', 'Description', 'Price']
+
+
+def build_clusters(df, model_dir, n_clusters=20, random_state=1, space='similarity'):
+    '''
+    Builds and saves the cluster index for a feature table
+
+    Parameters
+    ---------
+    df: final feature table (final_data)
+    model_dir: folder cluster_index.joblib is written to
+    n_clusters: number of KMeans clusters
+    random_state: seed passed to KMeans
+    space: 'similarity' or 'features', see the top of this script
+
+    Returns
+    -------
+    ClusterIndex that was saved
+    '''
+    if space not in ('similarity', 'features'):
+        raise ValueError(f"space must be 'similarity' or 'features', got '{space}'")
+
+    with span('cluster_build', n_clusters=n_clusters, space=space):
+        if space == 'similarity':
+            features = SimilarityIndex.from_features(SimilarityFeatures().fit_transform(df)).vectors
+        else:
+            features = df.drop(columns=[column for column in NON_FEATURE_COLUMNS if column in df.columns])
+            features = features.select_dtypes('number').fillna(0)
+        clusters = ClusterIndex.from_features(features, n_clusters, random_state, df['Product ID'].to_numpy(),
+                                              scale=space == 'features')
+    clusters.save(os.path.join(model_dir, 'cluster_index.joblib'))
+    return clusters
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    model_dir = '../model'
+    n_clusters = 20
+    random_state = 1
+    space = 'similarity'
+    n_probes = (1, 2, 3, 5)
+
+    # Run function
+    with span('read_stage', stage='final_data'):
+        df = read_stage('final_data')
+    clusters = build_clusters(df, model_dir, n_clusters, random_state, space)
+
+    # Sampled against scoring every product with the similarity model the app loads
+    for result in compare_with_exhaustive(df.reset_index(drop=True), load_similarities(model_dir), clusters, n_probes):
+        print(result)
+
+    # Prometheus text to SOUND_DECISIONS_METRICS_FILE, if set
+    export()
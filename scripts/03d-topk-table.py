@@ -0,0 +1,75 @@
+# -----------------------------------------
+# Top-k Table Build Script
+# -----------------------------------------
+# Precomputes the unfiltered top-k of every anchor product at every step of the app's alpha slider
+# (0.0 - 1.0, step 0.1) and saves it as model/topk_table.joblib, memory-mapped by the app.
+# 'first' mode requests are then answered by walking the anchor's list and keeping the products that pass
+# the filters, scoring live only when fewer than 5 of them do. Run after the catalogue or similarity model
+# changes: a table built from other ratings or another similarity model (or an approximate backend) is ignored.
+# The share of sampled filtered queries the table answers, and that they match live scoring, is printed.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import time
+
+import app_modules
+from topk_table import TopKTable, ALPHA_STEPS, compare_with_live
+from recommendation_engine import RecommendationEngine, random_preferences
+from artifacts import source_signatures
+from hybrid_recommender import get_engine
+from instrumentation import span, export
+
+
+def build_topk_table(catalogue_path, model_dir, k=50, chunk_size=512):
+    '''
+    Builds and saves the top-k table for the catalogue and similarity model the app loads
+
+    Parameters
+    ---------
+    catalogue_path: catalogue CSV as passed to the app (a newer Parquet copy is preferred)
+    model_dir: folder holding the similarity model, topk_table.joblib is written there
+    k: products kept per anchor and alpha, the table takes products x 11 x k x 8 bytes
+    chunk_size: anchors scored at once, bounds peak memory to about chunk_size x N floats
+
+    Returns
+    -------
+    Tuple of (RecommendationEngine over the same artifacts, TopKTable that was saved)
+    '''
+    # Same catalogue columns and rating normalisation as the app
+    engine = RecommendationEngine(catalogue_path, model_dir)
+    with span('topk_table_build', k=k):
+        table = TopKTable.from_engine(get_engine(engine.df, engine.similarities), ALPHA_STEPS, k, chunk_size)
+    # The app ignores the table once the catalogue or similarity model is rebuilt, until this is rerun
+    table.sources = source_signatures(engine.version)
+    table.save(os.path.join(model_dir, 'topk_table.joblib'))
+    return engine, table
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    catalogue_path = '../data/final_data.csv'
+    model_dir = '../model'
+    k = 50
+    n_queries = 500
+
+    # Run function
+    start = time.perf_counter()
+    engine, table = build_topk_table(catalogue_path, model_dir, k)
+    print(f"Built a {table.n_products} x {len(table.alphas)} x {table.k} table ({table.nbytes / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    # Sampled filtered queries at every alpha the app's random preferences use
+    df = engine.df
+    scoring = get_engine(df, engine.similarities)
+    for alpha in (0.2, 0.6, 1.0):
+        candidate_sets = []
+        for preferences in random_preferences(df, n_queries):
+            candidates = df.index.get_indexer(engine.filter(preferences).index)
+            if len(candidates):
+                candidate_sets.append(candidates)
+        print(alpha, compare_with_live(scoring, table, candidate_sets, alpha))
+
+    # Prometheus text to SOUND_DECISIONS_METRICS_FILE, if set
+    export()
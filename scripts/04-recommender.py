@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+
 def hybrid_recommender(df, filtered_df, similarities, alpha=0.6):
     """
     Recommends products based on features (selected by the user) and product ratings.
@@ -14,30 +15,30 @@ def hybrid_recommender(df, filtered_df, similarities, alpha=0.6):
     - top_df: DataFrame of top recommended products
     """
 
-    # Normalising the Rating field for calculation
-    scaler = MinMaxScaler()
-    df['Normalised Rating'] = scaler.fit_transform(df[['Rating']])
+    # Normalising the Rating field without writing it back into df
+    ratings = df['Rating'].to_numpy(dtype=float)
+    rating_range = np.nanmax(ratings) - np.nanmin(ratings)
+    normalised_ratings = (ratings - np.nanmin(ratings)) / (rating_range if rating_range != 0 else 1.0)
 
     # Find first product_id of product after filtering
     product_id = filtered_df['Product ID'].iloc[0]  
     product_index = df[df['Product ID'] == product_id].index[0]
 
     # Use this id to generate recommendations
-    cosine_sim = similarities[product_index, :].flatten()
+    cosine_sim = np.asarray(similarities[product_index, :]).ravel()
 
-    # Combine similarity score with the ratings from the filtered DataFrame
-    combined_score = (alpha * cosine_sim) + ((1 - alpha) * df['Normalised Rating'])
+    # Combine similarity score with the ratings
+    combined_score = (alpha * cosine_sim) + ((1 - alpha) * normalised_ratings)
 
-    # Create a DataFrame for the recommended products
-    sim_df = pd.DataFrame({
-        'Product ID': df['Product ID'],
-        'Combined Similarity': combined_score,
-        'Rating': df['Rating']
-    })
+    # argpartition picks the top 6 in O(N), only those 6 are sorted
+    k = min(6, len(combined_score))
+    top = np.argpartition(-combined_score, k - 1)[:k]
+    top = top[np.lexsort((top, -combined_score[top]))]
 
-    # Filter and sort to get the top recommendations
-    top_df = sim_df.sort_values(by='Combined Similarity', ascending=False).head(6)
-    top_df.reset_index(drop=True, inplace=True)
+    top_df = pd.DataFrame({
+        'Product ID': df['Product ID'].to_numpy()[top],
+        'Rating': ratings[top]
+    })
 
     # Generate URL for easy access to recommended products
     top_df['Product URL'] = 'https://www.amazon.co.uk/dp/' + top_df['Product ID']
@@ -0,0 +1,19 @@
+# -----------------------------------------
+# App Modules
+# -----------------------------------------
+# Makes the modules in ../app (instrumentation, artifacts, recommendation_engine, ...) importable from the
+# scripts, which are run from this folder. Imported for its side effect, before any app module:
+#
+#   import app_modules
+#   from instrumentation import span, export
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+if os.path.abspath(APP_DIR) not in map(os.path.abspath, sys.path):
+    sys.path.append(APP_DIR)
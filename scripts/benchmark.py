@@ -0,0 +1,323 @@
+# -----------------------------------------
+# Benchmark Script
+# -----------------------------------------
+# Times and memory-profiles the pipeline and recommender hot paths on synthetic catalogues
+# (1k/10k/100k/1M products by default) and writes the results as JSON, so runs can be compared
+# across commits to catch regressions and see where scaling breaks.
+#
+# Steps:
+#   extract_features, clean_features  - 03-feature-extraction.py on a synthetic post_cleaning table
+#   similarity_build                  - 03b-similarity-model.py top-k build (capped, it is O(N^2))
+#   filter_chain                      - the app's original pandas boolean filters
+#   filter_index                      - the same preferences through CatalogueIndex
+#   hybrid_recommender                - ranking one filtered catalogue against an exact SimilarityIndex
+#   hybrid_recommender_centroid/top_m - the same queries with the multi-anchor modes, for comparison
+#   cold_start                        - the app's startup path in fresh interpreters, against STARTUP_TARGETS
+#
+# Each step is timed `repeat` times (best and mean kept), then run once more under tracemalloc
+# for its peak allocation. max_rss_bytes is the process high-water mark after the step.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+import app_modules
+from similarity_index import SimilarityIndex
+from catalogue_index import CatalogueIndex
+from hybrid_recommender import hybrid_recommender
+from recommendation_engine import random_preferences
+from artifacts import export_columnar
+
+# Stage scripts have dashes in their names so are imported by string
+feature_extraction = importlib.import_module('03-feature-extraction')
+
+# Words used to build synthetic descriptions, chosen so every extracted feature occurs
+FEATURE_PHRASES = ['wireless', 'noise cancelling', 'with microphone', 'over ear', 'gaming', 'foldable']
+COLOURS = ['black', 'white', 'blue', 'red', 'silver', 'pink', 'green', 'gold', 'navy', 'grey', 'gray', 'purple']
+FILLER = ['headphones', 'bluetooth', 'stereo', 'bass', 'hifi', 'sound', 'earphones', 'headset', 'comfortable',
+          'lightweight', 'travel', 'sport', 'kids', 'adjustable', 'premium', 'deep', 'with', 'for', 'and', 'the']
+
+# Cold start budget for container autoscaling, in seconds on top of a bare interpreter start (streamlit excluded):
+#   first_paint  - imports and widget bounds app.py needs before drawing the page
+#   engine_ready - engine imported and catalogue/similarity model loaded, the first recommendation can be served
+STARTUP_TARGETS = {'first_paint_seconds': 0.1, 'engine_ready_seconds': 2.0}
+COLD_START_STEPS = {
+    'interpreter': 'pass',
+    'first_paint': 'from catalogue_stats import load_stats; load_stats({catalogue_path!r})',
+    'engine_ready': 'from recommendation_engine import shared_engine; shared_engine({catalogue_path!r}, {model_dir!r}).refresh()'
+}
+
+# -----------------------------------------
+# Synthetic data
+# -----------------------------------------
+def synthetic_catalogue(n_products, seed=0):
+    '''
+    Generates a table with the post_cleaning schema (Product ID, Description, Price, Rating, Is Prime)
+
+    Parameters
+    ---------
+    n_products: number of rows
+    seed: random seed, the same seed always gives the same table
+
+    Returns
+    -------
+    Dataframe ready for extract_features
+    '''
+    rng = np.random.default_rng(seed)
+    filler = rng.choice(FILLER, size=(n_products, 8))
+    has_feature = rng.random((n_products, len(FEATURE_PHRASES))) < 0.35
+    colours = rng.choice(COLOURS + [''] * 4, size=n_products)
+    hours = rng.integers(5, 80, size=n_products)
+    has_battery = rng.random(n_products) < 0.5
+
+    descriptions = []
+    for i in range(n_products):
+        words = list(filler[i])
+        words += [phrase for phrase, present in zip(FEATURE_PHRASES, has_feature[i]) if present]
+        if colours[i]:
+            words.append(colours[i])
+        if has_battery[i]:
+            words.append(f'{hours[i]} hours playtime')
+        descriptions.append(' '.join(words).capitalize())
+
+    return pd.DataFrame({
+        'Product ID': [f'B{i:09d}' for i in range(n_products)],
+        'Description': descriptions,
+        'Price': np.round(rng.uniform(5, 400, n_products), 2),
+        'Rating': np.round(rng.uniform(1, 5, n_products), 1),
+        'Is Prime': rng.integers(0, 2, n_products)
+    })
+
+
+def final_catalogue(post_cleaning):
+    '''
+    Runs the feature stage and adds Price back, giving the final_data schema the app loads
+    '''
+    df = feature_extraction.clean_features(feature_extraction.extract_features(post_cleaning.copy()))
+    df.insert(2, 'Price', post_cleaning['Price'].to_numpy())
+    return df
+
+
+def write_app_artifacts(df, data_dir, model_dir, seed=0):
+    '''
+    Writes the artifacts the app starts from (final_data CSV/Parquet/stats and an exact similarity index)
+
+    Returns
+    -------
+    Path to final_data.csv
+    '''
+    catalogue_path = os.path.join(data_dir, 'final_data.csv')
+    df.to_csv(catalogue_path)
+    export_columnar(catalogue_path)
+
+    rng = np.random.default_rng(seed)
+    index = SimilarityIndex.from_features(rng.random((len(df), 64), dtype=np.float32))
+    index.product_ids = df['Product ID'].to_numpy()
+    index.save(os.path.join(model_dir, 'similarity_index.joblib'))
+    return catalogue_path
+
+
+# -----------------------------------------
+# Filters (as in app/app.py before and after the bitmap index)
+# -----------------------------------------
+def filter_chain(df, preferences):
+    filtered_df = df
+    for feature in preferences['features']:
+        filtered_df = filtered_df[filtered_df[feature] == 1]
+    low, high = preferences['price_range']
+    filtered_df = filtered_df[(filtered_df['Price'] >= low) & (filtered_df['Price'] <= high)]
+    filtered_df = filtered_df[filtered_df['Rating'] >= preferences['rating']]
+    filtered_df = filtered_df[filtered_df['Battery Life'] >= preferences['battery_life']]
+    if preferences['colours']:
+        colour_columns = [f'Colour_{colour}' for colour in preferences['colours']]
+        filtered_df = filtered_df[filtered_df[colour_columns].sum(axis=1) > 0]
+    return filtered_df
+
+
+def filter_index(df, catalogue_index, preferences):
+    bitmap = catalogue_index.match(
+        flags=preferences['features'],
+        ranges={
+            'Price': preferences['price_range'],
+            'Rating': (preferences['rating'], None),
+            'Battery Life': (preferences['battery_life'], None)
+        },
+        any_flags=[f'Colour_{colour}' for colour in preferences['colours']]
+    )
+    return df.iloc[catalogue_index.rows(bitmap)]
+
+# -----------------------------------------
+# Measurement
+# -----------------------------------------
+def measure(setup, fn, repeat=3, trace_memory=True):
+    '''
+    Times fn(*setup()) repeat times and records its peak allocation in one extra traced run
+
+    Parameters
+    ---------
+    setup: function returning the arguments for fn, not timed (e.g. copies of inputs fn modifies)
+    fn: function to measure
+    repeat: number of timed runs
+    trace_memory: also run once under tracemalloc (slower, so kept out of the timed runs)
+
+    Returns
+    -------
+    Dictionary of best/mean seconds, peak traced bytes and process max RSS
+    '''
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+
+    result = {'best_seconds': min(times), 'mean_seconds': sum(times) / len(times), 'repeat': repeat}
+    if trace_memory:
+        args = setup()
+        tracemalloc.start()
+        fn(*args)
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['max_rss_bytes'] = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return result
+
+
+def cold_start(catalogue_path, model_dir, repeat=3):
+    '''
+    Times the app's startup path in fresh interpreters, the imports and loads a new container pays for
+
+    Parameters
+    ---------
+    catalogue_path: catalogue CSV the app is started with
+    model_dir: model folder the app is started with
+    repeat: runs per step, the fastest is kept
+
+    Returns
+    -------
+    Dictionary of seconds per COLD_START_STEPS step (net of the interpreter start) and whether STARTUP_TARGETS are met
+    '''
+    app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+    timings = {}
+    for step, code in COLD_START_STEPS.items():
+        code = code.format(catalogue_path=os.path.abspath(catalogue_path), model_dir=os.path.abspath(model_dir))
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=app_dir, check=True)
+            times.append(time.perf_counter() - start)
+        timings[step] = min(times)
+
+    result = {f'{step}_seconds': timings[step] - timings['interpreter'] for step in ['first_paint', 'engine_ready']}
+    result['interpreter_seconds'] = timings['interpreter']
+    result['within_target'] = all(result[key] <= target for key, target in STARTUP_TARGETS.items())
+    return result
+
+
+def run_benchmarks(sizes=(1000, 10000, 100000, 1000000), repeat=3, n_queries=20, max_similarity_size=10000,
+                   seed=0):
+    '''
+    Runs every step at every catalogue size
+
+    Parameters
+    ---------
+    sizes: catalogue sizes to generate
+    repeat: timed runs per step
+    n_queries: preference sets per run for the filter and recommender steps
+    max_similarity_size: largest catalogue the all-pairs similarity build is run on, larger sizes are recorded as skipped
+    seed: random seed for the synthetic data
+
+    Returns
+    -------
+    List of result dictionaries, one per (step, size)
+    '''
+    similarity_model = importlib.import_module('03b-similarity-model')
+    results = []
+
+    def record(step, n_products, result, **extra):
+        result = dict(step=step, n_products=n_products, **extra, **result)
+        results.append(result)
+        print(f"{step:>20} n={n_products:>8}: {result.get('best_seconds', float('nan')):.4f}s")
+
+    for n_products in sizes:
+        post_cleaning = synthetic_catalogue(n_products, seed)
+
+        record('extract_features', n_products,
+               measure(lambda: (post_cleaning.copy(),), feature_extraction.extract_features, repeat))
+        extracted = feature_extraction.extract_features(post_cleaning.copy())
+        record('clean_features', n_products,
+               measure(lambda: (extracted.copy(),), feature_extraction.clean_features, repeat))
+
+        df = final_catalogue(post_cleaning)
+        if n_products <= max_similarity_size:
+            with tempfile.TemporaryDirectory() as model_dir:
+                record('similarity_build', n_products,
+                       measure(lambda: (df, model_dir), similarity_model.build_similarity, repeat=1))
+        else:
+            results.append({'step': 'similarity_build', 'n_products': n_products, 'skipped': True})
+
+        preferences = random_preferences(df, n_queries, seed)
+        record('filter_chain', n_products,
+               measure(lambda: (), lambda: [filter_chain(df, p) for p in preferences], repeat), n_queries=n_queries)
+        catalogue_index = CatalogueIndex.from_catalogue(df)
+        record('filter_index', n_products,
+               measure(lambda: (), lambda: [filter_index(df, catalogue_index, p) for p in preferences], repeat),
+               n_queries=n_queries)
+
+        # Exact index over random 64-d vectors, scoring cost matches a real model of the same size
+        rng = np.random.default_rng(seed)
+        similarities = SimilarityIndex.from_features(rng.random((n_products, 64), dtype=np.float32))
+        filtered = [filter_index(df, catalogue_index, p) for p in preferences]
+        queries = [(f, p['alpha']) for f, p in zip(filtered, preferences) if not f.empty]
+        for anchor in ['first', 'centroid', 'top_m']:
+            step = 'hybrid_recommender' if anchor == 'first' else f'hybrid_recommender_{anchor}'
+            record(step, n_products,
+                   measure(lambda: (), lambda: [hybrid_recommender(df, f, similarities, alpha, anchor) for f, alpha in queries],
+                           repeat),
+                   n_queries=len(queries))
+
+        with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as model_dir:
+            catalogue_path = write_app_artifacts(df, data_dir, model_dir, seed)
+            result = cold_start(catalogue_path, model_dir, repeat)
+            results.append(dict(step='cold_start', n_products=n_products, **result))
+            print(f"{'cold_start':>20} n={n_products:>8}: first paint {result['first_paint_seconds']:.3f}s, "
+                  f"engine ready {result['engine_ready_seconds']:.3f}s")
+
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'run_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    sizes = (1000, 10000, 100000, 1000000)
+    repeat = 3
+    output_path = '../data/benchmark_results.json'
+
+    # Run function
+    results = run_benchmarks(sizes, repeat)
+    with open(output_path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {output_path}")
@@ -0,0 +1,176 @@
+# -----------------------------------------
+# Description NLP Stage
+# -----------------------------------------
+# Named-entity extraction over product descriptions (the brand attempt in
+# notebooks/01_data_collection/02-data-cleaning.ipynb), scripted so a full scrape takes seconds:
+#   - the spaCy model is loaded once per process with only the entity recogniser enabled
+#   - descriptions are streamed through nlp.pipe in batches, optionally over several processes
+#   - entities are cached per description by a hash of its text (and the model name), so repeated and
+#     previously seen descriptions are not processed again. With a path the cache persists as JSONL.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import json
+import time
+import hashlib
+import functools
+import pandas as pd
+import spacy
+from stage_store import read_stage
+
+MODEL = 'en_core_web_sm'
+# Pipeline components needed for doc.ents, the tagger/parser/lemmatizer etc. are disabled
+ENTITY_COMPONENTS = ['tok2vec', 'ner']
+UNKNOWN_BRAND = 'Unknown Brand'
+
+
+@functools.lru_cache(maxsize=None)
+def load_nlp(model=MODEL):
+    '''
+    Loads a spaCy pipeline once per process, keeping only ENTITY_COMPONENTS enabled
+
+    Parameters
+    ---------
+    model: installed package name or path of a spaCy pipeline
+
+    Returns
+    -------
+    spaCy Language object, shared by every caller
+    '''
+    nlp = spacy.load(model)
+    nlp.select_pipes(enable=[name for name in nlp.pipe_names if name in ENTITY_COMPONENTS])
+    return nlp
+
+
+class EntityCache:
+    '''
+    Entities per description keyed by a SHA-256 of the model name and text
+
+    Parameters
+    ---------
+    path: optional JSONL file the cache is loaded from and appended to, None keeps it in memory
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    # A crash can leave a half-written last line, skip it
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry['key']] = entry['entities']
+
+    @staticmethod
+    def key(text, model=MODEL):
+        return hashlib.sha256(f'{model}\0{text}'.encode('utf-8')).hexdigest()
+
+    def update(self, results):
+        '''
+        Adds {key: entities} results, appending them to the cache file when there is one
+        '''
+        self.entries.update(results)
+        if self.path is not None and results:
+            with open(self.path, 'a') as f:
+                for key, entities in results.items():
+                    f.write(json.dumps({'key': key, 'entities': entities}) + '\n')
+
+# -----------------------------------------
+# Extraction
+# -----------------------------------------
+def extract_entities(descriptions, model=MODEL, batch_size=256, n_process=1, cache=None):
+    '''
+    Finds the named entities of each description
+
+    Parameters
+    ---------
+    descriptions: iterable of description strings
+    model: spaCy pipeline to use, see load_nlp
+    batch_size: descriptions per nlp.pipe batch
+    n_process: worker processes for nlp.pipe. Each loads its own model and docs are serialised back to this
+               process, so more than 1 only pays off when the model's per-description cost outweighs that
+    cache: EntityCache to reuse, None uses a fresh in-memory cache
+
+    Returns
+    -------
+    List with one [[text, label], ...] list per description, in input order
+    '''
+    cache = cache if cache is not None else EntityCache()
+    texts = [str(text) for text in descriptions]
+    keys = [cache.key(text, model) for text in texts]
+
+    # Each unseen description is processed once, however often it occurs
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cache.entries and key not in missing:
+            missing[key] = text
+
+    if missing:
+        docs = load_nlp(model).pipe(missing.values(), batch_size=batch_size, n_process=n_process)
+        cache.update({key: [[ent.text, ent.label_] for ent in doc.ents] for key, doc in zip(missing, docs)})
+    return [cache.entries[key] for key in keys]
+
+
+def brand_from_entities(entities):
+    '''
+    Applies the notebook's rule: the first entity is the brand if it is an organisation (ORG).
+    Descriptions without entities are also Unknown Brand (the notebook left them empty).
+    '''
+    if entities and entities[0][1] == 'ORG':
+        return entities[0][0]
+    return UNKNOWN_BRAND
+
+
+def extract_brands(descriptions, model=MODEL, batch_size=256, n_process=1, cache=None):
+    '''
+    Extracts a brand per description, see extract_entities for the parameters
+
+    Returns
+    -------
+    Series of brand names aligned with descriptions
+    '''
+    entities = extract_entities(descriptions, model, batch_size, n_process, cache)
+    index = descriptions.index if isinstance(descriptions, pd.Series) else None
+    return pd.Series([brand_from_entities(found) for found in entities], index=index, name='Brand')
+
+
+def per_row_brand(description, model=MODEL):
+    '''
+    The notebook's get_brand (model loaded and run for every description), kept for timing comparisons
+    '''
+    doc = spacy.load(model)(description)
+    for ent in doc.ents:
+        if ent.label_ == "ORG":
+            return ent.text
+        else:
+            return UNKNOWN_BRAND
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    model = MODEL
+    batch_size = 256
+    # Raise for large scrapes on many cores, see extract_entities
+    n_process = 1
+    cache_path = '../data/description_entities.jsonl'
+    # The per-row version reloads the model for every description, so it is only timed on a sample
+    sample_size = 20
+
+    df = read_stage('post_cleaning', columns=['Description'])
+
+    start = time.perf_counter()
+    brands = extract_brands(df['Description'], model, batch_size, n_process, EntityCache(cache_path))
+    batched_seconds = time.perf_counter() - start
+
+    sample = df['Description'].head(sample_size)
+    start = time.perf_counter()
+    for description in sample:
+        per_row_brand(description, model)
+    per_row_seconds = (time.perf_counter() - start) / len(sample) * len(df)
+
+    print(f"Batched: {batched_seconds:.1f}s for {len(df)} descriptions, per row (estimated): {per_row_seconds:.1f}s")
+    print(brands.value_counts().head(10))
@@ -0,0 +1,218 @@
+# -----------------------------------------
+# Near-Duplicate Listings
+# -----------------------------------------
+# Finds listings whose descriptions are near-identical (colour variants, re-listed ASINs) without comparing
+# every pair of products:
+#   - each description becomes a set of word shingles (shingle_size consecutive words). Descriptions are
+#     short, so pairs of words: single words merge unrelated listings sharing common words, while with
+#     longer shingles one changed word (e.g. the colour) drops too many shared shingles
+#   - MinHash: n_perm hash functions keep the smallest hash of each set, the share of equal minimums between
+#     two signatures estimates the Jaccard similarity of their shingle sets
+#   - LSH banding: signatures are cut into bands, products sharing any band bucket become candidate pairs,
+#     so the work grows with the number of products rather than its square
+#   - candidates whose estimated Jaccard is >= threshold are merged, each group keeps its first listing
+#     (scrape order) as the canonical ASIN
+#   - placeholder descriptions ('N/A' when the scraper found none, empty or punctuation-only text) say
+#     nothing about the product, so those listings are never grouped
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import re
+import zlib
+import time
+import numpy as np
+import pandas as pd
+from stage_store import read_stage
+
+# Mersenne prime 2^31 - 1, hashes are reduced below it so a * x + b fits in 64 bits
+PRIME = np.uint64((1 << 31) - 1)
+
+# Written by the scraper / pipeline when a listing has no description (compared lower-cased)
+PLACEHOLDER_DESCRIPTIONS = {'n/a', 'not specified'}
+
+
+# -----------------------------------------
+# Helper functions
+# -----------------------------------------
+def shingles(text, shingle_size=2):
+    '''
+    Hashes the word shingles of a text (lower-cased, punctuation removed)
+
+    Parameters
+    ---------
+    text: description string
+    shingle_size: words per shingle, texts with fewer words are one shingle
+
+    Returns
+    -------
+    Sorted array of unique uint64 shingle hashes, never empty
+    '''
+    words = re.findall(r'\w+', str(text).lower())
+    grams = [' '.join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))]
+    # crc32 is stable across processes, unlike hash()
+    return np.unique(np.array([zlib.crc32(gram.encode('utf-8')) for gram in grams], dtype=np.uint64) % PRIME)
+
+
+def is_placeholder(text):
+    '''
+    Returns True for descriptions that can't identify a product: placeholders, empty or without any word
+    '''
+    text = str(text).strip().lower()
+    return text in PLACEHOLDER_DESCRIPTIONS or re.search(r'\w', text) is None
+
+
+def placeholder_flags(texts):
+    '''
+    Returns a boolean array marking the placeholder descriptions among texts, see is_placeholder
+    '''
+    return np.array([is_placeholder(text) for text in texts], dtype=bool)
+
+
+def minhash_signatures(texts, n_perm=128, shingle_size=2, seed=1, block_size=256):
+    '''
+    Computes a MinHash signature per text
+
+    Parameters
+    ---------
+    texts: iterable of description strings
+    n_perm: hash functions per signature, the Jaccard estimate's error shrinks with 1 / sqrt(n_perm)
+    shingle_size: words per shingle
+    seed: seed for the hash functions
+    block_size: texts hashed at once, bounds memory to n_perm x their shingles
+
+    Returns
+    -------
+    uint32 array of shape (len(texts), n_perm)
+    '''
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, size=(n_perm, 1), dtype=np.uint64)
+    b = rng.integers(0, PRIME, size=(n_perm, 1), dtype=np.uint64)
+
+    shingle_sets = [shingles(text, shingle_size) for text in texts]
+    signatures = np.empty((len(shingle_sets), n_perm), dtype=np.uint32)
+    for start in range(0, len(shingle_sets), block_size):
+        block = shingle_sets[start:start + block_size]
+        # All shingles of the block side by side, the minimum per text is taken over its own segment
+        offsets = np.cumsum([0] + [len(hashes) for hashes in block[:-1]])
+        hashed = (a * np.concatenate(block)[None, :] + b) % PRIME
+        signatures[start:start + len(block)] = np.minimum.reduceat(hashed, offsets, axis=1).T
+    return signatures
+
+
+def lsh_bands(threshold, n_perm=128):
+    '''
+    Picks the number of bands and rows per band whose S-curve midpoint (1 / bands) ^ (1 / rows)
+    is closest to the Jaccard threshold, using at most n_perm hash values
+    '''
+    options = [(n_perm // rows, rows) for rows in range(1, n_perm + 1)]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+def candidate_pairs(signatures, bands, rows):
+    '''
+    Finds products sharing an LSH bucket in any band
+
+    Every member of a bucket is paired with the bucket's first product only, so a bucket of identical
+    descriptions gives len(bucket) - 1 pairs instead of all of them (groups are merged transitively later).
+
+    Returns
+    -------
+    Array of shape (n_pairs, 2) of row pairs, first < second
+    '''
+    pairs = []
+    for band in range(bands):
+        # Rows of a band viewed as one opaque value each, so equal bands compare equal
+        keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        _, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+        leaders = first[bucket]
+        members = np.flatnonzero(leaders != np.arange(len(keys)))
+        pairs.append(np.column_stack([leaders[members], members]))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.vstack(pairs), axis=0)
+
+
+def duplicate_groups(signatures, threshold=0.8, bands=None, rows=None, exempt=None):
+    '''
+    Groups products whose estimated Jaccard similarity is >= threshold
+
+    Parameters
+    ---------
+    signatures: MinHash signatures from minhash_signatures
+    threshold: smallest Jaccard similarity of two descriptions' shingle sets treated as duplicates
+    bands, rows: LSH banding, picked from the threshold by lsh_bands when not given
+    exempt: optional boolean array of products never grouped (e.g. placeholder descriptions)
+
+    Returns
+    -------
+    Array with the group of each product, the smallest row of the group
+    '''
+    if bands is None or rows is None:
+        bands, rows = lsh_bands(threshold, signatures.shape[1])
+    # Exempt products are left out of the buckets, so they can't be a bucket's first product either
+    rows_used = np.arange(len(signatures)) if exempt is None else np.flatnonzero(~np.asarray(exempt, dtype=bool))
+    pairs = rows_used[candidate_pairs(signatures[rows_used], bands, rows)]
+    if len(pairs):
+        similarity = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[similarity >= threshold]
+
+    # Union-find with path halving, roots are always the smallest row of their group
+    parent = np.arange(len(signatures))
+
+    def find(row):
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for left, right in pairs:
+        left, right = find(left), find(right)
+        if left != right:
+            parent[max(left, right)] = min(left, right)
+    return np.array([find(row) for row in range(len(parent))], dtype=np.int64)
+
+
+# -----------------------------------------
+# Deduplication
+# -----------------------------------------
+def drop_near_duplicates(df, threshold=0.8, n_perm=128, shingle_size=2, seed=1):
+    '''
+    Keeps one listing per group of near-identical descriptions
+
+    Parameters
+    ---------
+    df: listings with Product ID and Description columns, in scrape order
+    threshold: Jaccard similarity of description shingles at or above which listings are duplicates
+    n_perm: MinHash hash functions per description
+    shingle_size: words per shingle
+    seed: seed for the hash functions
+
+    Returns
+    -------
+    Tuple of (df without the duplicates, DataFrame mapping every Product ID to its Canonical ID)
+    '''
+    if df.empty:
+        return df, pd.DataFrame({'Product ID': df['Product ID'], 'Canonical ID': df['Product ID']})
+    signatures = minhash_signatures(df['Description'], n_perm, shingle_size, seed)
+    groups = duplicate_groups(signatures, threshold, exempt=placeholder_flags(df['Description']))
+
+    product_ids = df['Product ID'].to_numpy()
+    canonical = pd.DataFrame({'Product ID': product_ids, 'Canonical ID': product_ids[groups]})
+    return df[groups == np.arange(len(df))], canonical.drop_duplicates('Product ID')
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    threshold = 0.8
+    n_perm = 128
+
+    df = read_stage('post_scrape', columns=['Product ID', 'Description']).dropna()
+
+    start = time.perf_counter()
+    deduplicated, canonical = drop_near_duplicates(df, threshold, n_perm)
+    seconds = time.perf_counter() - start
+
+    print(f"{len(df) - len(deduplicated)} of {len(df)} listings are near-duplicates ({seconds:.1f}s)")
+    print(canonical[canonical['Product ID'] != canonical['Canonical ID']].head(10))
@@ -0,0 +1,92 @@
+# -----------------------------------------
+# Raw Page Cache
+# -----------------------------------------
+# Content-addressed store of raw page HTML used by 01-web-scraping.py.
+#
+# Layout:
+#   <cache_dir>/objects/<sha[:2]>/<sha>.html  - page bodies, stored once per unique content
+#   <cache_dir>/manifest.jsonl                - append-only log of {url, fetched_at, sha256}
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class PageCache:
+    '''
+    Content-addressed cache of fetched pages keyed by URL and fetch time
+
+    Parameters
+    ---------
+    cache_dir: folder to store pages and manifest in (created if missing)
+    '''
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.jsonl')
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+
+        # Latest manifest entry per URL
+        self.latest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                for line in f:
+                    # A crash can leave a half-written last line, skip it
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.latest[entry['url']] = entry
+
+    def _object_path(self, sha):
+        return os.path.join(self.cache_dir, 'objects', sha[:2], sha + '.html')
+
+    def put(self, url, content, fetched_at=None):
+        '''
+        Stores a page body and records the fetch in the manifest
+
+        Returns
+        -------
+        sha256 of the content
+        '''
+        sha = hashlib.sha256(content).hexdigest()
+        path = self._object_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial page
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        entry = {'url': url, 'fetched_at': fetched_at or time.time(), 'sha256': sha}
+        with self.lock:
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.latest[url] = entry
+        return sha
+
+    def get(self, url, max_age=None):
+        '''
+        Returns the most recent cached body for url, or None if missing or older than max_age seconds
+        '''
+        entry = self.latest.get(url)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry['fetched_at'] > max_age:
+            return None
+        path = self._object_path(entry['sha256'])
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def urls(self):
+        return list(self.latest)
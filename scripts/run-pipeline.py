@@ -0,0 +1,187 @@
+# -----------------------------------------
+# Pipeline Runner Script
+# -----------------------------------------
+# Streams the post_scrape stage in chunks through clean_data -> extract_features -> clean_features
+# across a process pool, so large scrapes use every core with bounded memory.
+#
+# Two passes are needed because near-duplicate listings can sit in different chunks and clean_features uses
+# catalogue-wide stats (the colour value_counts() < 10 grouping and the OneHotEncoder vocabulary):
+#   1. map:    each chunk is cleaned and feature-extracted, written to a temp file and the MinHash signatures
+#              and colours of its rows returned
+#   2. reduce: near-duplicates are grouped over every chunk's signatures and colours counted over the rows
+#              kept, then each chunk drops its duplicates, is finished with clean_features using the global
+#              counts and appended to the output in the original order
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import importlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import numpy as np
+import pandas as pd
+from stage_store import iter_stage, StageWriter
+from near_duplicates import minhash_signatures, duplicate_groups, placeholder_flags
+
+# Stage scripts have dashes in their names so are imported by string
+data_cleaning = importlib.import_module('02-data-cleaning')
+feature_extraction = importlib.import_module('03-feature-extraction')
+
+# -----------------------------------------
+# Worker functions
+# -----------------------------------------
+def clean_and_extract(chunk, path):
+    '''
+    Map step: cleans one chunk, extracts its features and saves it for the reduce step
+
+    Near-duplicates are left in, they are dropped in the reduce step once every chunk's signatures are known
+
+    Returns
+    -------
+    Tuple of (Product IDs, MinHash signatures, placeholder-description flags, colours as clean_features
+    counts them), one row per row of the saved chunk
+    '''
+    chunk = data_cleaning.clean_data(chunk, near_duplicate_threshold=None, check=False)
+    signatures = minhash_signatures(chunk['Description'])
+    exempt = placeholder_flags(chunk['Description'])
+    chunk = feature_extraction.extract_features(chunk)
+    chunk.to_pickle(path)
+    return chunk['Product ID'].to_numpy(), signatures, exempt, chunk['Colour'].replace('gray', 'grey').to_numpy()
+
+
+def finish_chunk(path, keep, colour_counts):
+    '''
+    Reduce step: drops the chunk's near-duplicates and runs clean_features with the catalogue-wide colour counts
+    '''
+    chunk = pd.read_pickle(path)
+    os.remove(path)
+    chunk = chunk[keep].reset_index(drop=True)
+    # Every row of this chunk was dropped during cleaning
+    if chunk.empty:
+        return chunk
+    return feature_extraction.clean_features(chunk, colour_counts)
+
+
+def ordered_map(executor, fn, arg_tuples, max_pending):
+    '''
+    Like executor.map but only keeps max_pending tasks in flight, so input chunks are read lazily
+
+    Yields
+    -------
+    Results in input order
+    '''
+    pending = deque()
+    for args in arg_tuples:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# -----------------------------------------
+# Pipeline
+# -----------------------------------------
+def unique_chunks(name, data_dir, chunk_size):
+    '''
+    Reads a stage in chunks, dropping rows already seen in earlier chunks
+
+    clean_data only removes duplicates inside the frame it is given, so exact duplicate rows are
+    removed here across the whole file (first occurrence kept) using 64-bit row hashes.
+    '''
+    seen = set()
+    for chunk in iter_stage(name, data_dir, chunk_size):
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        keep = np.array([row_hash not in seen for row_hash in hashes], dtype=bool)
+        seen.update(hashes.tolist())
+        yield chunk[keep]
+
+
+def run_pipeline(input_name='post_scrape', output_name='final_df', data_dir='../data', chunk_size=50000, max_workers=None,
+                 near_duplicate_threshold=0.8, canonical_path=None):
+    '''
+    Runs cleaning and feature extraction in parallel chunks
+
+    Parameters
+    ---------
+    input_name: scraped stage (post_scrape.parquet, or post_scrape.csv if there is no Parquet copy)
+    output_name: final stage, same content as running 02-data-cleaning.py then 03-feature-extraction.py
+    data_dir: data folder
+    chunk_size: rows per chunk, peak memory is roughly (max_workers * 2) chunks plus 512 bytes of
+                MinHash signature per cleaned row
+    max_workers: number of processes, defaults to the number of CPUs
+    near_duplicate_threshold: as in clean_data, listings are compared across the whole catalogue.
+                              None keeps them all
+    canonical_path: optional CSV the Product ID -> Canonical ID mapping of the near-duplicates is written to,
+                    as by clean_data
+
+    Returns
+    -------
+    Number of rows written
+    '''
+    max_workers = max_workers or os.cpu_count()
+    max_pending = max_workers * 2
+
+    with tempfile.TemporaryDirectory() as temp_dir, ProcessPoolExecutor(max_workers=max_workers) as executor, \
+            StageWriter(output_name, data_dir) as writer:
+        # Pass 1: clean + extract, collect signatures and colours
+        chunk_paths = []
+        product_ids, signatures, exempt, colours = [], [], [], []
+        n_read = 0
+
+        def map_args():
+            nonlocal n_read
+            for i, chunk in enumerate(unique_chunks(input_name, data_dir, chunk_size)):
+                n_read += len(chunk)
+                chunk_path = os.path.join(temp_dir, f'chunk_{i:06d}.pkl')
+                chunk_paths.append(chunk_path)
+                yield chunk, chunk_path
+
+        for chunk_ids, chunk_signatures, chunk_exempt, chunk_colours in ordered_map(executor, clean_and_extract,
+                                                                                    map_args(), max_pending):
+            product_ids.append(chunk_ids)
+            signatures.append(chunk_signatures)
+            exempt.append(chunk_exempt)
+            colours.append(chunk_colours)
+
+        # Same groups as clean_data on the whole catalogue, the first listing (scrape order) of each is kept
+        lengths = [len(chunk_colours) for chunk_colours in colours]
+        keep = np.ones(sum(lengths), dtype=bool)
+        if near_duplicate_threshold is not None and keep.size:
+            groups = duplicate_groups(np.vstack(signatures), near_duplicate_threshold, exempt=np.concatenate(exempt))
+            keep = groups == np.arange(len(groups))
+            if canonical_path is not None:
+                all_ids = np.concatenate(product_ids)
+                canonical = pd.DataFrame({'Product ID': all_ids, 'Canonical ID': all_ids[groups]})
+                canonical.drop_duplicates('Product ID').to_csv(canonical_path, index=False)
+        colour_counts = pd.Series(np.concatenate(colours)[keep]).value_counts() if colours else pd.Series(dtype='int64')
+
+        # Pass 2: drop near-duplicates, clean_features with global stats, appended in chunk order
+        # (read back with a continuous index)
+        n_rows = 0
+        finish_args = zip(chunk_paths, np.split(keep, np.cumsum(lengths)[:-1]), [colour_counts] * len(chunk_paths))
+        for chunk in ordered_map(executor, finish_chunk, finish_args, max_pending):
+            if chunk.empty:
+                continue
+            writer.write(chunk)
+            n_rows += len(chunk)
+
+    # One summary for the whole run instead of df_check per chunk
+    print(f"{n_read} unique rows read, {len(keep)} after cleaning, {n_rows} after dropping near-duplicates")
+
+    return n_rows
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    input_name = 'post_scrape'
+    output_name = 'final_df'
+    data_dir = '../data'
+    near_duplicate_threshold = 0.8
+    canonical_path = '../data/canonical_asins.csv'
+
+    # Run function
+    n_rows = run_pipeline(input_name, output_name, data_dir, near_duplicate_threshold=near_duplicate_threshold,
+                          canonical_path=canonical_path)
+    print(f"Wrote {n_rows} rows to {data_dir}/{output_name}.parquet")
@@ -0,0 +1,255 @@
+# -----------------------------------------
+# Search Result Parsers
+# -----------------------------------------
+# Pluggable backends for extracting products from an Amazon search results page.
+#
+# - 'bs4':      reference extractor, BeautifulSoup + html.parser with one find() per field
+# - 'strainer': BeautifulSoup limited to s-search-result divs with a SoupStrainer, one pass per product
+# - 'lxml':     lxml.html tree, one pass over each product's spans (needs lxml installed)
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import time
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Class attribute each field is read from
+DESCRIPTION_CLASS = 'a-size-medium a-color-base a-text-normal'
+PRICE_WHOLE_CLASS = 'a-price-whole'
+PRICE_FRACTION_CLASS = 'a-price-fraction'
+RATING_CLASS = 'a-icon-alt'
+PRIME_CLASS = 'aok-relative s-icon-text-medium s-prime'
+FIELD_CLASSES = [DESCRIPTION_CLASS, PRICE_WHOLE_CLASS, PRICE_FRACTION_CLASS, RATING_CLASS, PRIME_CLASS]
+
+# Tags whose text BeautifulSoup's get_text() leaves out
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+# -----------------------------------------
+# Helper functions
+# -----------------------------------------
+def make_product(asin, fields):
+    '''
+    Builds the product record from the first span found for each field class
+
+    Parameters
+    ---------
+    asin: data-asin attribute of the result div, None if missing
+    fields: dictionary of field class -> text of the first matching span
+
+    Returns
+    -------
+    Dictionary with the columns written to post_scrape.csv
+    '''
+    if PRICE_WHOLE_CLASS in fields and PRICE_FRACTION_CLASS in fields:
+        hp_price = fields[PRICE_WHOLE_CLASS] + fields[PRICE_FRACTION_CLASS]
+    else:
+        hp_price = 'Not Specified'
+
+    return {
+        'Product ID': asin if asin is not None else 'Not Specified',
+        'Description': fields.get(DESCRIPTION_CLASS, 'N/A'),
+        'Price': hp_price,
+        'Rating': fields.get(RATING_CLASS, 'N/A'),
+        'Is Prime': '1' if PRIME_CLASS in fields else '0'
+    }
+
+
+def match_fields(classes):
+    '''
+    Returns every field class a span's class list matches, using BeautifulSoup's class_ rules
+    (a single class anywhere in the list, or a multi-class string equal to the whole attribute).
+    The reference extractor looks each field up on its own, so one span can fill several fields.
+    '''
+    joined = ' '.join(classes)
+    return [field for field in FIELD_CLASSES if field in classes or joined == field]
+
+# -----------------------------------------
+# Backends
+# -----------------------------------------
+def parse_bs4(content):
+    '''
+    Reference extractor, the original per-field find() calls on html.parser
+    '''
+    data = []
+
+    # Use BeautifulSoup to 'read' content on page
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Extracts div storing all search results
+    all_headphones = soup.find_all('div', {'data-component-type': 's-search-result'})
+
+    # Loop through each product found to extract product details
+    for headphone in all_headphones:
+        fields = {}
+        for field in FIELD_CLASSES:
+            span = headphone.find('span', class_=field)
+            if span:
+                fields[field] = span.get_text(strip=True)
+
+        data.append(make_product(headphone.get('data-asin'), fields))
+
+    return data
+
+
+def parse_strainer(content):
+    '''
+    BeautifulSoup parser that only builds the s-search-result divs and reads every field in one pass
+    '''
+    data = []
+    only_results = SoupStrainer('div', attrs={'data-component-type': 's-search-result'})
+    soup = BeautifulSoup(content, 'lxml' if lxml is not None else 'html.parser', parse_only=only_results)
+
+    for headphone in soup.find_all('div', {'data-component-type': 's-search-result'}):
+        fields = {}
+        for span in headphone.find_all('span'):
+            matched = [field for field in match_fields(span.get('class', [])) if field not in fields]
+            if matched:
+                text = span.get_text(strip=True)
+                fields.update(dict.fromkeys(matched, text))
+
+        data.append(make_product(headphone.get('data-asin'), fields))
+
+    return data
+
+
+def _lxml_text(element):
+    # Same result as get_text(strip=True): stripped text pieces joined, comments and scripts skipped
+    parts = []
+    if element.text:
+        parts.append(element.text.strip())
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in SKIPPED_TEXT_TAGS:
+            parts.append(_lxml_text(child))
+        if child.tail:
+            parts.append(child.tail.strip())
+    return ''.join(parts)
+
+
+def parse_lxml(content):
+    '''
+    lxml parser that reads every field of a product in one pass over its spans
+    '''
+    if lxml is None:
+        raise ImportError("The 'lxml' parser backend needs lxml installed")
+
+    data = []
+    tree = lxml.html.fromstring(content)
+    for headphone in tree.iter('div'):
+        if headphone.get('data-component-type') != 's-search-result':
+            continue
+        fields = {}
+        for span in headphone.iter('span'):
+            matched = [field for field in match_fields(span.get('class', '').split()) if field not in fields]
+            if matched:
+                text = _lxml_text(span)
+                fields.update(dict.fromkeys(matched, text))
+
+        data.append(make_product(headphone.get('data-asin'), fields))
+
+    return data
+
+
+PARSERS = {
+    'bs4': parse_bs4,
+    'strainer': parse_strainer,
+    'lxml': parse_lxml
+}
+
+# Fastest backend available
+DEFAULT_PARSER = 'lxml' if lxml is not None else 'strainer'
+
+
+def parse_search_results(content, parser=DEFAULT_PARSER):
+    '''
+    Extracts product details from one page of search results
+
+    Parameters
+    ---------
+    content: raw HTML of a search results page
+    parser: backend name, one of PARSERS
+
+    Returns
+    -------
+    List of dictionaries, one per product
+    '''
+    return PARSERS[parser](content)
+
+# -----------------------------------------
+# Parity and benchmark
+# -----------------------------------------
+def check_parity(pages, parser, reference='bs4'):
+    '''
+    Compares a backend against the reference extractor
+
+    Parameters
+    ---------
+    pages: list of raw HTML pages (e.g. saved pages or the page cache)
+    parser: backend to check
+    reference: backend taken as correct
+
+    Returns
+    -------
+    List of (page number, expected, got) for every page whose output differs, empty if all match
+    '''
+    mismatches = []
+    for page, content in enumerate(pages, start=1):
+        expected = PARSERS[reference](content)
+        got = PARSERS[parser](content)
+        if expected != got:
+            mismatches.append((page, expected, got))
+    return mismatches
+
+
+def benchmark(pages, parsers=None, repeat=3):
+    '''
+    Times each backend over the given pages
+
+    Parameters
+    ---------
+    pages: list of raw HTML pages
+    parsers: backend names to time, defaults to every available backend
+    repeat: number of passes over the pages, the best pass is kept
+
+    Returns
+    -------
+    Dictionary of backend -> pages parsed per second
+    '''
+    if parsers is None:
+        parsers = [name for name in PARSERS if name != 'lxml' or lxml is not None]
+
+    results = {}
+    for name in parsers:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for content in pages:
+                PARSERS[name](content)
+            best = min(best, time.perf_counter() - start)
+        results[name] = len(pages) / best
+    return results
+
+
+if __name__ == "__main__":
+    import glob
+
+    # Defining params to pass in
+    pages_dir = '../tests/fixtures/saved_pages'
+
+    pages = []
+    for path in sorted(glob.glob(f'{pages_dir}/*.html')):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+
+    for name in PARSERS:
+        if name == 'bs4' or (name == 'lxml' and lxml is None):
+            continue
+        mismatches = check_parity(pages, name)
+        print(f"{name}: {len(pages) - len(mismatches)}/{len(pages)} pages match the reference extractor")
+
+    for name, pages_per_second in benchmark(pages).items():
+        print(f"{name}: {pages_per_second:.1f} pages/s")
@@ -0,0 +1,375 @@
+# -----------------------------------------
+# Incremental Similarity Builder
+# -----------------------------------------
+# Keeps the similarity model in step with final_data without an all-pairs rebuild after every scrape.
+#
+# Builds are published as <model_dir>/similarity/v<version>/ holding
+#   similarity_index.joblib - SimilarityIndex loaded by the app (rows carry their Product IDs)
+#   state.joblib            - fitted features, row hashes and normalised vectors used by the next update
+# and <model_dir>/similarity/CURRENT is then swapped to the new folder, which the app reloads on its next rerun.
+#
+# Updates reuse the fitted TF-IDF vocabulary and MinMax bounds, so unchanged products keep their vectors and
+# only added/changed products are scored. Once too much of the catalogue has changed the features are refitted.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import re
+import shutil
+import string
+import functools
+import numpy as np
+import pandas as pd
+import joblib
+import nltk
+from nltk.corpus import stopwords
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import MinMaxScaler
+from stage_store import read_stage
+
+import app_modules
+from similarity_index import SimilarityIndex
+
+# Columns combined with the TF-IDF description bigrams in the recommender notebook
+SCALED_COLUMNS = ['Battery Life', 'price_trans', 'Rating', 'Is Prime']
+# A product is rebuilt when any of these change
+FEATURE_COLUMNS = ['Description'] + SCALED_COLUMNS
+
+# -----------------------------------------
+# Features (same as notebooks/03_recommendations/01-recommender.ipynb)
+# -----------------------------------------
+@functools.lru_cache(maxsize=None)
+def stop_words():
+    try:
+        words = stopwords.words('english')
+    except LookupError:
+        nltk.download('stopwords')
+        words = stopwords.words('english')
+    return set(words) | {'headphone', 'headphones'}
+
+
+stemmer = nltk.stem.PorterStemmer()
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def my_tokenizer(sentence):
+    '''
+    Bespoke tokenizer from the recommender notebook: drops numbers, dashes, punctuation and stopwords then stems
+
+    Parameters
+    ---------
+    sentence: product description
+
+    Returns
+    -------
+    List of stemmed words
+    '''
+    # to remove numbers from reviews
+    sentence = re.sub('[0-9]', '', sentence)
+    sentence = re.sub(r'–|—', '', sentence)
+    # remove punctuation and set all to lower case
+    sentence = sentence.translate(PUNCTUATION).lower()
+
+    # Filtering out stopwords and any tokens that are just empty strings, then stem
+    eng_stop_words = stop_words()
+    return [stemmer.stem(word) for word in sentence.split(' ') if (word not in eng_stop_words) and (word != '')]
+
+
+class SimilarityFeatures:
+    '''
+    TF-IDF description bigrams (min_df=2) alongside min-max scaled numeric columns
+    '''
+    def __init__(self):
+        self.tfidf = TfidfVectorizer(tokenizer=my_tokenizer, token_pattern=None, ngram_range=(2, 2), min_df=2)
+        self.scaler = MinMaxScaler()
+
+    def fit_transform(self, df):
+        tfidf_matrix = self.tfidf.fit_transform(df['Description'])
+        scaled_features = self.scaler.fit_transform(df[SCALED_COLUMNS])
+        return sparse.hstack([tfidf_matrix, sparse.csr_matrix(scaled_features)]).tocsr()
+
+    def transform(self, df):
+        tfidf_matrix = self.tfidf.transform(df['Description'])
+        scaled_features = self.scaler.transform(df[SCALED_COLUMNS])
+        return sparse.hstack([tfidf_matrix, sparse.csr_matrix(scaled_features)]).tocsr()
+
+
+def row_hashes(df):
+    '''
+    64-bit hash of each product's feature columns, numbers hashed as float64 so dtype changes are ignored
+    '''
+    features = df[FEATURE_COLUMNS].astype({column: 'float64' for column in SCALED_COLUMNS})
+    return pd.util.hash_pandas_object(features, index=False).to_numpy()
+
+
+def _product_ids(df):
+    product_ids = df['Product ID'].to_numpy()
+    if df['Product ID'].duplicated().any():
+        raise ValueError('Product ID must be unique to build the similarity model incrementally.')
+    return product_ids
+
+
+def _normalise(features):
+    return SimilarityIndex.from_features(features).vectors
+
+# -----------------------------------------
+# Top-k helpers
+# -----------------------------------------
+def _top_k(cols, vals, top_k):
+    # Best top_k candidates per row, candidates padded with -inf are dropped
+    if vals.shape[1] > top_k:
+        best = np.argpartition(-vals, top_k - 1, axis=1)[:, :top_k]
+        cols, vals = np.take_along_axis(cols, best, axis=1), np.take_along_axis(vals, best, axis=1)
+    keep = np.isfinite(vals)
+    return np.nonzero(keep)[0], cols[keep], vals[keep]
+
+
+def _score_rows(vectors, positions, top_k, block_size):
+    # Exhaustive top-k for the given rows, block_size rows at a time
+    all_cols = np.arange(vectors.shape[0])
+    rows, cols, vals = [], [], []
+    for start in range(0, len(positions), block_size):
+        block_positions = positions[start:start + block_size]
+        block = (vectors[block_positions] @ vectors.T).toarray()
+        block_rows, block_cols, block_vals = _top_k(np.broadcast_to(all_cols, block.shape), block, top_k)
+        rows.append(block_positions[block_rows])
+        cols.append(block_cols)
+        vals.append(block_vals)
+    return rows, cols, vals
+
+
+def _padded_neighbours(neighbours, old_rows, new_positions):
+    # Old top-k lists as (rows, width) arrays with columns moved to their new positions, -1 where stale
+    indptr = neighbours.indptr
+    lengths = indptr[old_rows + 1] - indptr[old_rows]
+    width = max(int(lengths.max()) if len(lengths) else 0, 1)
+    cols = np.full((len(old_rows), width), -1, dtype=np.int64)
+    vals = np.full((len(old_rows), width), -np.inf, dtype=np.float32)
+    entry_rows = np.repeat(np.arange(len(old_rows)), lengths)
+    slots = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    entries = np.repeat(indptr[old_rows], lengths) + slots
+    cols[entry_rows, slots] = new_positions[neighbours.indices[entries]]
+    vals[entry_rows, slots] = neighbours.data[entries]
+    return cols, vals, lengths
+
+# -----------------------------------------
+# Build / update
+# -----------------------------------------
+def build(df, top_k=50, block_size=1024):
+    '''
+    Full build: fits the features and scores every product
+
+    Parameters
+    ---------
+    df: final_data catalogue
+    top_k: neighbours kept per product, None keeps the normalised vectors (exact index)
+    block_size: rows scored at once, bounds peak memory to block_size x N
+
+    Returns
+    -------
+    Tuple of (SimilarityIndex, state for the next update)
+    '''
+    product_ids = _product_ids(df)
+    features = SimilarityFeatures()
+    vectors = _normalise(features.fit_transform(df))
+
+    if top_k is None:
+        index = SimilarityIndex(vectors=vectors, product_ids=product_ids)
+    else:
+        index = SimilarityIndex.from_features(vectors, top_k=top_k, block_size=block_size)
+        index.product_ids = product_ids
+
+    state = {
+        'product_ids': product_ids,
+        'row_hashes': row_hashes(df),
+        'features': features,
+        'vectors': vectors,
+        'top_k': top_k
+    }
+    return index, state
+
+
+def update(index, state, df, block_size=1024, refit_fraction=0.3):
+    '''
+    Incremental build: only added/changed products are scored, removed products are dropped
+
+    Unchanged products keep their vectors, so their similarities to each other are unchanged. Their
+    top-k lists are merged with the scores against added/changed products, unless a neighbour was
+    removed or changed, in which case the row is rescored in full. The result matches a full top-k
+    build with the same fitted features.
+
+    Parameters
+    ---------
+    index: SimilarityIndex of the previous build
+    state: state of the previous build
+    df: new final_data catalogue
+    block_size: rows scored at once
+    refit_fraction: share of added + changed + removed products above which the features are refitted
+
+    Returns
+    -------
+    Tuple of (SimilarityIndex, state, summary dictionary of counts and the build mode)
+    '''
+    product_ids = _product_ids(df)
+    hashes = row_hashes(df)
+    n_products, n_old = len(product_ids), len(state['product_ids'])
+
+    old_rows = pd.Index(state['product_ids']).get_indexer(product_ids)
+    found = old_rows >= 0
+    unchanged = found.copy()
+    unchanged[found] = state['row_hashes'][old_rows[found]] == hashes[found]
+    dirty = np.flatnonzero(~unchanged)
+
+    summary = {
+        'added': int((~found).sum()),
+        'changed': int((found & ~unchanged).sum()),
+        'removed': int(n_old - found.sum()),
+        'unchanged': int(unchanged.sum())
+    }
+    if len(dirty) + summary['removed'] > refit_fraction * max(n_products, 1):
+        index, state = build(df, state['top_k'], block_size)
+        return index, state, dict(summary, mode='rebuild')
+
+    # New vectors: unchanged rows are reused, dirty rows transformed with the fitted features
+    if len(dirty):
+        dirty_vectors = _normalise(state['features'].transform(df.iloc[dirty]))
+    else:
+        dirty_vectors = state['vectors'][:0]
+    take = np.empty(n_products, dtype=np.int64)
+    take[unchanged] = old_rows[unchanged]
+    take[dirty] = n_old + np.arange(len(dirty))
+    vectors = sparse.vstack([state['vectors'], dirty_vectors]).tocsr()[take]
+
+    new_state = dict(state, product_ids=product_ids, row_hashes=hashes, vectors=vectors)
+    if state['top_k'] is None:
+        return SimilarityIndex(vectors=vectors, product_ids=product_ids), new_state, dict(summary, mode='incremental')
+
+    top_k = min(state['top_k'], n_products)
+    # Where each old row now lives, -1 when removed or changed (its old scores are stale)
+    new_positions = np.full(n_old, -1, dtype=np.int64)
+    new_positions[old_rows[unchanged]] = np.flatnonzero(unchanged)
+
+    kept = np.flatnonzero(unchanged)
+    rescore = [dirty]
+    rows, cols, vals = [], [], []
+    dirty_matrix = vectors[dirty]
+    for start in range(0, len(kept), block_size):
+        block_positions = kept[start:start + block_size]
+        old_cols, old_vals, lengths = _padded_neighbours(index.neighbours, old_rows[block_positions], new_positions)
+
+        # A stale neighbour means the row's true top k may include products outside its old list
+        stale = ((old_cols < 0) & (np.arange(old_cols.shape[1]) < lengths[:, None])).any(axis=1)
+        rescore.append(block_positions[stale])
+        fresh = ~stale
+        block_positions, old_cols, old_vals = block_positions[fresh], old_cols[fresh], old_vals[fresh]
+
+        dirty_vals = (vectors[block_positions] @ dirty_matrix.T).toarray().astype(np.float32)
+        candidate_cols = np.hstack([old_cols, np.broadcast_to(dirty, dirty_vals.shape)])
+        candidate_vals = np.hstack([old_vals, dirty_vals])
+        block_rows, block_cols, block_vals = _top_k(candidate_cols, candidate_vals, top_k)
+        rows.append(block_positions[block_rows])
+        cols.append(block_cols)
+        vals.append(block_vals)
+
+    rescore = np.concatenate(rescore)
+    rescored_rows, rescored_cols, rescored_vals = _score_rows(vectors, rescore, top_k, block_size)
+    neighbours = sparse.csr_matrix(
+        (np.concatenate(vals + rescored_vals), (np.concatenate(rows + rescored_rows), np.concatenate(cols + rescored_cols))),
+        shape=(n_products, n_products), dtype=np.float32)
+
+    summary['rescored'] = int(len(rescore))
+    return SimilarityIndex(neighbours=neighbours, product_ids=product_ids), new_state, dict(summary, mode='incremental')
+
+# -----------------------------------------
+# Versioned artifacts
+# -----------------------------------------
+def _versions(root):
+    return sorted(name for name in os.listdir(root) if re.fullmatch(r'v\d+', name)) if os.path.isdir(root) else []
+
+
+def load_published(model_dir):
+    '''
+    Loads the build CURRENT points to
+
+    Returns
+    -------
+    Tuple of (SimilarityIndex, state), or (None, None) if nothing has been published yet
+    '''
+    pointer_path = os.path.join(model_dir, 'similarity', 'CURRENT')
+    if not os.path.exists(pointer_path):
+        return None, None
+    with open(pointer_path) as f:
+        version_dir = os.path.join(model_dir, 'similarity', f.read().strip())
+    return (SimilarityIndex.load(os.path.join(version_dir, 'similarity_index.joblib')),
+            joblib.load(os.path.join(version_dir, 'state.joblib')))
+
+
+def publish(index, state, model_dir, keep=3):
+    '''
+    Writes a build to a new version folder then atomically points CURRENT at it
+
+    Parameters
+    ---------
+    index: SimilarityIndex to publish
+    state: builder state saved with it
+    model_dir: model folder, versions live in <model_dir>/similarity
+    keep: number of versions kept on disk (older ones are deleted, the app only reads CURRENT)
+
+    Returns
+    -------
+    Name of the published version
+    '''
+    root = os.path.join(model_dir, 'similarity')
+    os.makedirs(root, exist_ok=True)
+    versions = _versions(root)
+    version = f'v{int(versions[-1][1:]) + 1 if versions else 1:05d}'
+
+    # Written under a temporary name so a crash never leaves a half-written version behind
+    tmp_dir = os.path.join(root, version + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    index.save(os.path.join(tmp_dir, 'similarity_index.joblib'))
+    joblib.dump(state, os.path.join(tmp_dir, 'state.joblib'))
+    os.rename(tmp_dir, os.path.join(root, version))
+
+    pointer_tmp = os.path.join(root, 'CURRENT.tmp')
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(root, 'CURRENT'))
+
+    for old_version in _versions(root)[:-keep]:
+        shutil.rmtree(os.path.join(root, old_version), ignore_errors=True)
+    return version
+
+
+def build_or_update(df, model_dir, top_k=50, block_size=1024, refit_fraction=0.3):
+    '''
+    Updates the published build with a new catalogue (or builds from scratch) and publishes the result
+
+    Returns
+    -------
+    Summary dictionary including the published version
+    '''
+    index, state = load_published(model_dir)
+    if index is None or state['top_k'] != top_k:
+        index, state = build(df, top_k, block_size)
+        summary = {'added': len(df), 'changed': 0, 'removed': 0, 'unchanged': 0, 'mode': 'rebuild'}
+    else:
+        index, state, summary = update(index, state, df, block_size, refit_fraction)
+
+    summary['version'] = publish(index, state, model_dir)
+    return summary
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    model_dir = '../model'
+    top_k = 50
+
+    # Run function
+    df = read_stage('final_data')
+    print(build_or_update(df, model_dir, top_k))
@@ -0,0 +1,210 @@
+# -----------------------------------------
+# Stage Storage
+# -----------------------------------------
+# Typed, columnar hand-off between pipeline stages (post_scrape -> post_cleaning -> final_df).
+#
+# Each stage is written as <data_dir>/<name>.parquet with compact dtypes:
+#   - 0/1 flags (Is Prime, Wireless, ..., Colour_*) as uint8
+#   - Price/Rating as float32, rounded back to float64 on read so filters on e.g. 4.1 stay exact
+#   - Colour as categorical, Battery Life as int16
+# Readers fall back to <name>.csv so CSVs downloaded from the Google Drive link still work.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import app_modules
+from stage_schema import precision_metadata, restore_precision
+
+FLAG_COLUMNS = ['Is Prime', 'Wireless', 'Noise Cancelling', 'Microphone', 'Over Ear', 'Gaming', 'Foldable']
+# float32 columns and the decimals they are stored with, used to restore exact float64 values on read
+FLOAT32_DECIMALS = {'Price': 2, 'Rating': 1}
+FLOAT32_COLUMNS = ['price_trans']
+
+# -----------------------------------------
+# Helper functions
+# -----------------------------------------
+def compact_dtypes(df):
+    '''
+    Converts known columns to compact dtypes, columns that do not fit (e.g. unparsed strings) are left as they are
+
+    Parameters
+    ---------
+    df: stage dataframe
+
+    Returns
+    -------
+    New dataframe with compact dtypes
+    '''
+    df = df.copy()
+    for column in df.columns:
+        if column in FLAG_COLUMNS or column.startswith('Colour_'):
+            values = pd.to_numeric(df[column], errors='coerce')
+            if values.isin([0, 1]).all():
+                df[column] = values.astype(np.uint8)
+        elif column == 'Colour':
+            df[column] = df[column].astype('category')
+        elif column == 'Battery Life' and pd.api.types.is_integer_dtype(df[column]):
+            if df[column].between(np.iinfo(np.int16).min, np.iinfo(np.int16).max).all():
+                df[column] = df[column].astype(np.int16)
+        elif column in FLOAT32_DECIMALS or column in FLOAT32_COLUMNS:
+            if pd.api.types.is_float_dtype(df[column]):
+                df[column] = df[column].astype(np.float32)
+    return df
+
+
+def _to_table(df, preserve_index=None):
+    # preserve_index=None keeps a RangeIndex as metadata only and any other index as a column
+    table = pa.Table.from_pandas(compact_dtypes(df), preserve_index=preserve_index)
+    decimals = {column: d for column, d in FLOAT32_DECIMALS.items()
+                if column in df.columns and table.schema.field(column).type == pa.float32()}
+    # Read back by stage_schema.restore_precision, in read_stage/iter_stage and the app's catalogue loader
+    metadata = {**(table.schema.metadata or {}), **precision_metadata(decimals)}
+    return table.replace_schema_metadata(metadata)
+
+# -----------------------------------------
+# Read / write
+# -----------------------------------------
+def stage_path(name, data_dir, extension='.parquet'):
+    return os.path.join(data_dir, name + extension)
+
+
+def write_stage(df, name, data_dir='../data'):
+    '''
+    Writes a stage as Parquet with compact dtypes
+
+    Parameters
+    ---------
+    df: stage dataframe, its index is stored and restored on read
+    name: stage name, e.g. 'post_cleaning'
+    data_dir: data folder
+    '''
+    pq.write_table(_to_table(df), stage_path(name, data_dir))
+
+
+def read_stage(name, data_dir='../data', columns=None, restore=True):
+    '''
+    Reads a stage, only loading the requested columns
+
+    Parameters
+    ---------
+    name: stage name, e.g. 'post_cleaning'
+    data_dir: data folder
+    columns: optional list of columns to load (column projection)
+    restore: round float32 columns back to their exact float64 values
+
+    Returns
+    -------
+    Dataframe, from <name>.parquet if present otherwise <name>.csv
+    '''
+    path = stage_path(name, data_dir)
+    if not os.path.exists(path):
+        df = pd.read_csv(stage_path(name, data_dir, '.csv'), index_col=0)
+        return df[columns] if columns is not None else df
+
+    table = pq.read_table(path, columns=columns)
+    df = table.to_pandas()
+    return restore_precision(df, table.schema) if restore else df
+
+
+def iter_stage(name, data_dir='../data', chunk_size=50000):
+    '''
+    Reads a stage in chunks of chunk_size rows, numbered with a continuous 0..n-1 index
+
+    Yields
+    -------
+    Dataframe chunks in file order
+    '''
+    path = stage_path(name, data_dir)
+    if not os.path.exists(path):
+        yield from pd.read_csv(stage_path(name, data_dir, '.csv'), index_col=0, chunksize=chunk_size)
+        return
+
+    parquet_file = pq.ParquetFile(path)
+    start = 0
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        chunk = batch.to_pandas(ignore_metadata=True)
+        chunk = chunk.drop(columns=[column for column in chunk.columns if column.startswith('__index_level_')])
+        chunk = restore_precision(chunk, parquet_file.schema_arrow)
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+class StageWriter:
+    '''
+    Writes a stage chunk by chunk, every chunk is cast to the schema of the first one.
+    The index is not stored, the stage is read back with a continuous 0..n-1 index.
+
+    Parameters
+    ---------
+    name: stage name
+    data_dir: data folder
+    '''
+    def __init__(self, name, data_dir='../data'):
+        self.path = stage_path(name, data_dir)
+        self.writer = None
+
+    def write(self, df):
+        table = _to_table(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def compare_with_csv(name, data_dir='../data', columns=None):
+    '''
+    Compares load time and in-memory size of a stage's CSV and Parquet copies
+
+    Returns
+    -------
+    Dictionary with seconds and bytes (memory_usage(deep=True)) for each format
+    '''
+    start = time.perf_counter()
+    csv_df = pd.read_csv(stage_path(name, data_dir, '.csv'), index_col=0)
+    if columns is not None:
+        csv_df = csv_df[columns]
+    csv_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parquet_df = read_stage(name, data_dir, columns=columns, restore=False)
+    parquet_time = time.perf_counter() - start
+
+    return {
+        'csv_seconds': csv_time,
+        'parquet_seconds': parquet_time,
+        'csv_bytes': int(csv_df.memory_usage(deep=True).sum()),
+        'parquet_bytes': int(parquet_df.memory_usage(deep=True).sum())
+    }
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    data_dir = '../data'
+    stages = ['post_scrape', 'post_cleaning', 'final_df', 'final_data']
+
+    # Convert CSVs from earlier runs (or the Google Drive link) and compare them with the Parquet copies
+    for name in stages:
+        if not os.path.exists(stage_path(name, data_dir, '.csv')):
+            continue
+        write_stage(pd.read_csv(stage_path(name, data_dir, '.csv'), index_col=0), name, data_dir)
+        result = compare_with_csv(name, data_dir)
+        print(f"{name}: load {result['csv_seconds']:.3f}s -> {result['parquet_seconds']:.3f}s, "
+              f"memory {result['csv_bytes'] / 1e6:.1f}MB -> {result['parquet_bytes'] / 1e6:.1f}MB")
@@ -0,0 +1,74 @@
+# -----------------------------------------
+# Stub Search Server
+# -----------------------------------------
+# Serves saved Amazon search result pages locally so the scraper can be run
+# end to end without touching the network.
+#
+# Pages are read from <pages_dir>/page_<n>.html and served for any URL ending in page=<n>.
+
+# -----------------------------------------
+# Imports
+# -----------------------------------------
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def start_stub_server(pages_dir, port=0, fail_first=0):
+    '''
+    Starts a threaded HTTP server in the background
+
+    Parameters
+    ---------
+    pages_dir: folder of saved pages named page_<n>.html
+    port: port to listen on, 0 picks a free one
+    fail_first: number of 503 responses returned for each page before it is served (to exercise retries)
+
+    Returns
+    -------
+    Tuple of (server, base_url), the page number is appended to base_url like the real search URL.
+    Call server.shutdown() when done.
+    '''
+    attempts = Counter()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = parse_qs(urlparse(self.path).query).get('page', ['1'])[0]
+            with lock:
+                attempts[page] += 1
+                failing = attempts[page] <= fail_first
+
+            path = os.path.join(pages_dir, f'page_{page}.html')
+            if failing or not os.path.exists(path):
+                self.send_response(503 if failing else 404)
+                self.end_headers()
+                return
+
+            with open(path, 'rb') as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/s?keywords=adult+headphones&i=electronics&page='
+    return server, base_url
+
+
+if __name__ == "__main__":
+    # Defining params to pass in
+    pages_dir = '../tests/fixtures/saved_pages'
+    port = 8000
+
+    server, base_url = start_stub_server(pages_dir, port)
+    print(f"Serving {pages_dir} at {base_url}<n>")
+    threading.Event().wait()
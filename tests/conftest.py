@@ -0,0 +1,7 @@
+import os
+import sys
+
+# scripts/ and app/ are run as folders of flat modules, the tests import them the same way
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in ('scripts', 'app'):
+    sys.path.insert(0, os.path.join(ROOT, folder))
@@ -0,0 +1,39 @@
+import importlib
+import random
+import pytest
+
+feature_extraction = importlib.import_module('03-feature-extraction')
+
+
+def reference_features(description):
+    # The per-field functions the single-pass scan replaces
+    flags = [feature_extraction.search_description(description, regexp)
+             for regexp in feature_extraction.BINARY_FEATURES.values()]
+    return flags, feature_extraction.get_colour(description), feature_extraction.get_battery_life(description)
+
+
+@pytest.mark.parametrize('description', [
+    '2 hotpink headphones',
+    '30 honeydew over-ear',
+    '40hwireless red',
+    '12 hours black 20h white',
+    '5 hrs noise cancelling gold mic',
+    '0 h blue 7 batteries',
+    'navy 10 100h overhead',
+    'foldable gaming 3 hgreen 6h green',
+    '',
+])
+def test_scan_matches_reference(description):
+    assert feature_extraction.scan_description(description) == reference_features(description)
+
+
+def test_scan_matches_reference_on_random_descriptions():
+    # Words chosen to hit every pattern, units running into the next word and colours starting with 'h'
+    words = ['wireless', 'noise', 'cancelling', 'noise-cancelling', 'mic', 'microphone', 'over', 'ear', 'over-ear',
+             'overhead', 'gaming', 'foldable', 'hotpink', 'honeydew', 'red', 'tan', 'black', 'h', 'hr', 'hours',
+             'battery', 'batteries', '0', '2', '15', '40h', '8hrs', 'headphones', '-', ',']
+    rng = random.Random(0)
+    for _ in range(5000):
+        # Words are sometimes run together, e.g. '40h' + 'honeydew'
+        description = ''.join(rng.choice(words) + rng.choice([' ', ' ', '']) for _ in range(rng.randint(0, 10)))
+        assert feature_extraction.scan_description(description) == reference_features(description), description
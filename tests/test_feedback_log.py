@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from feedback_log import FeedbackLog, compact
+
+
+def test_idle_log_closes_segment_after_segment_seconds(tmp_path):
+    log = FeedbackLog(str(tmp_path), flush_interval=0.01, segment_seconds=0.2)
+    log.record('B000000001', 'like')
+    log.flush()
+    assert [name.endswith('.jsonl.open') for name in os.listdir(tmp_path)] == [True]
+
+    # No further events, the writer thread still rotates the segment
+    deadline = time.time() + 5
+    while any(name.endswith('.open') for name in os.listdir(tmp_path)) and time.time() < deadline:
+        time.sleep(0.05)
+    assert [name.endswith('.jsonl') for name in os.listdir(tmp_path)] == [True]
+
+
+def write_segment(path, events):
+    with open(path, 'w') as f:
+        f.write(''.join(json.dumps(event) + '\n' for event in events))
+
+
+def test_compact_only_takes_over_segments_of_exited_processes(tmp_path):
+    log_dir, output_path = tmp_path / 'feedback', str(tmp_path / 'feedback_aggregates.parquet')
+    log_dir.mkdir()
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    events = [{'ts': time.time(), 'product_id': 'B000000001', 'event': event} for event in ('impression', 'like')]
+
+    # Left open by a killed process, and two of this (live) process, however old, which are left alone
+    for pid, started_ns in [(int(exited.stdout), time.time_ns()), (os.getpid(), time.time_ns()),
+                            (os.getpid(), time.time_ns() - 2 * 3600 * 10 ** 9)]:
+        write_segment(log_dir / f'events-{pid}-{started_ns}.jsonl.open', events)
+
+    aggregates = compact(str(log_dir), output_path)
+    assert aggregates.loc['B000000001', ['impressions', 'likes']].tolist() == [1, 1]
+    assert [name.startswith(f'events-{os.getpid()}-') and name.endswith('.open')
+            for name in os.listdir(log_dir)] == [True, True]
+
+
+def test_compact_stopped_before_deleting_segments_does_not_count_them_twice(tmp_path, monkeypatch):
+    log_dir, output_path = tmp_path / 'feedback', str(tmp_path / 'feedback_aggregates.parquet')
+    log_dir.mkdir()
+    write_segment(log_dir / 'events-1-1.jsonl', [{'ts': 1.0, 'product_id': 'B000000001', 'event': 'like'}])
+
+    # Killed right after publishing the aggregates
+    def killed(path):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(os, 'remove', killed)
+    try:
+        compact(str(log_dir), output_path)
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.undo()
+    assert os.listdir(log_dir) == ['events-1-1.jsonl']
+
+    write_segment(log_dir / 'events-1-2.jsonl', [{'ts': 2.0, 'product_id': 'B000000001', 'event': 'like'}])
+    aggregates = compact(str(log_dir), output_path)
+    assert aggregates.loc['B000000001', 'likes'] == 2
+    assert os.listdir(log_dir) == []
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from ann_index import LSHIndex
+from similarity_index import SimilarityIndex
+from hybrid_recommender import RecommenderEngine
+
+
+def test_batch_with_approximate_backend_scores_filtered_profiles_exactly():
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((400, 16))
+    df = pd.DataFrame({'Product ID': [f'P{i}' for i in range(400)], 'Rating': rng.uniform(1, 5, 400)})
+    # About 20 matches per profile, fewer than min_candidates, and one profile matching nothing
+    masks = rng.random((6, 400)) < 0.05
+    masks[0] = False
+
+    exact = RecommenderEngine(df, SimilarityIndex.from_features(features)).top_k_batch(None, masks, k=5)
+    approximate = RecommenderEngine(df, LSHIndex.from_features(features, min_candidates=50)).top_k_batch(None, masks, k=5)
+    np.testing.assert_array_equal(approximate[0], exact[0])
+    np.testing.assert_allclose(approximate[1], exact[1], rtol=1e-5)
@@ -0,0 +1,11 @@
+import instrumentation
+
+
+def test_label_values_are_escaped_in_prometheus_text():
+    instrumentation.enable()
+    with instrumentation.span('load', artifact='odd "name"\\\n.parquet'):
+        pass
+    text = instrumentation.prometheus_text()
+    assert 'artifact="odd \\"name\\"\\\\\\n.parquet"' in text
+    # One sample per line, no raw newline inside a label value
+    assert all(line.startswith(('#', 'sound_decisions_')) for line in text.splitlines() if line)
@@ -0,0 +1,49 @@
+import contextlib
+import importlib
+import io
+import pandas as pd
+from near_duplicates import drop_near_duplicates
+from stage_store import write_stage, read_stage
+
+DESCRIPTION = 'Sony WH-CH520 Wireless Bluetooth Over Ear Headphones with Mic, up to 50 Hours Battery Life, {}'
+
+
+def listings(descriptions):
+    return pd.DataFrame({
+        'Product ID': [f'B{i:09d}' for i in range(len(descriptions))],
+        'Description': descriptions,
+        'Price': [f'{20 + i}.99' for i in range(len(descriptions))],
+        'Rating': ['4.5 out of 5 stars'] * len(descriptions),
+        'Is Prime': ['1'] * len(descriptions)
+    })
+
+
+def test_colour_variants_are_grouped_but_placeholders_are_not():
+    df = listings([DESCRIPTION.format('Black'), 'N/A', DESCRIPTION.format('White'), '', 'n/a', '--'])
+    deduplicated, canonical = drop_near_duplicates(df)
+    assert deduplicated['Product ID'].tolist() == ['B000000000', 'B000000001', 'B000000003', 'B000000004',
+                                                   'B000000005']
+    assert canonical.set_index('Product ID')['Canonical ID']['B000000002'] == 'B000000000'
+
+
+def test_pipeline_drops_near_duplicates_across_chunks(tmp_path):
+    run_pipeline = importlib.import_module('run-pipeline').run_pipeline
+    data_cleaning = importlib.import_module('02-data-cleaning')
+    feature_extraction = importlib.import_module('03-feature-extraction')
+
+    # Each colour variant lands in a later chunk than its first listing
+    descriptions = [DESCRIPTION.format(colour) for colour in ['Black', 'Blue', 'Red']]
+    descriptions += [f'Gaming headset model {i} with surround sound and RGB lights' for i in range(9)] + ['N/A'] * 3
+    write_stage(listings(descriptions), 'post_scrape', str(tmp_path))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = data_cleaning.clean_data(read_stage('post_scrape', str(tmp_path)),
+                                            canonical_path=str(tmp_path / 'expected_canonical.csv'))
+        expected = feature_extraction.clean_features(feature_extraction.extract_features(expected))
+        n_rows = run_pipeline('post_scrape', 'final_df', str(tmp_path), chunk_size=2, max_workers=2,
+                              canonical_path=str(tmp_path / 'canonical.csv'))
+
+    assert n_rows == len(expected) == len(descriptions) - 2
+    pd.testing.assert_frame_equal(read_stage('final_df', str(tmp_path)), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'canonical.csv'),
+                                  pd.read_csv(tmp_path / 'expected_canonical.csv'))
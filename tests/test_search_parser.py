@@ -0,0 +1,55 @@
+import glob
+import importlib
+import os
+import pandas as pd
+import pytest
+from bs4 import BeautifulSoup
+import search_parser
+from stub_server import start_stub_server
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'saved_pages')
+
+
+def read_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(PAGES_DIR, 'page_*.html'))):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+
+@pytest.mark.parametrize('parser', ['strainer', 'lxml'])
+def test_backend_matches_reference(parser):
+    if parser == 'lxml' and search_parser.lxml is None:
+        pytest.skip('lxml not installed')
+    assert search_parser.check_parity(read_pages(), parser) == []
+
+
+@pytest.mark.parametrize('classes', [['a-price-whole', 'a-icon-alt'], ['a-icon-alt', 'a-size-base'],
+                                     ['aok-relative', 's-icon-text-medium', 's-prime', 'a-spacing-micro']])
+def test_match_fields_agrees_with_beautifulsoup(classes):
+    class_attribute = ' '.join(classes)
+    soup = BeautifulSoup(f'<span class="{class_attribute}">x</span>', 'html.parser')
+    expected = [field for field in search_parser.FIELD_CLASSES if soup.find('span', class_=field) is not None]
+    assert search_parser.match_fields(classes) == expected
+
+
+def test_saved_pages_pass_data_cleaning():
+    cleaning = importlib.import_module('02-data-cleaning')
+    df = pd.DataFrame([product for content in read_pages() for product in search_parser.parse_bs4(content)])
+    cleaned = cleaning.clean_data(df, near_duplicate_threshold=None, check=False)
+    assert cleaned['Price'].tolist() == [39.99, 12.49, 1299.0, 34.0, 24.99, 249.99]
+
+
+def test_scrape_through_stub_server_matches_reference():
+    scraper = importlib.import_module('01-web-scraping')
+    pages = read_pages()
+    # Every page fails once first, so the retry path is exercised too
+    server, base_url = start_stub_server(PAGES_DIR, fail_first=1)
+    try:
+        scraped = scraper.scrape_headphone_data(base_url, len(pages), max_workers=2, requests_per_second=1000,
+                                                burst=10, backoff=0.01)
+    finally:
+        server.shutdown()
+    expected = [product for content in pages for product in search_parser.parse_bs4(content)]
+    assert scraped.to_dict('records') == expected